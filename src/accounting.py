@@ -0,0 +1,240 @@
+"""Storage accounting aware of Artifactory's checksum based storage
+
+Artifactory stores a binary once no matter how many paths point at it, so
+summing file sizes (logical bytes) overstates the storage actually used
+(physical bytes). The physical size is computed by counting every checksum
+once, either exactly or with a memory bounded sketch.
+"""
+import heapq
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union, TYPE_CHECKING
+
+from . import aql
+from . import memory
+from . import tools
+
+if TYPE_CHECKING:
+    from . import resource
+
+logger = logging.getLogger(__name__)
+
+
+class ChecksumSet():
+    """Exact set of checksums, stored as 20 byte digests, spilling to disk
+    inside a memory.MemoryBudget"""
+
+    def __init__(self):
+        self.checksums = memory.spillable_set()
+        self.bytes = 0
+
+    def add(self, sha1: str, size: int) -> bool:
+        """Record a binary, returns True the first time a checksum is seen"""
+        digest = bytes.fromhex(sha1)
+        if digest in self.checksums:
+            return False
+
+        self.checksums.add(digest)
+        self.bytes += size
+
+        return True
+
+    @property
+    def distinct(self) -> int:
+        """Number of distinct checksums"""
+        return len(self.checksums)
+
+
+class ChecksumSketch():
+    """Approximate distinct count and bytes in a fixed amount of memory
+
+    A k minimum values sketch: only the k smallest checksum hashes are kept
+    along with their sizes. As sha1 digests are uniformly distributed the kth
+    smallest value estimates the number of distinct checksums, and the sizes of
+    the sample estimate their average size. The relative error is roughly
+    1 / sqrt(k).
+    """
+    space = 2 ** 64
+
+    def __init__(self, size: int = 4096):
+        self.size = size
+        self.heap: List[int] = []
+        self.sample: Dict[int, int] = {}
+
+    def add(self, sha1: str, size: int) -> bool:
+        """Record a binary, returns True when the checksum entered the sample"""
+        value = int(sha1[:16], 16)
+        if value in self.sample:
+            return False
+
+        if len(self.heap) < self.size:
+            heapq.heappush(self.heap, -value)
+        elif value < -self.heap[0]:
+            del self.sample[-heapq.heapreplace(self.heap, -value)]
+        else:
+            return False
+
+        self.sample[value] = size
+
+        return True
+
+    @property
+    def distinct(self) -> int:
+        """Estimated number of distinct checksums"""
+        if len(self.heap) < self.size:
+            return len(self.heap)
+
+        return int((self.size - 1) * self.space / -self.heap[0])
+
+    @property
+    def bytes(self) -> int:
+        """Estimated bytes of distinct checksums"""
+        if not self.sample:
+            return 0
+
+        if len(self.heap) < self.size:
+            return sum(self.sample.values())
+
+        return int(self.distinct * sum(self.sample.values()) / len(self.sample))
+
+
+@dataclass
+class Account():
+    """Logical and physical usage of a repository or of the whole estate"""
+    files: int = 0
+    logical_bytes: int = 0
+    checksums: Union[ChecksumSet, ChecksumSketch] = field(default_factory=ChecksumSet, repr=False)
+
+    def add(self, sha1: str, size: int):
+        """Count one file"""
+        self.files += 1
+        self.logical_bytes += size
+        self.checksums.add(sha1, size)
+
+    @property
+    def physical_bytes(self) -> int:
+        """Bytes stored once per checksum"""
+        return self.checksums.bytes
+
+    @property
+    def duplicated_bytes(self) -> int:
+        """Bytes counted more than once in logical_bytes"""
+        return self.logical_bytes - self.physical_bytes
+
+
+@dataclass
+class Report():
+    """Accounting of every repository plus the estate wide total
+
+    Physical bytes of the total are smaller than the sum of the repositories
+    as binaries shared between repositories are only stored once.
+    """
+    repositories: Dict[str, Account]
+    total: Account
+
+
+def account(
+        connection: 'tools.Connection', repos: Optional[List[str]] = None,
+        approximate: bool = False, sketch_size: int = 4096) -> Report:
+    """Stream checksum and size of every file and account logical and physical bytes
+
+    Args:
+        connection (tools.Connection): connection to Artifactory
+        repos (List[str], optional): repositories to account. Defaults to all.
+        approximate (bool, optional): use fixed size sketches instead of exact
+            checksum sets, for estates with hundreds of millions of files. Defaults to False.
+        sketch_size (int, optional): checksums kept per sketch. Defaults to 4096.
+
+    Returns:
+        Report: per repository and total accounting
+    """
+    def new_account():
+        if approximate:
+            return Account(checksums=ChecksumSketch(sketch_size))
+        return Account()
+
+    query = {"type": "file"}
+    if repos:
+        query["$or"] = [{"repo": repo} for repo in repos]
+
+    cursor = aql.FileCursor(connection).find(query).include(['repo', 'size', 'actual_sha1'])
+
+    report = Report({}, new_account())
+    for row in cursor.rows():
+        repository = report.repositories.get(row['repo'])
+        if repository is None:
+            repository = report.repositories[row['repo']] = new_account()
+
+        repository.add(row['actual_sha1'], row['size'])
+        report.total.add(row['actual_sha1'], row['size'])
+
+    logger.info(
+        "accounted %s files, %s logical bytes, %s physical bytes",
+        report.total.files, report.total.logical_bytes, report.total.physical_bytes)
+
+    return report
+
+
+def _checksum(item: Union[dict, 'resource.File']) -> Tuple[str, int]:
+    if isinstance(item, dict):
+        return item['actual_sha1'], int(item['size'])
+
+    return item.actual_sha1, int(item.size)
+
+
+def _checksum_chunks(counts: Iterable[Tuple[bytes, Tuple[int, int]]], chunk_size: int) -> Iterator[list]:
+    """Group (digest, (count, size)) entries into lists of chunk_size"""
+    chunk = []
+    for entry in counts:
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def freed_bytes(
+        connection: 'tools.Connection', candidates: Iterable[Union[dict, 'resource.File']],
+        chunk_size: int = 200, max_workers: int = 8) -> int:
+    """Bytes Artifactory would really free by deleting every candidate
+
+    A binary is only freed when every path referencing its checksum, in any
+    repository, is part of the candidates. Candidates are counted per checksum
+    in a memory.spillable_dict(), which moves to disk inside a
+    memory.MemoryBudget, and the references are looked up chunk by chunk on a
+    thread pool.
+
+    Args:
+        connection (tools.Connection): connection to Artifactory
+        candidates (Iterable[Union[dict, resource.File]]): AQL rows or files
+            whose query included actual_sha1 and size
+        chunk_size (int, optional): checksums looked up per AQL query. Defaults to 200.
+        max_workers (int, optional): concurrent AQL queries. Defaults to 8.
+
+    Returns:
+        int: bytes released from the filestore
+    """
+    counts = memory.spillable_dict()
+    for candidate in candidates:
+        sha1, size = _checksum(candidate)
+        digest = bytes.fromhex(sha1)
+        count, _ = counts.get(digest, (0, size))
+        counts[digest] = (count + 1, size)
+
+    def lookup(chunk):
+        query = {"$or": [{"actual_sha1": digest.hex()} for digest, _ in chunk]}
+        cursor = aql.FileCursor(connection).find(query).include(['actual_sha1'])
+        return Counter(row['actual_sha1'] for row in cursor.rows())
+
+    freed = 0
+    for chunk, references, error in tools.bounded_map(
+            lookup, _checksum_chunks(counts.items(), chunk_size), max_workers):
+        if error:
+            raise error
+
+        freed += sum(size for digest, (count, size) in chunk if references[digest.hex()] <= count)
+
+    return freed
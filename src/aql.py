@@ -1,21 +1,98 @@
 """Python representation of aql query language"""
+import copy
 import logging
 import json
-from typing import List, TYPE_CHECKING, Optional
+import queue
+import threading
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Optional, Union
 
+from requests import exceptions
+
+from . import memory
+from . import operation
 from . import resource
+from . import tools
+
+
+# File attribute names mapped to the AQL fields to include for them
+FIELD_ALIASES = {
+    'sha1': 'actual_sha1',
+    'md5': 'actual_md5',
+    'createdBy': 'created_by',
+    'modifiedBy': 'modified_by',
+    'lastModified': 'modified',
+    'lastUpdated': 'updated',
+    'downloaded': 'stat.downloaded',
+    'lastDownloaded': 'stat.downloaded',
+    'downloads': 'stat.downloads',
+    'downloadCount': 'stat.downloads',
+    'lastDownloadedBy': 'stat.downloaded_by',
+    'properties': 'property.*'}
+
+# values of stat fields for items never downloaded, AQL returns no stats for them
+STAT_DEFAULTS = {'downloaded': None, 'downloads': 0, 'downloaded_by': None}
+
+
+def _aliased(row: dict, include_fields: Optional[List[str]] = None) -> dict:
+    """File attributes of FIELD_ALIASES read from the AQL fields of a result row
+
+    Stat fields are read from the nested stats of the row, with the values
+    of a file never downloaded when they were included but are missing.
+    lastDownloaded is in milliseconds since the epoch like the file statistics API.
+    """
+    stats = (row.get('stats') or [{}])[0]
+    attributes = {}
+
+    for attribute, field in FIELD_ALIASES.items():
+        if field.startswith('stat.'):
+            stat = field[len('stat.'):]
+            if stat in stats:
+                attributes[attribute] = stats[stat]
+            elif field in (include_fields or []):
+                attributes[attribute] = STAT_DEFAULTS[stat]
+        elif field in row and field != attribute:
+            attributes[attribute] = row[field]
 
-if TYPE_CHECKING:
-    from . import tools
+    if 'lastDownloaded' in attributes:
+        downloaded = attributes['lastDownloaded']
+        attributes['lastDownloaded'] = (
+            int(tools.parse_timestamp(downloaded).timestamp() * 1000) if downloaded else 0)
+
+    return attributes
 
 
 class FileCursor():
-    """Cursor for aql file queries. Split out so we can support .include().sort() etc"""
+    """Cursor for aql file queries built with find().include().sort().offset().limit()
+
+    The query is compiled lazily and the find/include/sort part is kept between
+    executions, so paging with page() or offset()/limit() does not serialise
+    the criteria again.
+
+    Iterating checks the current operation.OperationContext but leaves the
+    counting of items to the operation consuming the files, only rows()
+    counts them itself.
+    """
     logger = logging.getLogger(__name__)
+    required_fields = ('repo', 'path', 'name')
+    # fields Artifactory returns for items when the query has no include
+    default_fields = (
+        'repo', 'path', 'name', 'type', 'size', 'created', 'created_by',
+        'modified', 'modified_by', 'updated')
 
     def __init__(self, connection: 'tools.Connection'):
         self.connection = connection
-        self.query: Optional[str] = None
+        self.domain = 'items'
+        self.criteria: Optional[dict] = None
+        self.include_fields: Optional[List[str]] = None
+        self.sort_order: Optional[dict] = None
+        self.row_offset = 0
+        self.row_limit: Optional[int] = None
+        self._template: Optional[str] = None
+        self._query: Optional[str] = None
         self.index = -1
         self.json = None
 
@@ -32,24 +109,73 @@ class FileCursor():
             except (IndexError) as error:
                 raise StopIteration from error
             else:
-                path = '/'.join([json_resource['path'], json_resource['name']])
-                del json_resource['path']
+                operation.checkpoint()
+                return self.to_file(json_resource)
+
+    def to_file(self, row: dict) -> 'resource.File':
+        """Build a File object from a result row"""
+        fields = {key: value for key, value in row.items() if key != 'path'}
+        fields.update(_aliased(row, self.include_fields))
+
+        api_resource = resource.File(
+            connection=self.connection,
+            path='/'.join([row['path'], row['name']]),
+            **fields)
+
+        return api_resource
+
+    @property
+    def query(self) -> Optional[str]:
+        """AQL query sent to Artifactory"""
+        if self._query is not None:
+            return self._query
+
+        if self.criteria is None:
+            return None
 
-                api_resource = resource.File(
-                    connection=self.connection,
-                    path=path,
-                    **json_resource)
+        if self._template is None:
+            template = f"{self.domain}.find({json.dumps(self.criteria)})"
+            if self.include_fields:
+                fields_to_string = ', '.join([f'"{field}"' for field in self.include_fields])
+                template = f"{template}.include({fields_to_string})"
+            if self.sort_order:
+                template = f"{template}.sort({json.dumps(self.sort_order)})"
+            self._template = template
 
-                return api_resource
+        query = self._template
+        if self.row_offset:
+            query = f"{query}.offset({self.row_offset})"
+        if self.row_limit is not None:
+            query = f"{query}.limit({self.row_limit})"
 
-    def find(self, query: dict) -> 'FileCursor':
-        json_query = json.dumps(query)
-        json_query = f"items.find({json_query})"
+        return query
 
-        self.query = json_query
+    @query.setter
+    def query(self, query: str):
+        """Run a hand written query instead of the built one"""
+        self._query = query
+
+    def _changed(self) -> 'FileCursor':
+        self._template = None
+        self._query = None
+        self.json = None
+        self.index = -1
 
         return self
 
+    def find(self, query: dict, domain: str = 'items') -> 'FileCursor':
+        """Criteria of the query
+
+        Args:
+            query (dict): AQL criteria
+            domain (str, optional): AQL domain queried, only items results
+                can be turned into File objects. Defaults to 'items'.
+        """
+        self.criteria = query
+        self.domain = domain
+
+        return self._changed()
+
     def run_query(self):
         url_parts = [
             self.connection.base_url,
@@ -57,7 +183,9 @@ class FileCursor():
 
         url = '/'.join(url_parts)
 
-        response = self.connection.session.post(url, data=self.query)
+        with operation.request():
+            response = self.connection.session.post(
+                url, data=self.query, timeout=operation.timeout(None))
         response.raise_for_status()
 
         self.json = response.json()
@@ -65,12 +193,396 @@ class FileCursor():
 
         self.index = -1
 
-    def include(self, fields: List[str]):
-        for required_field in ('repo', 'path', 'name'):
-            if required_field not in fields:
-                fields.append(required_field)
+    def collect(self) -> Union[List['resource.File'], 'memory.SpillList']:
+        """Every file of the query, like list(cursor) but from streamed rows
+
+        Inside a memory.MemoryBudget the raw rows are kept in a SpillList,
+        spilling to disk once over budget, and turned into files while iterating.
+
+        Returns:
+            Union[List[resource.File], memory.SpillList]: files of the query
+        """
+        budget = memory.current()
+        if budget is None:
+            return [self.to_file(row) for row in self.rows()]
+
+        files = memory.SpillList(budget, load=self.to_file)
+        files.extend(self.rows())
+
+        return files
+
+    def _stream(self, chunk_size: int = 65536) -> Iterator[dict]:
+        url_parts = [
+            self.connection.base_url,
+            'api/search/aql']
+
+        url = '/'.join(url_parts)
+
+        with operation.request():
+            response = self.connection.session.post(
+                url, data=self.query, stream=True, timeout=operation.timeout(None))
+        response.raise_for_status()
+
+        try:
+            yield from tools.iter_json_array(response.iter_content(chunk_size), 'results')
+        finally:
+            response.close()
+
+    def rows(self, chunk_size: int = 65536) -> Iterator[dict]:
+        """Stream the raw result rows of the query
+
+        Unlike iterating over the cursor the response is parsed incrementally so
+        memory use does not grow with the number of results.
+
+        Args:
+            chunk_size (int, optional): bytes read from the socket at a time.
+                Defaults to 65536.
+
+        Yields:
+            dict: result rows as returned by Artifactory
+        """
+        yield from operation.counted(self._stream(chunk_size), lambda row: row.get('size') or 0)
+
+    @property
+    def modifiers(self) -> str:
+        """include, sort, offset and limit calls following find() in the query"""
+        find = f"{self.domain}.find({json.dumps(self.criteria)})"
+
+        return self.query[len(find):]
+
+    def include(self, fields: List[str]) -> 'FileCursor':
+        """Only return fields, repo, path and name are always included for items"""
+        include_fields = list(self.include_fields or [])
+        for field in fields:
+            field = field.strip() if field else field
+            if field and field not in include_fields:
+                include_fields.append(field)
+
+        if self.domain == 'items':
+            for required_field in self.required_fields:
+                if required_field not in include_fields:
+                    include_fields.append(required_field)
+
+        self.include_fields = include_fields
+
+        return self._changed()
+
+    def project(self, *attributes: str) -> 'FileCursor':
+        """Include the minimum set of fields needed to read attributes
+
+        Attributes are the names read on the resulting File objects or rows,
+        ie project('size', 'sha1', 'downloaded') includes size, actual_sha1 and
+        stat.downloaded on top of the required repo, path and name. Files built
+        by to_file() carry the attributes of FIELD_ALIASES, so
+        reading them sends no request.
+        """
+        return self.include([FIELD_ALIASES.get(attribute, attribute) for attribute in attributes])
+
+    def sort(self, order: dict) -> 'FileCursor':
+        """Sort results server side ie {"$asc": ["modified", "path", "name"]}"""
+        self.sort_order = order
+
+        return self._changed()
+
+    def offset(self, offset: int) -> 'FileCursor':
+        """Skip the first offset results, used with sort() to page through a query"""
+        self.row_offset = int(offset)
+        self._query = None
+        self.json = None
+
+        return self
+
+    def limit(self, limit: int) -> 'FileCursor':
+        """Return at most limit results"""
+        self.row_limit = int(limit)
+        self._query = None
+        self.json = None
+
+        return self
+
+    def page(self, offset: int, limit: int) -> 'FileCursor':
+        """New cursor over one page of this query reusing its compiled template"""
+        _ = self.query
+        cursor = copy.copy(self)
+        cursor.json = None
+        cursor.index = -1
+
+        return cursor.offset(offset).limit(limit)
+
+    def partitions_by_path(self) -> List[dict]:
+        """Split the query on the top level children of the queried repository
+
+        Folder names holding the * or ? wildcards of $match cannot be matched
+        literally, such folders are gathered in a last partition excluding
+        every other folder instead.
 
-        fields_to_string = ', '.join([f'"{field.strip()}"' for field in fields if field])
-        self.query = f"{self.query}.include({fields_to_string})"
+        Returns:
+            List[dict]: one AQL criteria per top level folder plus one for
+                files stored at the root of the repository
+        """
+        repo = (self.criteria or {}).get('repo')
+        if not isinstance(repo, str):
+            raise ValueError("Partitioning by path requires a query on a single repo")
 
+        directory = resource.Directory(self.connection, repo, '')
+
+        partitions = [{"path": "."}]
+        excluded = [{"path": {"$ne": "."}}]
+        wildcards = False
+        for child in directory.context['children']:
+            if not child['folder']:
+                continue
+
+            name = child['uri'].lstrip('/')
+            if '*' in name or '?' in name:
+                wildcards = True
+                continue
+
+            partitions.append({"$or": [{"path": name}, {"path": {"$match": f"{name}/*"}}]})
+            excluded.extend([{"path": {"$ne": name}}, {"path": {"$nmatch": f"{name}/*"}}])
+
+        if wildcards:
+            partitions.append({"$and": excluded})
+
+        return partitions
+
+    @staticmethod
+    def partitions_by_created(start: datetime, end: datetime, count: int) -> List[dict]:
+        """Split the query into count ranges of the created field
+
+        The first and last ranges are open ended so items outside start and end
+        still belong to a partition.
+        """
+        if count < 2:
+            raise ValueError("Partitioning by created requires at least two partitions")
+
+        step = (end - start) / count
+        bounds = [tools.format_timestamp(start + step * index) for index in range(1, count)]
+
+        partitions = []
+        for index in range(count):
+            criteria = []
+            if index > 0:
+                criteria.append({"created": {"$gte": bounds[index - 1]}})
+            if index < count - 1:
+                criteria.append({"created": {"$lt": bounds[index]}})
+            partitions.append({"$and": criteria} if len(criteria) > 1 else criteria[0])
+
+        return partitions
+
+    def partitioned(
+            self, partitions: List[dict], max_workers: int = 8,
+            ordered: bool = False, retries: int = 3) -> 'PartitionedCursor':
+        """Run the query once per partition, concurrently, and merge the results
+
+        Args:
+            partitions (List[dict]): AQL criteria combined with the query criteria,
+                see partitions_by_path() and partitions_by_created()
+            max_workers (int, optional): number of concurrent queries. Defaults to 8.
+            ordered (bool, optional): yield partitions one after another in the order
+                given instead of as results arrive. Defaults to False.
+            retries (int, optional): attempts per partition on connection or
+                server errors. Defaults to 3.
+
+        Returns:
+            PartitionedCursor: iterator over File objects of every partition
+        """
+        queries = [
+            f"items.find({json.dumps({'$and': [self.criteria, partition]})}){self.modifiers}"
+            for partition in partitions]
+
+        return PartitionedCursor(self.connection, queries, max_workers, ordered, retries)
+
+
+class PartitionedCursor():
+    """Iterate over the merged results of several aql queries run concurrently"""
+    logger = logging.getLogger(__name__)
+    queue_size = 1000
+
+    def __init__(
+            self, connection: 'tools.Connection', queries: List[str],
+            max_workers: int = 8, ordered: bool = False, retries: int = 3):
+        self.connection = connection
+        self.queries = queries
+        self.max_workers = max_workers
+        self.ordered = ordered
+        self.retries = retries
+        self._iterator: Optional[Iterator['resource.File']] = None
+
+    def __iter__(self):
         return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = self._merge()
+
+        operation.checkpoint()
+
+        return next(self._iterator)
+
+    @staticmethod
+    def _retryable(error: exceptions.RequestException) -> bool:
+        if isinstance(error, (exceptions.ConnectionError, exceptions.Timeout)):
+            return True
+
+        response = getattr(error, 'response', None)
+        if not isinstance(error, exceptions.HTTPError) or response is None:
+            return False
+
+        return response.status_code >= 500
+
+    def _run(self, query: str) -> Iterator['resource.File']:
+        """Stream the files of one partition
+
+        The query is retried on connection errors, timeouts and server errors
+        until its first row arrived, later failures would yield rows twice.
+        Rows are counted by the operation consuming the merged files.
+        """
+        cursor = FileCursor(self.connection)
+        cursor.query = query
+
+        for attempt in range(1, self.retries + 1):
+            rows = cursor._stream() # pylint: disable=protected-access
+            try:
+                first = next(rows, None)
+            except exceptions.RequestException as error:
+                if attempt == self.retries or not self._retryable(error):
+                    raise
+                self.logger.warning("partition query failed (attempt %s): %s", attempt, error)
+                time.sleep(2 ** (attempt - 1))
+                continue
+
+            if first is not None:
+                yield cursor.to_file(first)
+                for row in rows:
+                    yield cursor.to_file(row)
+            return
+
+    def _merge(self) -> Iterator['resource.File']:
+        finished = object()
+        stop = threading.Event()
+        if self.ordered:
+            queues = [queue.Queue(self.queue_size) for _ in self.queries]
+        else:
+            queues = [queue.Queue(self.queue_size)] * len(self.queries)
+
+        def put(output, item):
+            while not stop.is_set():
+                try:
+                    output.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def work(query, output):
+            try:
+                for file in self._run(query):
+                    if stop.is_set():
+                        return
+                    put(output, file)
+            except Exception as error: # pylint: disable=broad-except
+                put(output, error)
+            put(output, finished)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                for query, output in zip(self.queries, queues):
+                    executor.submit(contextvars.copy_context().run, work, query, output)
+
+                remaining = len(self.queries)
+                for output in (queues if self.ordered else queues[:1]):
+                    while remaining:
+                        item = output.get()
+                        if item is finished:
+                            remaining -= 1
+                            if self.ordered:
+                                break
+                            continue
+                        if isinstance(item, Exception):
+                            raise item
+                        yield item
+            finally:
+                stop.set()
+
+
+def _chunks(groups: Dict[Tuple[str, str], List[str]], max_query_bytes: int) -> Iterator[dict]:
+    """Pack folder groups into $or criteria whose JSON stays under max_query_bytes"""
+    wrapper = len(json.dumps({"$or": []}))
+    criteria: List[dict] = []
+    size = wrapper
+
+    for (repo, folder), names in groups.items():
+        group = None
+
+        header = len(json.dumps({"repo": repo, "path": folder, "$or": []})) + 2
+
+        for name in names:
+            name_size = len(json.dumps({"name": name})) + 2
+            needed = name_size if group else header + name_size
+
+            if criteria and size + needed > max_query_bytes:
+                yield {"$or": criteria}
+                criteria, size, group = [], wrapper, None
+                needed = header + name_size
+
+            if group is None:
+                group = {"repo": repo, "path": folder, "$or": []}
+                criteria.append(group)
+
+            group["$or"].append({"name": name})
+            size += needed
+
+    if criteria:
+        yield {"$or": criteria}
+
+
+def get_files(
+        connection: 'tools.Connection', paths: Iterable[str],
+        max_query_bytes: int = 50000,
+        max_workers: int = 4) -> Tuple[List['resource.File'], Set[str]]:
+    """Look up many files with a handful of AQL queries
+
+    Paths are grouped by repository and folder and packed into $or queries
+    kept under max_query_bytes, which are run concurrently.
+
+    Args:
+        connection (tools.Connection): connection to Artifactory
+        paths (Iterable[str]): paths of files including the repository, ie docker/alpine/3.16/manifest.json
+        max_query_bytes (int, optional): upper bound of a single query's criteria. Defaults to 50000.
+        max_workers (int, optional): number of concurrent queries. Defaults to 4.
+
+    Returns:
+        Tuple[List[resource.File], Set[str]]: files found and paths missing from Artifactory
+    """
+    groups: Dict[Tuple[str, str], List[str]] = {}
+    requested: Set[Tuple[str, str, str]] = set()
+
+    for full_path in paths:
+        repo, _, path = full_path.strip('/').partition('/')
+        folder, _, name = path.rpartition('/')
+        key = (repo, folder or '.', name)
+
+        if key not in requested:
+            requested.add(key)
+            groups.setdefault(key[:2], []).append(name)
+
+    def run(criteria):
+        return list(FileCursor(connection).find(criteria).rows())
+
+    found = []
+    for criteria, rows, error in tools.bounded_map(run, _chunks(groups, max_query_bytes), max_workers):
+        if error:
+            raise error
+
+        FileCursor.logger.debug("lookup of %s criteria returned %s rows", len(criteria["$or"]), len(rows))
+        for row in rows:
+            key = (row['repo'], row['path'], row['name'])
+            if key in requested:
+                requested.discard(key)
+                found.append(FileCursor(connection).to_file(row))
+
+    missing = {
+        '/'.join([repo, name] if folder == '.' else [repo, folder, name])
+        for repo, folder, name in requested}
+
+    return found, missing
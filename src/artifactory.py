@@ -1,26 +1,40 @@
 """Artifactory REST API resources"""
 import logging
+from typing import Iterable, List, Optional, Set, Tuple
 
 import requests
 
 from . import tools
 from . import resource
 from . import aql
+from . import sync
 
 
 class _Base(): # pylint: disable=too-few-public-methods
-    """Base class for Artifactory API entry points"""
+    """Base class for Artifactory API entry points
+
+    Args:
+        base_url (str): url of Artifactory, the primary node of a cluster
+        api_key (str): API key sent with every request
+        node_urls (List[str], optional): urls of the other nodes of a cluster,
+            reads are then balanced over every node. Defaults to None.
+    """
     logger = logging.getLogger(__name__)
 
-    def __init__(self, base_url: str, api_key: str):
+    def __init__(self, base_url: str, api_key: str, node_urls: Optional[List[str]] = None):
         session = requests.Session()
         headers = {"X-JFrog-Art-Api": api_key}
         session.headers.update(headers)
 
+        if node_urls:
+            others = [url for url in node_urls if url.rstrip('/') != base_url.rstrip('/')]
+            session = tools.MultiNodeSession(session, [base_url] + others)
+
         self.connection = tools.Connection(session=session, base_url = base_url)
+        self.connection.repository_resolver = resource.RepositoryResolver(self.connection)
 
 
-class ArtifactsAndStorage(_Base, resource.RepositoriesMixin):
+class ArtifactsAndStorage(_Base, resource.RepositoriesMixin, resource.StorageSummaryMixin):
     """Entry point into Artifactorie's Artifacts & Storage APIs"""
 
     def get_directory(self, repository_key: str, path: str) -> resource.Directory:
@@ -40,14 +54,36 @@ class ArtifactsAndStorage(_Base, resource.RepositoriesMixin):
 
         url = '/'.join(url_parts)
 
-        response = self.connection.session.get(url, timeout=self.connection.session_timeout)
-
         directory = resource.Directory(self.connection, repository_key, path)
-        directory._context = response.json() # pylint: disable=protected-access
+        directory._context = self.connection.get_json(url) # pylint: disable=protected-access
 
         return directory
 
+    def get_files(self, paths: Iterable[str]) -> Tuple[List[resource.File], Set[str]]:
+        """Find many files in Artifactory with a handful of AQL queries
+
+        Args:
+            paths (Iterable[str]): paths of files including the repository key
+
+        Returns:
+            Tuple[List[resource.File], Set[str]]: files found and paths missing from Artifactory
+        """
+        return aql.get_files(self.connection, paths)
+
     def item(self) -> aql.FileCursor:
         file_cursor = aql.FileCursor(connection=self.connection)
 
         return file_cursor
+
+    def incremental_sync(
+            self, repository_key: str, store: sync.WatermarkStore, **kwargs) -> sync.IncrementalSync:
+        """Stream files changed in a repository since the previous sync
+
+        Args:
+            repository_key (str): equivalent of the repo key in Artifactory API
+            store (sync.WatermarkStore): where watermarks are kept between runs
+
+        Returns:
+            sync.IncrementalSync: object whose changes() method yields added and updated files
+        """
+        return sync.IncrementalSync(self.connection, repository_key, store, **kwargs)
@@ -0,0 +1,292 @@
+"""Bulk operations over many files or directories executed in parallel"""
+import logging
+from copy import copy as shallow_copy
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union, TYPE_CHECKING
+
+from . import memory
+from . import operation
+from . import resource
+from . import tools
+
+if TYPE_CHECKING:
+    from . import aql
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Report():
+    """Ledger of a bulk operation
+
+    In a dry run nothing is sent to Artifactory and every item lands in succeeded.
+    Inside a memory.MemoryBudget the ledgers spill to disk once over budget.
+    """
+    dry_run: bool
+    succeeded: Union[List[str], memory.SpillList] = field(default_factory=memory.spillable_list)
+    failed: Union[List[str], memory.SpillList] = field(default_factory=memory.spillable_list)
+    bytes: int = 0
+
+    def __str__(self):
+        prefix = 'would process' if self.dry_run else 'processed'
+
+        return (
+            f"{prefix} {len(self.succeeded)} items ({self.bytes} bytes), "
+            f"{len(self.failed)} failed")
+
+
+def _location(item: Union['resource.File', 'resource.Directory']) -> str:
+    return f"{item.repo}/{item.path}"
+
+
+def _size(item: Union['resource.File', 'resource.Directory']) -> int:
+    return int(item.__dict__.get('size') or 0)
+
+
+def delete(
+        items: Iterable[Union['resource.File', 'resource.Directory']],
+        max_workers: int = 8, dry_run: bool = False) -> Report:
+    """Delete files or directories using a bounded number of parallel requests
+
+    Args:
+        items (Iterable[Union[resource.File, resource.Directory]]): objects to delete,
+            may be a generator such as a FileCursor
+        max_workers (int, optional): number of concurrent delete requests. Defaults to 8.
+        dry_run (bool, optional): only report what would be deleted. Defaults to False.
+
+    Returns:
+        Report: ledger of deleted and failed items
+    """
+    report = Report(dry_run=dry_run)
+    counter = operation.Counter()
+
+    try:
+        if dry_run:
+            for item in items:
+                logger.info("dry run, would delete %s", _location(item))
+                report.succeeded.append(_location(item))
+                report.bytes += _size(item)
+                counter.advance(1, _size(item))
+
+            return report
+
+        for item, deleted, error in tools.bounded_map(lambda item: item.delete(), items, max_workers):
+            if deleted:
+                report.succeeded.append(_location(item))
+                report.bytes += _size(item)
+            else:
+                logger.warning("failed to delete %s: %s", _location(item), error)
+                report.failed.append(_location(item))
+            counter.advance(1, _size(item))
+    finally:
+        counter.release()
+
+    return report
+
+
+def read_properties(
+        cursor: 'aql.FileCursor') -> Iterator[Tuple['resource.File', 'resource.Properties']]:
+    """Properties of every file matched by cursor, read with the query itself
+
+    property.* is added to the include of a copy of the query so no request is
+    made per file and cursor itself is left unchanged. A query without include
+    keeps the fields Artifactory returns by default next to the properties.
+
+    Yields:
+        Tuple[resource.File, resource.Properties]: file and its properties
+    """
+    query = shallow_copy(cursor)
+    if query.include_fields is None:
+        query = query.include(list(query.default_fields))
+
+    for row in query.project('properties').rows():
+        row.setdefault('properties', [])
+        file = cursor.to_file(row)
+
+        yield file, file.get_properties()
+
+
+def set_properties(
+        items: Iterable[Union['resource.File', 'resource.Directory']],
+        properties: Dict[str, Union[str, List[str]]],
+        max_workers: int = 8, dry_run: bool = False) -> Report:
+    """Set properties on many files or directories using parallel requests
+
+    Directories are tagged recursively with a single request, so pass the
+    folder rather than its files whenever everything below it is concerned.
+
+    Args:
+        items (Iterable[Union[resource.File, resource.Directory]]): objects to tag,
+            may be a generator such as a FileCursor
+        properties (Dict[str, Union[str, List[str]]]): property names mapped
+            to a value or a list of values
+        max_workers (int, optional): number of concurrent requests. Defaults to 8.
+        dry_run (bool, optional): only report what would be tagged. Defaults to False.
+
+    Returns:
+        Report: ledger of tagged and failed items
+    """
+    report = Report(dry_run=dry_run)
+
+    def tag(item):
+        return item.set_properties(properties, recursive=isinstance(item, resource.Directory))
+
+    counter = operation.Counter()
+
+    try:
+        if dry_run:
+            for item in items:
+                logger.info("dry run, would set properties on %s", _location(item))
+                report.succeeded.append(_location(item))
+                counter.advance()
+
+            return report
+
+        for item, tagged, error in tools.bounded_map(tag, items, max_workers):
+            if tagged:
+                report.succeeded.append(_location(item))
+            else:
+                logger.warning("failed to set properties on %s: %s", _location(item), error)
+                report.failed.append(_location(item))
+            counter.advance()
+    finally:
+        counter.release()
+
+    return report
+
+
+Item = Union['resource.File', 'resource.Directory']
+
+
+def _complete_folder(files: List['resource.File'], repo: str, folder: str) -> bool:
+    """True when files are every child of folder, which holds no sub folder"""
+    directory = resource.Directory(files[0].connection, repo, folder)
+    names = {file.name for file in files}
+
+    children = 0
+    for child in directory.iter_children():
+        if isinstance(child, resource.Directory) or child.name not in names:
+            return False
+        children += 1
+
+    return children == len(names)
+
+
+def _group(items: Iterable[Item]) -> Iterator[List[Item]]:
+    """Runs of files sharing a folder, directories alone
+
+    Files are grouped while they arrive so only one folder is buffered at a
+    time, results sorted by path collapse best.
+    """
+    key, group = None, []
+
+    for item in items:
+        if isinstance(item, resource.Directory):
+            yield [item]
+            continue
+
+        item_key = (item.repo, item.path.rpartition('/')[0])
+        if item_key != key and group:
+            yield group
+            group = []
+
+        key = item_key
+        group.append(item)
+
+    if group:
+        yield group
+
+
+def _collapse(group: List[Item], min_files: int) -> List[Tuple[Item, int]]:
+    """Replace a group of files making up a whole folder with the folder itself
+
+    Runs on the worker threads: checking a folder lists its children.
+
+    Returns:
+        List[Tuple[Item, int]]: items to transfer and the bytes they cover
+    """
+    first = group[0]
+    folder = first.path.rpartition('/')[0] if isinstance(first, resource.File) else ''
+
+    if len(group) >= min_files and folder and _complete_folder(group, first.repo, folder):
+        directory = resource.Directory(first.connection, first.repo, folder)
+        return [(directory, sum(_size(file) for file in group))]
+
+    return [(item, _size(item)) for item in group]
+
+
+def _transfer(
+        action: str, items: Iterable[Item], target_repo: str,
+        rename: Optional[Callable[[str], str]], max_workers: int,
+        dry_run: bool, collapse: bool) -> Report:
+    report = Report(dry_run=dry_run)
+    work: Iterable[Tuple[Item, int]] = ((item, _size(item)) for item in items)
+
+    if collapse:
+        def collapsed(group):
+            return _collapse(group, min_files=2)
+
+        def checked():
+            # folders are checked on a pool of their own, ahead of the transfers
+            for group, pairs, error in tools.bounded_map(collapsed, _group(items), max_workers):
+                if error:
+                    logger.debug(
+                        "cannot check folder of %s, transferring files: %s", _location(group[0]), error)
+                    pairs = [(item, _size(item)) for item in group]
+                yield from pairs
+
+        work = checked()
+
+    def transfer(pair):
+        item, _ = pair
+        target_path = rename(item.path) if rename else None
+        return getattr(item, action)(target_repo, target_path, dry_run=dry_run)
+
+    counter = operation.Counter()
+
+    try:
+        for (item, size), transferred, error in tools.bounded_map(transfer, work, max_workers):
+            if transferred:
+                report.succeeded.append(_location(item))
+                report.bytes += size
+            else:
+                logger.warning("failed to %s %s: %s", action, _location(item), error)
+                report.failed.append(_location(item))
+            counter.advance(1, size)
+    finally:
+        counter.release()
+
+    return report
+
+
+def copy(
+        items: Iterable[Item], target_repo: str, rename: Optional[Callable[[str], str]] = None,
+        max_workers: int = 8, dry_run: bool = False, collapse: bool = True) -> Report:
+    """Copy files and directories server side using parallel requests
+
+    Args:
+        items (Iterable[Item]): objects to copy, may be a FileCursor
+        target_repo (str): repository receiving the copies
+        rename (Callable[[str], str], optional): maps a source path, of a file or
+            of a collapsed folder, to its target path. Defaults to the same path.
+        max_workers (int, optional): number of concurrent requests. Defaults to 8.
+        dry_run (bool, optional): have Artifactory validate every copy without
+            performing it. Defaults to False.
+        collapse (bool, optional): copy a folder with one request when every
+            file in it is part of items. Defaults to True.
+
+    Returns:
+        Report: ledger of copied and failed items
+    """
+    return _transfer('copy', items, target_repo, rename, max_workers, dry_run, collapse)
+
+
+def move(
+        items: Iterable[Item], target_repo: str, rename: Optional[Callable[[str], str]] = None,
+        max_workers: int = 8, dry_run: bool = False, collapse: bool = True) -> Report:
+    """Move files and directories server side using parallel requests, see copy()
+
+    Returns:
+        Report: ledger of moved and failed items
+    """
+    return _transfer('move', items, target_repo, rename, max_workers, dry_run, collapse)
@@ -0,0 +1,309 @@
+"""Command line interface, run with python -m src
+
+Only the standard library is imported up front: requests, hurry.filesize
+and the resource classes are imported by the command needing them so quick
+invocations from cron or CI do not pay for modules they never use.
+"""
+import argparse
+import builtins
+import contextlib
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from . import tools
+
+# seconds allowed for importing this module and parsing arguments, the
+# imports are checked by tests/test_cli.py with python -X importtime
+STARTUP_BUDGET = 0.15
+
+_started = time.perf_counter()
+
+
+class ImportProfiler():
+    """Measure the time spent importing each module while active
+
+    Times are inclusive of the modules imported by a module, like
+    python -X importtime, and only first imports are recorded.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.original_import = builtins.__import__
+
+    def __enter__(self):
+        original_import = self.original_import
+        timings = self.timings
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0): # pylint: disable=redefined-builtin
+            module = name
+            if level:
+                package = (globals or {}).get('__package__') or ''
+                module = f"{package}.{name}" if name else package
+
+            candidates = [module] + [f"{module}.{item}" for item in fromlist or () if item != '*']
+            new = [candidate for candidate in candidates if candidate not in sys.modules]
+            if not new:
+                return original_import(name, globals, locals, fromlist, level)
+
+            start = time.perf_counter()
+            try:
+                return original_import(name, globals, locals, fromlist, level)
+            finally:
+                timings.setdefault(new[0], time.perf_counter() - start)
+
+        builtins.__import__ = timed_import
+
+        return self
+
+    def __exit__(self, *exc_info):
+        builtins.__import__ = self.original_import
+
+    def report(self, limit: int = 20) -> str:
+        """Slowest imports, one per line"""
+        lines = [
+            f"{seconds * 1000:9.1f} ms  {name}"
+            for name, seconds in sorted(self.timings.items(), key=lambda item: -item[1])[:limit]]
+
+        return '\n'.join(lines)
+
+
+def _connect(args: argparse.Namespace) -> 'tools.Connection':
+    import requests # pylint: disable=import-outside-toplevel
+    from . import resource, tools # pylint: disable=import-outside-toplevel
+
+    if not args.url:
+        raise SystemExit("Artifactory url missing, use --url or ARTIFACTORY_URL")
+
+    session = requests.Session()
+    session.headers.update({"X-JFrog-Art-Api": args.api_key or ''})
+    if args.node:
+        session = tools.MultiNodeSession(session, [args.url] + args.node)
+
+    connection = tools.Connection(session=session, base_url=args.url.rstrip('/'))
+    connection.repository_resolver = resource.RepositoryResolver(connection)
+
+    return connection
+
+
+def _criteria(args: argparse.Namespace) -> dict:
+    if args.query:
+        return json.loads(args.query)
+
+    criteria = {"type": "file"}
+    if args.repo:
+        criteria["repo"] = args.repo
+    if args.name:
+        criteria["name"] = {"$match": args.name}
+
+    return criteria
+
+
+def _cursor(args: argparse.Namespace):
+    from . import aql # pylint: disable=import-outside-toplevel
+
+    cursor = aql.FileCursor(_connect(args)).find(_criteria(args))
+    if args.include:
+        cursor = cursor.include(args.include.split(','))
+    if args.limit:
+        cursor = cursor.limit(args.limit)
+
+    return cursor
+
+
+def find(args: argparse.Namespace) -> int:
+    """Print files matching an AQL query"""
+    for row in _cursor(args).rows():
+        if args.json:
+            print(json.dumps(row, separators=(',', ':')))
+        else:
+            print(f"{row['repo']}/{row['path']}/{row['name']}")
+
+    return 0
+
+
+def du(args: argparse.Namespace) -> int: # pylint: disable=invalid-name
+    """Print the disk usage of a folder"""
+    from . import resource # pylint: disable=import-outside-toplevel
+
+    repo, _, path = args.folder.partition('/')
+    directory = resource.Directory(_connect(args), repo, path.strip('/'))
+    usage = directory.du(args.depth, source=args.source)
+    print(usage.report(args.depth, human_readable=args.human_readable))
+
+    return 0
+
+
+def delete(args: argparse.Namespace) -> int:
+    """Delete files given by path or matching an AQL query"""
+    from . import aql, bulk # pylint: disable=import-outside-toplevel
+
+    if args.paths:
+        items, missing = aql.get_files(_connect(args), args.paths)
+        for path in sorted(missing):
+            print(f"not found: {path}", file=sys.stderr)
+    elif args.query or args.name or (args.repo and args.all):
+        items = _cursor(args)
+    elif args.repo:
+        raise SystemExit(
+            f"delete --repo {args.repo} alone removes every file of the repository, "
+            "narrow it with --query or --name, or confirm with --all")
+    else:
+        raise SystemExit("delete needs paths, --query, --name or --repo with --all")
+
+    report = bulk.delete(items, max_workers=args.workers, dry_run=args.dry_run)
+    print(report)
+
+    return 1 if report.failed else 0
+
+
+def repos(args: argparse.Namespace) -> int:
+    """Print the repositories of Artifactory"""
+    connection = _connect(args)
+
+    params = {}
+    if args.type:
+        params['type'] = args.type
+    if args.package_type:
+        params['packageType'] = args.package_type
+
+    url = '/'.join([connection.base_url, 'api/repositories'])
+    for repository in connection.get_json(url, params=params):
+        print(f"{repository['key']}\t{repository['type']}\t{repository.get('packageType', '')}")
+
+    return 0
+
+
+def export(args: argparse.Namespace) -> int:
+    """Write files matching an AQL query to NDJSON or CSV"""
+    from . import export as exporter # pylint: disable=import-outside-toplevel
+
+    fields = args.fields.split(',') if args.fields else None
+    write = exporter.to_csv if args.format == 'csv' else exporter.to_ndjson
+    count = write(_cursor(args), args.output, fields=fields)
+    print(f"exported {count} rows to {args.output}", file=sys.stderr)
+
+    return 0
+
+
+def _add_query_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--query', help="AQL items.find() criteria as JSON")
+    parser.add_argument('--repo', help="repository to search when --query is not given")
+    parser.add_argument('--name', help="file name pattern, * and ? wildcards")
+    parser.add_argument('--include', help="comma separated AQL fields to return")
+    parser.add_argument('--limit', type=int, help="maximum number of files")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Argument parser of every command"""
+    parser = argparse.ArgumentParser(prog='python -m src', description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--url', default=os.environ.get('ARTIFACTORY_URL'),
+        help="Artifactory url, defaults to $ARTIFACTORY_URL")
+    parser.add_argument(
+        '--api-key', default=os.environ.get('ARTIFACTORY_API_KEY'),
+        help="API key, defaults to $ARTIFACTORY_API_KEY")
+    parser.add_argument(
+        '--node', action='append', default=[],
+        help="url of another cluster node to balance reads over, repeatable")
+    parser.add_argument(
+        '--profile-import', action='store_true',
+        help="report the time spent importing modules on stderr")
+    parser.add_argument(
+        '--deadline', type=float, help="seconds after which the command is stopped")
+    parser.add_argument(
+        '--progress', action='store_true', help="report throughput on stderr every few seconds")
+    parser.add_argument(
+        '--memory-budget', type=int, metavar='MB',
+        help="spill large intermediate state to disk beyond this many megabytes "
+        "and report the peak RSS on stderr")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('find', help=find.__doc__)
+    _add_query_arguments(command)
+    command.add_argument('--json', action='store_true', help="print whole rows as JSON lines")
+    command.set_defaults(function=find)
+
+    command = commands.add_parser('du', help=du.__doc__)
+    command.add_argument('folder', help="repository and path ie generic-local/builds")
+    command.add_argument('--depth', type=int, help="deepest level of folders reported")
+    command.add_argument('--source', choices=['list', 'aql'], default='list')
+    command.add_argument('-H', '--human-readable', action='store_true')
+    command.set_defaults(function=du)
+
+    command = commands.add_parser('delete', help=delete.__doc__)
+    command.add_argument('paths', nargs='*', help="repository and path of each file")
+    _add_query_arguments(command)
+    command.add_argument(
+        '--all', action='store_true', help="allow --repo alone to delete every file of the repository")
+    command.add_argument('--workers', type=int, default=8, help="concurrent delete requests")
+    command.add_argument('--dry-run', action='store_true')
+    command.set_defaults(function=delete)
+
+    command = commands.add_parser('repos', help=repos.__doc__)
+    command.add_argument('--type', choices=['local', 'remote', 'virtual', 'federated', 'distribution'])
+    command.add_argument('--package-type')
+    command.set_defaults(function=repos)
+
+    command = commands.add_parser('export', help=export.__doc__)
+    _add_query_arguments(command)
+    command.add_argument('output', help="destination file, gzip compressed when ending in .gz")
+    command.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    command.add_argument('--fields', help="comma separated keys written for every row")
+    command.set_defaults(function=export)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the command given by argv, sys.argv by default
+
+    Returns:
+        int: process exit status
+    """
+    args = build_parser().parse_args(argv)
+    startup = time.perf_counter() - _started
+
+    if not args.profile_import:
+        return _run(args)
+
+    try:
+        with ImportProfiler() as profiler:
+            return _run(args)
+    finally:
+        budget = 'within' if startup <= STARTUP_BUDGET else 'over'
+        print(
+            f"src.cli import and argument parsing {startup * 1000:.1f} ms, "
+            f"{budget} the {STARTUP_BUDGET * 1000:.0f} ms budget, interpreter start-up excluded\n"
+            f"imports while running {args.command}:\n{profiler.report()}",
+            file=sys.stderr)
+
+
+def _run(args: argparse.Namespace) -> int:
+    from . import operation # pylint: disable=import-outside-toplevel
+
+    def report(progress):
+        print(progress, file=sys.stderr)
+
+    context = operation.OperationContext(
+        timeout=args.deadline, on_progress=report if args.progress else None, interval=5)
+
+    try:
+        with context, contextlib.ExitStack() as stack:
+            if args.memory_budget:
+                from . import memory # pylint: disable=import-outside-toplevel
+
+                budget = stack.enter_context(memory.MemoryBudget(args.memory_budget * 1024 ** 2))
+                stack.callback(lambda: print(budget, file=sys.stderr))
+
+            return args.function(args)
+    except operation.Cancelled as error:
+        print(f"{args.command} stopped: {error}", file=sys.stderr)
+        return 3
+    # requests' exceptions derive from OSError
+    except OSError as error:
+        print(f"{args.command} failed: {error}", file=sys.stderr)
+        return 2
@@ -0,0 +1,239 @@
+"""Docker aware analysis of Artifactory repositories
+
+Artifactory stores a Docker tag as a folder image/tag holding manifest.json
+and one sha256__<digest> file per layer. Manifests are found with AQL,
+fetched in parallel, once per distinct checksum, and turned into a graph of
+tags and the layers they reference. The graph tells the bytes only a tag or
+an image holds, so a cleanup can pick the tags that actually free space, and
+which layer files no manifest references any more.
+"""
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from . import aql
+from . import operation
+from . import tools
+
+if TYPE_CHECKING:
+    from . import resource
+
+logger = logging.getLogger(__name__)
+
+Manifest = Dict[str, int]
+
+
+@dataclass
+class Tag():
+    """Tag of an image and the layers, config included, its manifest references"""
+    repo: str
+    image: str
+    name: str
+    layers: Manifest = field(default_factory=dict)
+
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        """Repository, image and tag name"""
+        return self.repo, self.image, self.name
+
+    def __str__(self):
+        return f"{self.repo}/{self.image}:{self.name}"
+
+
+def parse_manifest(manifest: dict) -> Manifest:
+    """Layer digests of a schema 2 manifest mapped to their size, config included"""
+    blobs = list(manifest.get('layers', []))
+    if 'config' in manifest:
+        blobs.append(manifest['config'])
+
+    return {blob['digest']: blob.get('size', 0) for blob in blobs}
+
+
+class LayerGraph():
+    """Tags and the layers they share
+
+    unreadable holds the repository, image and tag of manifests found by AQL
+    whose download failed: their layers are neither known nor orphaned.
+    """
+
+    def __init__(self):
+        self.tags: Dict[Tuple[str, str, str], Tag] = {}
+        self.unreadable: Set[Tuple[str, str, str]] = set()
+        self.layers: Dict[str, int] = {}
+        self.layer_tags: Dict[str, Set[Tuple[str, str, str]]] = defaultdict(set)
+
+    def add(self, tag: Tag):
+        """Record tag and the layers it references"""
+        self.tags[tag.key] = tag
+        for digest, size in tag.layers.items():
+            self.layers[digest] = size
+            self.layer_tags[digest].add(tag.key)
+
+    def images(self) -> Dict[Tuple[str, str], List[Tag]]:
+        """Tags grouped by repository and image"""
+        images = defaultdict(list)
+        for tag in self.tags.values():
+            images[(tag.repo, tag.image)].append(tag)
+
+        return dict(images)
+
+    def freed_bytes(self, tags: Iterable[Tag]) -> int:
+        """Bytes released by deleting tags: their layers no other tag references"""
+        keys = {tag.key for tag in tags}
+        digests = {digest for key in keys for digest in self.tags[key].layers}
+
+        return sum(
+            self.layers[digest] for digest in digests if self.layer_tags[digest] <= keys)
+
+    def unique_bytes(self, tag: Tag) -> int:
+        """Bytes of the layers referenced by tag alone"""
+        return self.freed_bytes([tag])
+
+    def image_unique_bytes(self, repo: str, image: str) -> int:
+        """Bytes of the layers referenced only by tags of image"""
+        return self.freed_bytes(self.images().get((repo, image), []))
+
+    def ranked_tags(self) -> List[Tuple[Tag, int]]:
+        """Every tag with its unique bytes, tags freeing the most space first"""
+        ranking = [(tag, self.unique_bytes(tag)) for tag in self.tags.values()]
+        ranking.sort(key=lambda pair: (-pair[1], str(pair[0])))
+
+        return ranking
+
+
+class ManifestCache():
+    """Parsed manifests by checksum of manifest.json so each is downloaded once
+
+    Args:
+        connection (tools.Connection): connection to Artifactory
+        max_workers (int, optional): concurrent manifest downloads. Defaults to 8.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, connection: 'tools.Connection', max_workers: int = 8):
+        self.connection = connection
+        self.max_workers = max_workers
+        self.manifests: Dict[str, Manifest] = {}
+
+    def _fetch(self, row: dict) -> Manifest:
+        url = '/'.join([self.connection.base_url, row['repo'], row['path'], row['name']])
+        with operation.request():
+            response = self.connection.session.get(
+                url, timeout=operation.timeout(self.connection.session_timeout))
+        response.raise_for_status()
+
+        return parse_manifest(response.json())
+
+    def load(self, rows: Iterable[dict]) -> Iterator[Tuple[dict, Optional[Manifest]]]:
+        """Manifest of every manifest.json row, None when it cannot be read
+
+        Rows whose checksum was already fetched are answered from the cache,
+        the others are downloaded in parallel, one request per checksum.
+
+        Yields:
+            Tuple[dict, Optional[Manifest]]: row and its parsed manifest
+        """
+        waiting: Dict[str, List[dict]] = defaultdict(list)
+
+        def first_of_checksum():
+            for row in rows:
+                sha1 = row['actual_sha1']
+                if sha1 in self.manifests:
+                    yield row, True
+                elif sha1 in waiting:
+                    waiting[sha1].append(row)
+                else:
+                    waiting[sha1].append(row)
+                    yield row, False
+
+        def fetch(pair):
+            row, cached = pair
+            return None if cached else self._fetch(row)
+
+        for (row, cached), manifest, error in tools.bounded_map(
+                fetch, first_of_checksum(), self.max_workers):
+            sha1 = row['actual_sha1']
+            if cached:
+                yield row, self.manifests[sha1]
+                continue
+
+            if error:
+                self.logger.warning("cannot read %s/%s/%s: %s", row['repo'], row['path'], row['name'], error)
+            else:
+                self.manifests[sha1] = manifest
+
+            for waiting_row in waiting.pop(sha1):
+                yield waiting_row, manifest
+
+
+def _split(path: str) -> Tuple[str, str]:
+    image, _, tag = path.rpartition('/')
+
+    return image, tag
+
+
+def build_graph(
+        connection: 'tools.Connection', repos: List[str],
+        cache: Optional[ManifestCache] = None) -> LayerGraph:
+    """Stream the manifests of repos into a LayerGraph
+
+    Args:
+        connection (tools.Connection): connection to Artifactory
+        repos (List[str]): Docker repositories to analyse
+        cache (ManifestCache, optional): manifests already downloaded, reuse it
+            between calls to skip unchanged manifests. Defaults to a new cache.
+
+    Returns:
+        LayerGraph: tags of repos and their layers
+    """
+    cache = cache or ManifestCache(connection)
+
+    cursor = aql.FileCursor(connection).find(
+        {"name": "manifest.json", "$or": [{"repo": repo} for repo in repos]})
+    cursor = cursor.include(['repo', 'path', 'name', 'actual_sha1'])
+
+    graph = LayerGraph()
+    for row, manifest in cache.load(cursor.rows()):
+        image, name = _split(row['path'])
+        if manifest is None:
+            graph.unreadable.add((row['repo'], image, name))
+        else:
+            graph.add(Tag(row['repo'], image, name, manifest))
+
+    logger.info("docker graph holds %s tags and %s layers", len(graph.tags), len(graph.layers))
+    if graph.unreadable:
+        logger.warning("%s manifests could not be read", len(graph.unreadable))
+
+    return graph
+
+
+def orphaned_layers(
+        connection: 'tools.Connection', graph: LayerGraph,
+        repos: List[str]) -> Iterator['resource.File']:
+    """Layer files of repos not referenced by the manifest of their folder
+
+    Layers in folders without a manifest, ie interrupted pushes, are orphaned
+    as well. Uploads in progress under _uploads and folders whose manifest
+    could not be read, see LayerGraph.unreadable, are left alone.
+
+    Yields:
+        resource.File: orphaned layer file, size included
+    """
+    cursor = aql.FileCursor(connection).find(
+        {"name": {"$match": "sha256__*"}, "$or": [{"repo": repo} for repo in repos]})
+    cursor = cursor.include(['repo', 'path', 'name', 'size'])
+
+    for row in cursor.rows():
+        if row['path'].split('/')[-1] == '_uploads':
+            continue
+
+        key = (row['repo'], *_split(row['path']))
+        if key in graph.unreadable:
+            continue
+
+        tag = graph.tags.get(key)
+        digest = row['name'].replace('__', ':', 1)
+
+        if tag is None or digest not in tag.layers:
+            yield cursor.to_file(row)
@@ -0,0 +1,150 @@
+"""Find identical binaries stored under different paths or repositories
+
+Checksums, sizes and locations are streamed from AQL into an SQLite index on
+disk so the number of files scanned is not limited by memory. Duplicate
+groups are then ranked by the bytes wasted on redundant copies.
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+from . import aql
+
+if TYPE_CHECKING:
+    from . import tools
+
+
+@dataclass
+class DuplicateGroup():
+    """Locations sharing one checksum"""
+    sha1: str
+    size: int
+    locations: List[Tuple[str, str]]
+
+    @property
+    def wasted_bytes(self) -> int:
+        """Bytes of every copy but one"""
+        return (len(self.locations) - 1) * self.size
+
+
+class DuplicateIndex():
+    """On disk index of checksum, size and location of files
+
+    Args:
+        path (str, optional): SQLite database file, a temporary file removed on
+            close() is used by default
+        cache_size (int, optional): SQLite page cache in KiB, bounds memory use.
+            Defaults to 65536.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, path: Optional[str] = None, cache_size: int = 65536):
+        self.temporary = path is None
+        if self.temporary:
+            handle, path = tempfile.mkstemp(suffix='.sqlite')
+            os.close(handle)
+
+        self.path = path
+        self.database = sqlite3.connect(path)
+        self.database.execute(f"PRAGMA cache_size = -{int(cache_size)}")
+        self.database.execute("PRAGMA journal_mode = OFF")
+        self.database.execute("PRAGMA synchronous = OFF")
+        self.database.execute(
+            "CREATE TABLE IF NOT EXISTS items (sha1 BLOB, size INTEGER, repo TEXT, path TEXT)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the database, removing it when it is temporary"""
+        self.database.close()
+        if self.temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def load(self, rows: Iterable[dict], batch_size: int = 10000) -> int:
+        """Insert AQL rows with repo, path, name, size and actual_sha1
+
+        Returns:
+            int: number of rows inserted
+        """
+        count = 0
+        batch = []
+
+        def flush():
+            self.database.executemany("INSERT INTO items VALUES (?, ?, ?, ?)", batch)
+            batch.clear()
+
+        for row in rows:
+            batch.append((
+                bytes.fromhex(row['actual_sha1']),
+                row['size'],
+                row['repo'],
+                f"{row['path']}/{row['name']}"))
+            count += 1
+
+            if len(batch) >= batch_size:
+                flush()
+
+        flush()
+        self.database.execute("CREATE INDEX IF NOT EXISTS items_sha1 ON items (sha1)")
+        self.database.commit()
+        self.logger.info("indexed %s files", count)
+
+        return count
+
+    def groups(self, min_copies: int = 2, limit: Optional[int] = None) -> Iterator[DuplicateGroup]:
+        """Duplicate groups, most wasted bytes first
+
+        Args:
+            min_copies (int, optional): smallest number of copies reported. Defaults to 2.
+            limit (int, optional): maximum number of groups. Defaults to all.
+
+        Yields:
+            DuplicateGroup: locations sharing a checksum
+        """
+        ranking = self.database.execute(
+            "SELECT sha1, MAX(size), COUNT(*) AS copies FROM items GROUP BY sha1 "
+            "HAVING copies >= ? ORDER BY (COUNT(*) - 1) * MAX(size) DESC LIMIT ?",
+            (min_copies, -1 if limit is None else limit))
+
+        for sha1, size, _ in ranking:
+            locations = self.database.execute(
+                "SELECT repo, path FROM items WHERE sha1 = ? ORDER BY repo, path", (sha1,))
+
+            yield DuplicateGroup(sha1.hex(), size, [tuple(location) for location in locations])
+
+
+def find_duplicates(
+        connection: 'tools.Connection', repos: Optional[List[str]] = None,
+        path: Optional[str] = None) -> DuplicateIndex:
+    """Stream every file of repos into a DuplicateIndex
+
+    Args:
+        connection (tools.Connection): connection to Artifactory
+        repos (List[str], optional): repositories to scan. Defaults to all.
+        path (str, optional): SQLite file keeping the index. Defaults to a temporary file.
+
+    Returns:
+        DuplicateIndex: loaded index, close it once done
+    """
+    query = {"type": "file"}
+    if repos:
+        query["$or"] = [{"repo": repo} for repo in repos]
+
+    cursor = aql.FileCursor(connection).find(query)
+    cursor = cursor.include(['repo', 'path', 'name', 'size', 'actual_sha1'])
+
+    index = DuplicateIndex(path)
+    try:
+        index.load(cursor.rows())
+    except BaseException:
+        index.close()
+        raise
+
+    return index
@@ -0,0 +1,134 @@
+"""Stream AQL results to NDJSON or CSV files with constant memory use"""
+import csv
+import gzip
+import io
+import json
+import logging
+from typing import IO, Iterable, Iterator, List, Optional, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from . import aql
+
+logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = 1024 * 1024
+
+Source = Union['aql.FileCursor', Iterable[dict]]
+Destination = Union[str, IO[str]]
+
+
+def _rows(source: Source) -> Iterator[dict]:
+    if hasattr(source, 'rows'):
+        return source.rows()
+
+    return iter(source)
+
+
+def _chain(first: dict, rows: Iterator[dict]) -> Iterator[dict]:
+    yield first
+    yield from rows
+
+
+def _project(row: dict, fields: Optional[List[str]]) -> dict:
+    if fields is None:
+        return row
+
+    return {field: row.get(field) for field in fields}
+
+
+def _open(destination: Destination, compress: Optional[bool]) -> IO[str]:
+    """Open destination for buffered text writes, gzip compressed for *.gz paths"""
+    if not isinstance(destination, str):
+        return destination
+
+    if compress is None:
+        compress = destination.endswith('.gz')
+
+    if compress:
+        return io.TextIOWrapper(
+            io.BufferedWriter(gzip.open(destination, 'wb', compresslevel=6), BUFFER_SIZE),
+            encoding='utf-8', newline='')
+
+    return open(destination, 'w', encoding='utf-8', newline='', buffering=BUFFER_SIZE)
+
+
+def _close(destination: Destination, output: IO[str]):
+    if output is destination:
+        output.flush()
+    else:
+        output.close()
+
+
+def to_ndjson(
+        source: Source, destination: Destination, fields: Optional[List[str]] = None,
+        compress: Optional[bool] = None) -> int:
+    """Write one JSON object per line for every row of source
+
+    Args:
+        source (Source): a FileCursor, whose rows are streamed, or any iterable of dicts
+        destination (Destination): file path or text file object
+        fields (List[str], optional): keys written for every row. Defaults to all keys.
+        compress (bool, optional): gzip the output, by default paths ending in .gz
+            are compressed
+
+    Returns:
+        int: number of rows written
+    """
+    output = _open(destination, compress)
+    count = 0
+
+    try:
+        for row in _rows(source):
+            output.write(json.dumps(_project(row, fields), separators=(',', ':')))
+            output.write('\n')
+            count += 1
+    finally:
+        _close(destination, output)
+
+    logger.info("exported %s rows as NDJSON", count)
+
+    return count
+
+
+def to_csv(
+        source: Source, destination: Destination, fields: Optional[List[str]] = None,
+        compress: Optional[bool] = None) -> int:
+    """Write rows of source as CSV, nested values are written as JSON
+
+    Args:
+        source (Source): a FileCursor, whose rows are streamed, or any iterable of dicts
+        destination (Destination): file path or text file object
+        fields (List[str], optional): columns of the file. Defaults to the keys
+            of the first row.
+        compress (bool, optional): gzip the output, by default paths ending in .gz
+            are compressed
+
+    Returns:
+        int: number of rows written
+    """
+    rows = _rows(source)
+    first = next(rows, None)
+    if fields is None:
+        fields = list(first) if first else []
+
+    output = _open(destination, compress)
+    count = 0
+
+    try:
+        writer = csv.DictWriter(output, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+
+        if first is not None:
+            rows = _chain(first, rows)
+
+        for row in rows:
+            writer.writerow({
+                field: json.dumps(value) if isinstance(value, (dict, list)) else value
+                for field, value in _project(row, fields).items()})
+            count += 1
+    finally:
+        _close(destination, output)
+
+    logger.info("exported %s rows as CSV", count)
+
+    return count
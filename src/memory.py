@@ -0,0 +1,430 @@
+"""Memory budget for state growing with the number of files
+
+Collected cursors, ledgers of bulk operations, sets used to deduplicate
+paths or checksums and per checksum counters are created through
+spillable_list(), spillable_set() and spillable_dict(). Outside of a
+MemoryBudget they are plain lists, sets and dicts. Inside one they share the
+budget and, once it is exceeded, move their content to temporary files:
+pickled records for lists and an SQLite table for sets and dicts, so scans
+of a whole Artifactory fit on small workers.
+
+    with memory.MemoryBudget(512 * 1024 ** 2) as budget:
+        report = bulk.delete(cursor)
+    print(budget)
+"""
+import contextvars
+import logging
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import threading
+import weakref
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+_current: 'contextvars.ContextVar[Optional[MemoryBudget]]' = contextvars.ContextVar(
+    'memory_budget', default=None)
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of the process in bytes, None where unknown"""
+    try:
+        import resource as process_resource # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+
+    peak = process_resource.getrusage(process_resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def sizeof(value: Any) -> int:
+    """Approximate memory held by value, one level deep for containers"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(key) + sys.getsizeof(item) for key, item in value.items())
+    elif isinstance(value, (tuple, list)):
+        size += sum(sys.getsizeof(item) for item in value)
+
+    return size
+
+
+class MemoryBudget():
+    """Bytes the spillable structures created inside it may keep in memory together
+
+    Args:
+        max_bytes (int): memory allowed before structures spill to disk
+        directory (str, optional): where temporary files are created. Defaults
+            to the system temporary directory.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, max_bytes: int, directory: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.used = 0
+        self.spills = 0
+        self.spilled_bytes = 0
+        self.lock = threading.Lock()
+        self.structures: 'weakref.WeakSet[Union[SpillList, SpillSet, SpillDict]]' = weakref.WeakSet()
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens.append(_current.set(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        _current.reset(self._tokens.pop())
+        self.logger.info("%s", self)
+
+    def register(self, structure: Union['SpillList', 'SpillSet', 'SpillDict']):
+        """Let the budget spill structure when memory runs out"""
+        self.structures.add(structure)
+
+    def charge(self, size: int):
+        """Account size more bytes, spilling the largest structures while over budget"""
+        with self.lock:
+            self.used += size
+            over = self.used > self.max_bytes
+
+        while over:
+            with self.lock:
+                largest = max(self.structures, key=lambda structure: structure.charged, default=None)
+            if largest is None or not largest.charged:
+                return
+
+            largest.spill()
+
+            with self.lock:
+                over = self.used > self.max_bytes
+
+    def release(self, size: int, spilled: bool = False):
+        """Give size bytes back, counting them as spilled to disk when they were"""
+        with self.lock:
+            self.used -= size
+            if spilled:
+                self.spills += 1
+                self.spilled_bytes += size
+
+    def __str__(self):
+        peak = peak_rss()
+        peak = 'unknown' if peak is None else f"{peak} bytes"
+
+        return (
+            f"memory budget {self.max_bytes} bytes, {self.spills} spills "
+            f"({self.spilled_bytes} bytes), peak RSS {peak}")
+
+
+def current() -> Optional[MemoryBudget]:
+    """Memory budget in effect, None outside of any"""
+    return _current.get()
+
+
+class SpillList():
+    """Append only list keeping its oldest items in a temporary file once over budget
+
+    Args:
+        budget (MemoryBudget): budget the items in memory are charged to
+        load (Callable[[Any], Any], optional): applied to items while iterating,
+            ie to build objects from the raw rows stored. Defaults to None.
+    """
+
+    def __init__(self, budget: MemoryBudget, load: Optional[Callable[[Any], Any]] = None):
+        self.budget = budget
+        self.load = load
+        self.items: List[Any] = []
+        self.charged = 0
+        self.spilled = 0
+        self.file = None
+        self.lock = threading.Lock()
+        budget.register(self)
+
+    def append(self, item: Any):
+        """Add item at the end of the list"""
+        size = sizeof(item)
+        with self.lock:
+            self.items.append(item)
+            self.charged += size
+
+        self.budget.charge(size)
+
+    def extend(self, items: Iterator[Any]):
+        """Append every item of items"""
+        for item in items:
+            self.append(item)
+
+    def spill(self):
+        """Move the items held in memory to the temporary file"""
+        with self.lock:
+            if self.file is None:
+                self.file = tempfile.NamedTemporaryFile(
+                    suffix='.pickle', dir=self.budget.directory)
+
+            for item in self.items:
+                pickle.dump(item, self.file, pickle.HIGHEST_PROTOCOL)
+            self.file.flush()
+
+            self.spilled += len(self.items)
+            self.items = []
+            charged, self.charged = self.charged, 0
+
+        self.budget.release(charged, spilled=True)
+
+    def __len__(self):
+        return self.spilled + len(self.items)
+
+    def __iter__(self) -> Iterator[Any]:
+        with self.lock:
+            spilled = self.spilled
+            items = list(self.items)
+            name = self.file.name if self.file else None
+
+        def stored():
+            if name:
+                with open(name, 'rb') as file:
+                    for _ in range(spilled):
+                        yield pickle.load(file)
+
+            yield from items
+
+        for item in stored():
+            yield self.load(item) if self.load else item
+
+    def close(self):
+        """Remove the temporary file and release the memory charged"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.items = []
+            charged, self.charged = self.charged, 0
+            self.spilled = 0
+
+        self.budget.release(charged)
+
+    def __del__(self):
+        if self.charged or self.file is not None:
+            self.close()
+
+
+class SpillSet():
+    """Set of str or bytes moving to an SQLite table once over budget
+
+    Args:
+        budget (MemoryBudget): budget the values in memory are charged to
+    """
+
+    def __init__(self, budget: MemoryBudget):
+        self.budget = budget
+        self.values: Set[Union[str, bytes]] = set()
+        self.charged = 0
+        self.stored = 0
+        self.database: Optional[sqlite3.Connection] = None
+        self.path: Optional[str] = None
+        self.lock = threading.Lock()
+        budget.register(self)
+
+    def _in_database(self, value: Union[str, bytes]) -> bool:
+        if self.database is None:
+            return False
+
+        return self.database.execute(
+            "SELECT 1 FROM items WHERE value = ?", (value,)).fetchone() is not None
+
+    def add(self, value: Union[str, bytes]):
+        """Add value to the set"""
+        with self.lock:
+            if value in self.values or self._in_database(value):
+                return
+
+            size = sizeof(value)
+            self.values.add(value)
+            self.charged += size
+
+        self.budget.charge(size)
+
+    def __contains__(self, value: Union[str, bytes]) -> bool:
+        with self.lock:
+            return value in self.values or self._in_database(value)
+
+    def spill(self):
+        """Move the values held in memory to the SQLite table"""
+        with self.lock:
+            if self.database is None:
+                handle, self.path = tempfile.mkstemp(suffix='.sqlite', dir=self.budget.directory)
+                os.close(handle)
+                self.database = sqlite3.connect(self.path, check_same_thread=False)
+                self.database.execute("PRAGMA journal_mode = OFF")
+                self.database.execute("PRAGMA synchronous = OFF")
+                self.database.execute("CREATE TABLE items (value PRIMARY KEY) WITHOUT ROWID")
+
+            self.database.executemany(
+                "INSERT INTO items VALUES (?)", ((value,) for value in self.values))
+            self.database.commit()
+
+            self.stored += len(self.values)
+            self.values = set()
+            charged, self.charged = self.charged, 0
+
+        self.budget.release(charged, spilled=True)
+
+    def __len__(self):
+        return self.stored + len(self.values)
+
+    def __iter__(self) -> Iterator[Union[str, bytes]]:
+        """Values of the set, which must not be modified while iterating"""
+        if self.database is not None:
+            for value, in self.database.execute("SELECT value FROM items"):
+                yield value
+
+        yield from list(self.values)
+
+    def close(self):
+        """Remove the SQLite file and release the memory charged"""
+        with self.lock:
+            if self.database is not None:
+                self.database.close()
+                os.remove(self.path)
+                self.database = None
+            self.values = set()
+            charged, self.charged = self.charged, 0
+            self.stored = 0
+
+        self.budget.release(charged)
+
+    def __del__(self):
+        if self.charged or self.database is not None:
+            self.close()
+
+
+class SpillDict():
+    """Mapping of str or bytes keys to picklable values moving to an SQLite table once over budget
+
+    Only get(), item assignment and items() are offered, enough for counters
+    updated with counts[key] = counts.get(key, 0) + 1.
+
+    Args:
+        budget (MemoryBudget): budget the entries in memory are charged to
+    """
+
+    def __init__(self, budget: MemoryBudget):
+        self.budget = budget
+        self.values: Dict[Union[str, bytes], Any] = {}
+        self.charged = 0
+        self.stored = 0
+        self.database: Optional[sqlite3.Connection] = None
+        self.path: Optional[str] = None
+        self.lock = threading.Lock()
+        budget.register(self)
+
+    def _from_database(self, key: Union[str, bytes]) -> Optional[tuple]:
+        if self.database is None:
+            return None
+
+        return self.database.execute("SELECT value FROM items WHERE key = ?", (key,)).fetchone()
+
+    def get(self, key: Union[str, bytes], default: Any = None) -> Any:
+        """Value of key, default when it is missing"""
+        with self.lock:
+            if key in self.values:
+                return self.values[key]
+
+            row = self._from_database(key)
+
+        return default if row is None else pickle.loads(row[0])
+
+    def __setitem__(self, key: Union[str, bytes], value: Any):
+        with self.lock:
+            if key in self.values:
+                self.values[key] = value
+                return
+
+            # the entry moves back to memory, the table keeps no stale copy
+            if self._from_database(key) is not None:
+                self.database.execute("DELETE FROM items WHERE key = ?", (key,))
+                self.stored -= 1
+
+            size = sizeof(key) + sizeof(value)
+            self.values[key] = value
+            self.charged += size
+
+        self.budget.charge(size)
+
+    def spill(self):
+        """Move the entries held in memory to the SQLite table"""
+        with self.lock:
+            if self.database is None:
+                handle, self.path = tempfile.mkstemp(suffix='.sqlite', dir=self.budget.directory)
+                os.close(handle)
+                self.database = sqlite3.connect(self.path, check_same_thread=False)
+                self.database.execute("PRAGMA journal_mode = OFF")
+                self.database.execute("PRAGMA synchronous = OFF")
+                self.database.execute("CREATE TABLE items (key PRIMARY KEY, value) WITHOUT ROWID")
+
+            self.database.executemany(
+                "INSERT INTO items VALUES (?, ?)",
+                ((key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) for key, value in self.values.items()))
+            self.database.commit()
+
+            self.stored += len(self.values)
+            self.values = {}
+            charged, self.charged = self.charged, 0
+
+        self.budget.release(charged, spilled=True)
+
+    def __len__(self):
+        return self.stored + len(self.values)
+
+    def items(self) -> Iterator[Tuple[Union[str, bytes], Any]]:
+        """Entries of the mapping, which must not be modified while iterating"""
+        if self.database is not None:
+            for key, value in self.database.execute("SELECT key, value FROM items"):
+                yield key, pickle.loads(value)
+
+        yield from list(self.values.items())
+
+    def close(self):
+        """Remove the SQLite file and release the memory charged"""
+        with self.lock:
+            if self.database is not None:
+                self.database.close()
+                os.remove(self.path)
+                self.database = None
+            self.values = {}
+            charged, self.charged = self.charged, 0
+            self.stored = 0
+
+        self.budget.release(charged)
+
+    def __del__(self):
+        if self.charged or self.database is not None:
+            self.close()
+
+
+def spillable_list() -> Union[list, SpillList]:
+    """List, spilling to disk when created inside a MemoryBudget"""
+    budget = _current.get()
+    if budget is None:
+        return []
+
+    return SpillList(budget)
+
+
+def spillable_set() -> Union[set, SpillSet]:
+    """Set of str or bytes, spilling to disk when created inside a MemoryBudget"""
+    budget = _current.get()
+    if budget is None:
+        return set()
+
+    return SpillSet(budget)
+
+
+def spillable_dict() -> Union[dict, SpillDict]:
+    """Dict of str or bytes keys, spilling to disk when created inside a MemoryBudget"""
+    budget = _current.get()
+    if budget is None:
+        return {}
+
+    return SpillDict(budget)
@@ -0,0 +1,251 @@
+"""Deadline, cancellation and progress shared by long running operations
+
+An OperationContext is activated with a with statement and found by every
+cursor, listing, bulk operation and sync running in it, threads started by
+tools.bounded_map included. They check it between requests, pages and rows,
+raising Cancelled once it is cancelled or its deadline passed, and report
+the items and bytes they process so callbacks can follow throughput.
+
+    with operation.OperationContext(timeout=3600, on_progress=print) as context:
+        bulk.delete(cursor)
+
+Only the outermost operation counts items: the rows of a cursor consumed
+by a bulk delete are reported once, by the delete.
+"""
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+_current: 'contextvars.ContextVar[Optional[OperationContext]]' = contextvars.ContextVar(
+    'operation', default=None)
+
+
+class Cancelled(Exception):
+    """The operation was cancelled"""
+
+
+class DeadlineExceeded(Cancelled):
+    """The deadline of the operation passed"""
+
+
+@dataclass
+class Progress():
+    """Throughput of an operation at one point in time"""
+    items: int
+    bytes: int
+    elapsed: float
+    in_flight: int
+    total: Optional[int] = None
+
+    @property
+    def items_per_second(self) -> float:
+        """Items processed per second since the start"""
+        return self.items / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        """Bytes processed per second since the start"""
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds left at the current rate, None without a total"""
+        if self.total is None or not self.items:
+            return None
+
+        return max(self.total - self.items, 0) / self.items_per_second
+
+    def __str__(self):
+        eta = '' if self.eta is None else f", eta {self.eta:.0f}s"
+        total = '' if self.total is None else f"/{self.total}"
+
+        return (
+            f"{self.items}{total} items, {self.bytes} bytes in {self.elapsed:.1f}s "
+            f"({self.items_per_second:.1f} items/s, {self.bytes_per_second:.0f} bytes/s), "
+            f"{self.in_flight} requests in flight{eta}")
+
+
+class OperationContext():
+    """Deadline, cancellation token and progress counters of an operation
+
+    Args:
+        timeout (float, optional): seconds the operation may run. Defaults to no deadline.
+        total (int, optional): expected number of items, enables the ETA. Defaults to None.
+        on_progress (Callable[[Progress], None], optional): called at most every
+            interval seconds while items are processed and once at the end. Defaults to None.
+        interval (float, optional): seconds between progress callbacks. Defaults to 1.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(
+            self, timeout: Optional[float] = None, total: Optional[int] = None,
+            on_progress: Optional[Callable[[Progress], None]] = None, interval: float = 1.0):
+        self.started = time.monotonic()
+        self.deadline = None if timeout is None else self.started + timeout
+        self.total = total
+        self.on_progress = on_progress
+        self.interval = interval
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.items = 0
+        self.bytes = 0
+        self.in_flight = 0
+        self.counted_by: Optional[object] = None
+        self.reported = self.started
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens.append(_current.set(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        _current.reset(self._tokens.pop())
+        if self.on_progress:
+            self.on_progress(self.progress())
+
+    def cancel(self):
+        """Ask every operation running in the context to stop at its next checkpoint"""
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """True once cancel() was called or the deadline passed"""
+        return self.cancel_event.is_set() or self.remaining() == 0
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, None without a deadline"""
+        if self.deadline is None:
+            return None
+
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def checkpoint(self):
+        """Raise Cancelled or DeadlineExceeded when the operation has to stop"""
+        if self.cancel_event.is_set():
+            raise Cancelled("Operation cancelled")
+
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise DeadlineExceeded("Operation deadline exceeded")
+
+    def timeout(self, default: Optional[float]) -> Optional[float]:
+        """Request timeout no longer than the time left before the deadline
+
+        A default of None, no timeout, is capped to the time left as well.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+
+        self.checkpoint()
+
+        return remaining if default is None else min(default, remaining)
+
+    def progress(self) -> Progress:
+        """Current progress of the operation"""
+        with self.lock:
+            return Progress(
+                self.items, self.bytes, time.monotonic() - self.started, self.in_flight, self.total)
+
+    def advance(self, items: int = 1, size: int = 0):
+        """Count processed items and bytes, calling on_progress when due"""
+        now = time.monotonic()
+        with self.lock:
+            self.items += items
+            self.bytes += size
+            due = self.on_progress is not None and now - self.reported >= self.interval
+            if due:
+                self.reported = now
+
+        if due:
+            self.on_progress(self.progress())
+
+    @contextlib.contextmanager
+    def request(self) -> Iterator[None]:
+        """Checkpoint, then count a request as in flight while the block runs"""
+        self.checkpoint()
+        with self.lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def current() -> Optional[OperationContext]:
+    """Context of the running operation, None outside of any"""
+    return _current.get()
+
+
+def checkpoint():
+    """Raise Cancelled when the current operation has to stop"""
+    context = _current.get()
+    if context is not None:
+        context.checkpoint()
+
+
+def timeout(default: Optional[float]) -> Optional[float]:
+    """Request timeout capped by the deadline of the current operation"""
+    context = _current.get()
+
+    return default if context is None else context.timeout(default)
+
+
+@contextlib.contextmanager
+def request() -> Iterator[None]:
+    """Track a request of the current operation, see OperationContext.request()"""
+    context = _current.get()
+    if context is None:
+        yield
+        return
+
+    with context.request():
+        yield
+
+
+class Counter():
+    """Progress counting of one operation, a no-op unless it is the outermost one
+
+    Create it while the operation starts, call advance() for every item
+    processed and release() when it finishes.
+    """
+
+    def __init__(self):
+        self.context = _current.get()
+        self.active = False
+        if self.context is not None:
+            with self.context.lock:
+                if self.context.counted_by is None:
+                    self.context.counted_by = self
+                    self.active = True
+
+    def advance(self, items: int = 1, size: int = 0):
+        """Checkpoint and count items and bytes processed"""
+        if self.context is None:
+            return
+
+        self.context.checkpoint()
+        if self.active:
+            self.context.advance(items, size)
+
+    def release(self):
+        """Let the next operation count"""
+        if self.active:
+            with self.context.lock:
+                self.context.counted_by = None
+            self.active = False
+
+
+def counted(items: Iterator, size: Callable[[object], int] = lambda item: 0) -> Iterator:
+    """Yield items, checkpointing and counting each as processed by the current operation"""
+    counter = Counter()
+    try:
+        for item in items:
+            counter.advance(1, size(item))
+            yield item
+    finally:
+        counter.release()
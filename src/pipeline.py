@@ -0,0 +1,181 @@
+"""Post-process AQL results on a pool of processes
+
+Once requests run in parallel, building objects, parsing dates or evaluating
+policies over millions of rows keeps a single Python process busy. A
+Pipeline streams raw AQL rows from a cursor in batches to worker processes,
+runs map and filter stages there and sends only their results back.
+
+Stages must be picklable, ie module level functions, and are called as
+stage(value, connection) where connection is a Connection owned by the
+worker process and reused for any follow up request. Results should be
+small plain values: they are pickled back to the parent.
+
+Batches run in an operation.OperationContext of the worker limited to the
+time left before the deadline of the parent's context, cancelling the
+parent stops submitting batches.
+"""
+import copy
+import logging
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+from . import aql
+from . import operation
+from . import resource
+from . import tools
+
+Stage = Callable[[Any, 'tools.Connection'], Any]
+SessionFactory = Callable[[], Any]
+
+# connection of the current worker process, created by _initialize
+_connection: Optional['tools.Connection'] = None
+
+
+def _initialize(
+        base_url: str, headers: Dict[str, str], node_urls: Optional[List[str]],
+        session_factory: Optional[SessionFactory] = None):
+    global _connection # pylint: disable=global-statement
+
+    if session_factory is not None:
+        session = session_factory()
+    else:
+        session = requests.Session()
+        session.headers.update(headers)
+        if node_urls:
+            session = tools.MultiNodeSession(session, node_urls)
+
+    _connection = tools.Connection(session=session, base_url=base_url)
+    _connection.repository_resolver = resource.RepositoryResolver(_connection)
+
+
+def _run_batch(
+        stages: List[Tuple[str, Stage]], rows: List[dict],
+        timeout: Optional[float] = None) -> List[Any]:
+    results = []
+
+    with operation.OperationContext(timeout=timeout) as context:
+        for value in rows:
+            context.checkpoint()
+            for kind, stage in stages:
+                if kind == 'map':
+                    value = stage(value, _connection)
+                elif not stage(value, _connection):
+                    break
+            else:
+                results.append(value)
+
+    return results
+
+
+def to_file(row: dict, connection: 'tools.Connection') -> 'resource.File':
+    """Map stage turning a raw AQL row into a File bound to the worker's connection"""
+    return aql.FileCursor(connection).to_file(row)
+
+
+class Pipeline():
+    """Map and filter stages applied to the rows of a cursor by worker processes
+
+    Args:
+        cursor (aql.FileCursor): query whose raw rows feed the pipeline
+        processes (int, optional): number of worker processes. Defaults to the number of CPUs.
+        batch_size (int, optional): rows shipped to a worker at once. Defaults to 1000.
+        ordered (bool, optional): yield results in the order of the rows instead
+            of as soon as a batch completes. Defaults to False.
+        session_factory (SessionFactory, optional): picklable callable creating
+            the session of each worker. Required unless the cursor's session
+            is a requests.Session, or a tools.MultiNodeSession over one, whose
+            headers and nodes are copied. Defaults to None.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(
+            self, cursor: 'aql.FileCursor', processes: Optional[int] = None,
+            batch_size: int = 1000, ordered: bool = False,
+            session_factory: Optional[SessionFactory] = None):
+        self.cursor = cursor
+        self.processes = processes
+        self.batch_size = batch_size
+        self.ordered = ordered
+        self.session_factory = session_factory
+        self.stages: List[Tuple[str, Stage]] = []
+
+    def _add(self, kind: str, stage: Stage) -> 'Pipeline':
+        pipeline = copy.copy(self)
+        pipeline.stages = self.stages + [(kind, stage)]
+
+        return pipeline
+
+    def map(self, stage: Stage) -> 'Pipeline':
+        """New pipeline replacing each value by stage(value, connection)"""
+        return self._add('map', stage)
+
+    def filter(self, stage: Stage) -> 'Pipeline':
+        """New pipeline dropping values for which stage(value, connection) is false"""
+        return self._add('filter', stage)
+
+    def _batches(self) -> Iterator[List[dict]]:
+        batch = []
+        for row in self.cursor.rows():
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def _initargs(self) -> Tuple[str, Dict[str, str], Optional[List[str]], Optional[SessionFactory]]:
+        connection = self.cursor.connection
+        if self.session_factory is not None:
+            return connection.base_url, {}, None, self.session_factory
+
+        session = connection.session
+        node_urls = None
+        if isinstance(session, tools.MultiNodeSession):
+            node_urls = [node.base_url for node in session.nodes]
+            session = session.session
+
+        if not isinstance(session, requests.Session):
+            raise TypeError(
+                f"Pipeline workers cannot rebuild a {type(connection.session).__name__}, "
+                "pass a session_factory")
+
+        return connection.base_url, dict(session.headers), node_urls, None
+
+    def __iter__(self) -> Iterator[Any]:
+        processes = self.processes or os.cpu_count() or 1
+
+        with ProcessPoolExecutor(
+                max_workers=processes, initializer=_initialize,
+                initargs=self._initargs()) as executor:
+            # at most two batches per worker are waiting so huge queries stream
+            limit = processes * 2
+            pending = deque()
+            batches = 0
+
+            def completed():
+                if self.ordered:
+                    yield from pending.popleft().result()
+                    return
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield from future.result()
+
+            context = operation.current()
+            for batch in self._batches():
+                timeout = context.remaining() if context else None
+                pending.append(executor.submit(_run_batch, self.stages, batch, timeout))
+                batches += 1
+                if len(pending) >= limit:
+                    yield from completed()
+
+            while pending:
+                yield from completed()
+
+            self.logger.debug("pipeline processed %s batches", batches)
@@ -0,0 +1,86 @@
+"""Bounded memory top-K and bottom-K rankings over AQL results"""
+import heapq
+import logging
+from typing import Any, List, Tuple, Union, TYPE_CHECKING
+
+from . import aql
+
+if TYPE_CHECKING:
+    from . import resource
+
+logger = logging.getLogger(__name__)
+
+Keys = Union[str, List[str]]
+
+# sort() is only supported by AQL on fields of the item itself
+SORTABLE_FIELDS = {
+    'repo', 'path', 'name', 'type', 'size', 'depth', 'created', 'created_by',
+    'modified', 'modified_by', 'updated', 'actual_sha1', 'actual_md5', 'sha256'}
+
+
+def _value(row: dict, key: str) -> Any:
+    """Value of key in a result row, stat.* keys are read from the nested stats"""
+    if key.startswith('stat.'):
+        stats = row.get('stats') or [{}]
+        return stats[0].get(key[len('stat.'):])
+
+    return row.get(key)
+
+
+def _sort_key(keys: List[str]):
+    def sort_key(row: dict) -> Tuple:
+        # missing values, ie files never downloaded, rank below any value
+        return tuple(
+            (value is not None, value)
+            for value in (_value(row, key) for key in keys))
+
+    return sort_key
+
+
+def _pushed_down(cursor: aql.FileCursor, keys: List[str]) -> bool:
+    return (
+        all(key in SORTABLE_FIELDS for key in keys)
+        and cursor.sort_order is None
+        and cursor.row_limit is None)
+
+
+def _rank(cursor: aql.FileCursor, k: int, keys: Keys, largest: bool) -> List['resource.File']:
+    keys = [keys] if isinstance(keys, str) else list(keys)
+
+    if _pushed_down(cursor, keys):
+        logger.debug("pushing sort on %s and limit %s down to AQL", keys, k)
+        # page() copies the cursor so the caller's query is left untouched
+        cursor = cursor.page(0, k).sort({"$desc" if largest else "$asc": keys})
+        return [cursor.to_file(row) for row in cursor.rows()]
+
+    select = heapq.nlargest if largest else heapq.nsmallest
+    rows = select(k, cursor.rows(), key=_sort_key(keys))
+
+    return [cursor.to_file(row) for row in rows]
+
+
+def top_k(cursor: aql.FileCursor, k: int, keys: Keys = 'size') -> List['resource.File']:
+    """K files with the largest keys, largest first
+
+    Sorting on item fields is pushed down to Artifactory with sort() and
+    limit(). Other keys, ie stat.downloaded, are ranked client side with a heap
+    of K rows while the results are streamed.
+
+    Args:
+        cursor (aql.FileCursor): query without sort or limit, whose include()
+            covers keys
+        k (int): number of files returned
+        keys (Keys, optional): field or fields ranked. Defaults to 'size'.
+
+    Returns:
+        List[resource.File]: at most k files
+    """
+    return _rank(cursor, k, keys, largest=True)
+
+
+def bottom_k(cursor: aql.FileCursor, k: int, keys: Keys = 'size') -> List['resource.File']:
+    """K files with the smallest keys, smallest first, see top_k()
+
+    Files without a value for a key, ie never downloaded, rank first.
+    """
+    return _rank(cursor, k, keys, largest=False)
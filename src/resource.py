@@ -1,15 +1,22 @@
 """Classes representing different types of data in Artifactory"""
 import logging
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from enum import Enum
 from datetime import datetime, timezone
 from types import SimpleNamespace
-from typing import List, Optional, TYPE_CHECKING, Union
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, TYPE_CHECKING, Union
 from requests import exceptions
 
 from hurry.filesize import size
 
+from . import operation
+from . import tools
+
 if TYPE_CHECKING:
-    from . import tools
+    from . import usage
 
 
 class RepositoryType(Enum):
@@ -53,6 +60,17 @@ class PackageType(Enum):
     GENERIC = 'Generic'
 
 
+class ListEntry(NamedTuple):
+    """Lightweight entry of a storage file list, uri is relative to the listed directory"""
+    uri: str
+    size: int
+    last_modified: Optional[str]
+    folder: bool
+    sha1: Optional[str] = None
+    sha2: Optional[str] = None
+    md_timestamps: Optional[dict] = None
+
+
 class RepositoriesMixin: # pylint: disable=too-few-public-methods
     """Mixin supporting a request to list all repositories in Artifactory"""
 
@@ -77,8 +95,6 @@ class RepositoriesMixin: # pylint: disable=too-few-public-methods
         if package_type:
             params['packageType'] = package_type.value
 
-        response = self.connection.session.get(url, params=params)
-
         repositories = [
             Repository(
                 self.connection,
@@ -87,12 +103,167 @@ class RepositoriesMixin: # pylint: disable=too-few-public-methods
                 repository['url'],
                 PackageType(repository['packageType']))
 
-            for repository in response.json()
+            for repository in self.connection.get_json(url, params=params)
         ]
 
         return repositories
 
 
+@dataclass
+class RepositorySummary():
+    """Totals of a repository as reported by the storage summary"""
+    key: str
+    repository_type: str
+    package_type: Optional[str]
+    files_count: int
+    folders_count: int
+    items_count: int
+    used_space: int
+
+
+class StorageSummaryMixin: # pylint: disable=too-few-public-methods
+    """Mixin supporting a request for the storage summary of every repository"""
+
+    connection: 'tools.Connection'
+
+    units = {'bytes': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4}
+
+    def _used_space(self, summary: dict) -> int:
+        if 'usedSpaceInBytes' in summary:
+            return int(summary['usedSpaceInBytes'])
+
+        match = re.match(r'([\d.,]+)\s*(\w+)', summary.get('usedSpace', ''))
+        if not match:
+            return 0
+
+        return int(float(match.group(1).replace(',', '')) * self.units.get(match.group(2), 1))
+
+    def get_storage_summary(self) -> List[RepositorySummary]:
+        """Repository totals computed by Artifactory, far cheaper than
+        listing a repository when only its size and file count are needed
+
+        Returns:
+            List[RepositorySummary]: one summary per repository
+        """
+        url = '/'.join([
+            self.connection.base_url,
+            'api/storageinfo'])
+
+        summaries = [
+            RepositorySummary(
+                summary['repoKey'],
+                summary.get('repoType'),
+                summary.get('packageType'),
+                summary.get('filesCount', 0),
+                summary.get('foldersCount', 0),
+                summary.get('itemsCount', 0),
+                self._used_space(summary))
+
+            for summary in self.connection.get_json(url)['repositoriesSummaryList']
+            if summary['repoKey'] != 'TOTAL'
+        ]
+
+        return summaries
+
+
+class RepositoryResolver():
+    """Resolve files requested through a virtual repository to the member
+    repository actually storing them
+
+    Storage API calls such as ?stats fail for files in virtual repositories.
+    Repository types and virtual members are read once from the repository
+    configuration, and the cache_size most recently resolved paths are cached
+    so a file is only looked up once. Paths no member holds are looked up
+    again on the next call, the file may have been deployed since.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, connection: 'tools.Connection', cache_size: int = 65536):
+        self.connection = connection
+        self.cache_size = cache_size
+        self.repository_types: Optional[Dict[str, str]] = None
+        self.virtual_members: Dict[str, List[str]] = {}
+        self.locations: 'OrderedDict[Tuple[str, str], str]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _types(self) -> Dict[str, str]:
+        if self.repository_types is None:
+            url = '/'.join([self.connection.base_url, 'api/repositories'])
+            self.repository_types = {
+                repository['key']: repository['type'].upper()
+                for repository in self.connection.get_json(url)}
+
+        return self.repository_types
+
+    def is_virtual(self, repo: str) -> bool:
+        """True if repo is a virtual repository"""
+        return self._types().get(repo) == RepositoryType.VIRTUAL.name
+
+    def members(self, repo: str) -> List[str]:
+        """Repositories storing the files of a virtual repository, in resolution order
+
+        Nested virtual repositories are expanded and remote repositories are
+        replaced by their cache.
+        """
+        if repo in self.virtual_members:
+            return self.virtual_members[repo]
+
+        url = '/'.join([self.connection.base_url, 'api/repositories', repo])
+        members = []
+        for member in self.connection.get_json(url).get('repositories', []):
+            member_type = self._types().get(member)
+            if member_type == RepositoryType.VIRTUAL.name:
+                members.extend(self.members(member))
+            elif member_type == RepositoryType.REMOTE.name:
+                members.append(f"{member}-cache")
+            else:
+                members.append(member)
+
+        self.virtual_members[repo] = members
+
+        return members
+
+    def resolve(self, repo: str, path: str) -> str:
+        """Repository storing path, repo itself unless it is virtual
+
+        Args:
+            repo (str): repository the file was requested through
+            path (str): path of the file in repo
+
+        Returns:
+            str: key of the repository holding the file, repo when no member holds it
+        """
+        if not self.is_virtual(repo):
+            return repo
+
+        with self.lock:
+            location = self.locations.get((repo, path))
+            if location:
+                self.locations.move_to_end((repo, path))
+                return location
+
+        for member in self.members(repo):
+            url = '/'.join([self.connection.base_url, 'api/storage', member, path])
+            with operation.request():
+                response = self.connection.session.head(
+                    url, timeout=operation.timeout(self.connection.session_timeout))
+            if response.ok:
+                location = member
+                break
+
+        if not location:
+            self.logger.debug("no member of %s holds %s", repo, path)
+            return repo
+
+        self.logger.debug("resolved %s/%s to %s", repo, path, location)
+        with self.lock:
+            self.locations[(repo, path)] = location
+            while len(self.locations) > self.cache_size:
+                self.locations.popitem(last=False)
+
+        return location
+
+
 class RepositoryMixin: # pylint: disable=too-few-public-methods
     """Mixin supporting a request to retrieve a single repository in Artifactory"""
 
@@ -108,8 +279,6 @@ class RepositoryMixin: # pylint: disable=too-few-public-methods
             self.connection.base_url,
             'api/repositories'])
 
-        response = self.connection.session.get(url)
-
         repository, = [
             Repository(
                 self.connection,
@@ -118,7 +287,7 @@ class RepositoryMixin: # pylint: disable=too-few-public-methods
                 repository['url'],
                 PackageType(repository['packageType']))
 
-            for repository in response.json()
+            for repository in self.connection.get_json(url)
             if repository['key'] == key
         ]
 
@@ -149,7 +318,177 @@ class ParentMixin(RepositoryMixin): # pylint: disable=too-few-public-methods
         return repository
 
 
-class Directory(ParentMixin):
+Properties = Dict[str, List[str]]
+
+
+class PropertiesMixin:
+    """Mixin reading and writing the properties of a File or Directory"""
+
+    connection: 'tools.Connection'
+    path: str
+    repo: str
+    logger: logging.Logger
+
+    @staticmethod
+    def _escape(value: str) -> str:
+        return re.sub(r'([\\,|=;])', r'\\\1', str(value))
+
+    def _properties_url(self) -> str:
+        url_parts = [
+            self.connection.base_url, 'api/storage', self.repo]
+        if self.path:
+            url_parts.append(self.path)
+
+        return '/'.join(url_parts)
+
+    def get_properties(self) -> Properties:
+        """Properties of the item, values are lists as properties are multi valued
+
+        Items returned by an AQL query including property.* already hold their
+        properties and no request is made.
+
+        Returns:
+            Properties: property names mapped to their values
+        """
+        aql_properties = self.__dict__.get('properties')
+        if aql_properties is not None:
+            properties: Properties = {}
+            for aql_property in aql_properties:
+                properties.setdefault(aql_property['key'], []).append(aql_property.get('value'))
+            return properties
+
+        with operation.request():
+            response = self.connection.session.get(
+                self._properties_url(),
+                params='properties',
+                timeout=operation.timeout(self.connection.session_timeout))
+
+        if response.status_code == 404:
+            return {}
+
+        response.raise_for_status()
+
+        return response.json().get('properties', {})
+
+    def set_properties(
+            self, properties: Dict[str, Union[str, List[str]]], recursive: bool = False) -> bool:
+        """Add or replace properties of the item
+
+        Args:
+            properties (Dict[str, Union[str, List[str]]]): property names mapped
+                to a value or a list of values
+            recursive (bool, optional): for directories, also set the properties
+                on everything below. Defaults to False.
+
+        Returns:
+            True if the properties were set
+        """
+        encoded = ';'.join(
+            f"{self._escape(key)}="
+            + ','.join(self._escape(value) for value in ([values] if isinstance(values, str) else values))
+            for key, values in properties.items())
+
+        self.logger.info("setting properties on %s/%s", self.repo, self.path)
+        with operation.request():
+            response = self.connection.session.put(
+                self._properties_url(),
+                params={'properties': encoded, 'recursive': int(recursive)},
+                timeout=operation.timeout(self.connection.session_timeout))
+
+        return response.ok
+
+    def delete_properties(self, keys: List[str], recursive: bool = False) -> bool:
+        """Remove properties from the item
+
+        Args:
+            keys (List[str]): property names
+            recursive (bool, optional): for directories, also remove the properties
+                from everything below. Defaults to False.
+
+        Returns:
+            True if the properties were removed
+        """
+        with operation.request():
+            response = self.connection.session.delete(
+                self._properties_url(),
+                params={
+                    'properties': ','.join(self._escape(key) for key in keys),
+                    'recursive': int(recursive)},
+                timeout=operation.timeout(self.connection.session_timeout))
+
+        return response.ok
+
+
+class TransferMixin:
+    """Mixin copying or moving a File or Directory server side"""
+
+    connection: 'tools.Connection'
+    path: str
+    repo: str
+    logger: logging.Logger
+
+    def _transfer(
+            self, action: str, target_repo: str, target_path: Optional[str],
+            dry_run: bool) -> bool:
+        url_parts = [
+            self.connection.base_url, f'api/{action}', self.repo]
+        if self.path:
+            url_parts.append(self.path)
+
+        url = '/'.join(url_parts)
+
+        target_parts = ['', target_repo]
+        target_path = self.path if target_path is None else target_path
+        if target_path:
+            target_parts.append(target_path)
+
+        params = {'to': '/'.join(target_parts)}
+        if dry_run:
+            params['dry'] = 1
+
+        self.logger.info(
+            "%s Artifactory item %s/%s to %s%s",
+            action, self.repo, self.path, params['to'], ' (dry run)' if dry_run else '')
+
+        with operation.request():
+            response = self.connection.session.post(
+                url, params=params, timeout=operation.timeout(self.connection.session_timeout))
+
+        if not response.ok:
+            self.logger.warning("%s of %s/%s failed: %s", action, self.repo, self.path, response.text)
+
+        return response.ok
+
+    def copy(self, target_repo: str, target_path: Optional[str] = None, dry_run: bool = False) -> bool:
+        """Copy the item within Artifactory, no bytes go through the client
+
+        Args:
+            target_repo (str): repository receiving the copy
+            target_path (str, optional): path in target_repo. Defaults to the same path.
+            dry_run (bool, optional): let Artifactory validate the copy without
+                performing it. Defaults to False.
+
+        Returns:
+            True if the item was copied, or would be for a dry run
+        """
+        return self._transfer('copy', target_repo, target_path, dry_run)
+
+    def move(self, target_repo: str, target_path: Optional[str] = None, dry_run: bool = False) -> bool:
+        """Move the item within Artifactory, no bytes go through the client
+
+        Args:
+            target_repo (str): repository receiving the item
+            target_path (str, optional): path in target_repo. Defaults to the same path.
+            dry_run (bool, optional): let Artifactory validate the move without
+                performing it. Defaults to False.
+
+        Returns:
+            True if the item was moved, or would be for a dry run
+        """
+        return self._transfer('move', target_repo, target_path, dry_run)
+
+
+class Directory(ParentMixin, PropertiesMixin, TransferMixin):
     """Methods to represent a directory in Artifactory"""
     logger = logging.getLogger(__name__)
 
@@ -170,6 +509,29 @@ class Directory(ParentMixin):
     def __repr__(self):
         return f"Directory({self.repo}, {self.path})"
 
+    def iter_children(self) -> Iterator[Union['Directory', 'File']]:
+        """Stream child files and directories contained within
+            this directory.
+
+        The children array is parsed as it arrives instead of loading the
+        whole listing, unless the context was already retrieved.
+
+        Yields:
+            Union[Directory, File]: directories and files
+        """
+        if self._context:
+            children = iter(self._context['children'])
+        else:
+            children = self._stream(None, 'children')
+
+        for child in children:
+            child_path = self.path + child['uri'] if self.path else child['uri']
+
+            if child['folder']:
+                yield Directory(self.connection, self.repo, child_path)
+            else:
+                yield File(self.connection, self.repo, child_path)
+
     def children(self):
         """List child files and directories contained within
             this directory.
@@ -178,23 +540,9 @@ class Directory(ParentMixin):
             List[Union[Directory, File]]: a list of directories
                 and files represented by Directory and File
         """
-        children = []
+        _ = self.context
 
-        for child in self.context['children']:
-            if child['folder']:
-                children.append(
-                    Directory(
-                        self.connection,
-                        self.repo,
-                        self.path + child['uri'] if self.path else child['uri']))
-            else:
-                children.append(
-                    File(
-                        self.connection,
-                        self.repo,
-                        self.path + child['uri'] if self.path else child['uri']))
-
-        return children
+        return list(self.iter_children())
 
     @property
     def context(self):
@@ -207,22 +555,76 @@ class Directory(ParentMixin):
 
             url = '/'.join(url_parts)
 
-            response = self.connection.session.get(url)
-
-            self._context = response.json()
+            self._context = self.connection.get_json(url)
 
         return self._context
 
+    def refresh(self) -> 'Directory':
+        """Revalidate the stored context with Artifactory, an unchanged
+        directory costs a 304 response instead of the full listing
+
+        Returns:
+            Directory: this directory
+        """
+        self._context = None
+        _ = self.context
+
+        return self
+
     @property
     def uri(self):
         """URL for the directory location in Artifactory"""
         return self.context['uri']
 
-    def file_list(self) -> dict:
-        """Get a flat (the default) or deep listing of the files and folders
+    @staticmethod
+    def _list_params(
+            deep: bool, depth: Optional[int], list_folders: bool, md_timestamps: bool) -> str:
+        param_dict = {
+            'list': None,
+            'deep': int(deep),
+            'depth': depth,
+            'listFolders': int(list_folders),
+            'mdTimestamps': int(md_timestamps)}
+
+        return '&'.join([
+            k if k == 'list' else f"{k}={v}"
+            for k, v in param_dict.items() if k == 'list' or v is not None])
+
+    def _stream(self, params: Optional[str], key: str) -> Iterator[dict]:
+        """Stream the elements of array key of a storage API response"""
+        url_parts = [
+            self.connection.base_url, 'api/storage', self.repo]
+        if self.path:
+            url_parts.append(self.path)
+
+        url = '/'.join(url_parts)
+
+        with operation.request():
+            response = self.connection.session.get(
+                url, params=params, stream=True,
+                timeout=operation.timeout(self.connection.session_timeout))
+        response.raise_for_status()
+
+        try:
+            yield from operation.counted(
+                tools.iter_json_array(response.iter_content(65536), key),
+                lambda entry: entry.get('size') or 0)
+        finally:
+            response.close()
+
+    def file_list(
+            self, deep: bool = True, depth: Optional[int] = None,
+            list_folders: bool = False, md_timestamps: bool = False) -> dict:
+        """Get a flat or deep (the default) listing of the files and folders
         (not included by default) within a folder. For deep listing you can
         specify an optional depth to limit the results.
 
+        Args:
+            deep (bool, optional): list the content of sub folders. Defaults to True.
+            depth (int, optional): limit of a deep listing. Defaults to None.
+            list_folders (bool, optional): include folders. Defaults to False.
+            md_timestamps (bool, optional): include metadata timestamps. Defaults to False.
+
         Returns:
             dict: dictionary containing keys uri, created, files
         """
@@ -233,13 +635,38 @@ class Directory(ParentMixin):
 
         url = '/'.join(url_parts)
 
-        param_dict = {'list': None, 'deep': 1, 'ListFolders': 0, 'mdTimestamps': 0}
-        param_str = '&'.join([k if v is None else f"{k}={v}" for k, v in param_dict.items()])
+        param_str = self._list_params(deep, depth, list_folders, md_timestamps)
 
         response = self.connection.session.get(url, params=param_str)
 
         return response.json()
 
+    def iter_file_list(
+            self, deep: bool = True, depth: Optional[int] = None,
+            list_folders: bool = False, md_timestamps: bool = False) -> Iterator[ListEntry]:
+        """Stream the listing of file_list() one entry at a time
+
+        Args:
+            deep (bool, optional): list the content of sub folders. Defaults to True.
+            depth (int, optional): limit of a deep listing. Defaults to None.
+            list_folders (bool, optional): include folders. Defaults to False.
+            md_timestamps (bool, optional): include metadata timestamps. Defaults to False.
+
+        Yields:
+            ListEntry: files, and folders when requested, as they are parsed
+        """
+        param_str = self._list_params(deep, depth, list_folders, md_timestamps)
+
+        for entry in self._stream(param_str, 'files'):
+            yield ListEntry(
+                entry['uri'],
+                entry.get('size', 0),
+                entry.get('lastModified'),
+                entry.get('folder', False),
+                entry.get('sha1'),
+                entry.get('sha2'),
+                entry.get('mdTimestamps'))
+
     def size(self, human_readable = False) -> Union[int, str]:
         """Determine the file size of all files contained within the directory
 
@@ -250,17 +677,33 @@ class Directory(ParentMixin):
         Returns:
             Union[int, str]: Either an int representing bytes or human readable string.
         """
-        file_list = self.file_list()
-
         file_size = 0
-        for file in file_list['files']:
-            file_size += file['size']
+        for entry in self.iter_file_list():
+            file_size += entry.size
 
         if human_readable:
             return size(file_size)
 
         return file_size
 
+    def du(self, depth: Optional[int] = None, source: str = 'list') -> 'usage.Usage':
+        """Size and file count of every sub folder built in a single pass
+
+        Args:
+            depth (int, optional): deepest level of sub folders reported. Defaults to None.
+            source (str, optional): 'list' to stream one deep file listing or
+                'aql' to page through AQL results projecting only sizes. Defaults to 'list'.
+
+        Returns:
+            usage.Usage: tree of folder usage rooted at this directory
+        """
+        from . import usage # pylint: disable=import-outside-toplevel
+
+        if source == 'aql':
+            return usage.from_aql(self, depth)
+
+        return usage.from_file_list(self, depth)
+
     def delete(self) -> bool:
         """Delete the directory from Artifactory
 
@@ -277,7 +720,9 @@ class Directory(ParentMixin):
 
         url = '/'.join(url_parts)
 
-        response = self.connection.session.delete(url, timeout=self.connection.session_timeout)
+        with operation.request():
+            response = self.connection.session.delete(
+                url, timeout=operation.timeout(self.connection.session_timeout))
 
         if response.ok:
             return True
@@ -308,7 +753,7 @@ class Repository(Directory):
         return f'<{self.__class__.__name__} {self.repo}>'
 
 
-class File(SimpleNamespace, ParentMixin):
+class File(SimpleNamespace, ParentMixin, PropertiesMixin, TransferMixin):
     """Methods to represent a file in Artifactory"""
     logger = logging.getLogger(__name__)
 
@@ -370,6 +815,16 @@ class File(SimpleNamespace, ParentMixin):
     def __repr__(self):
         return f"File({self.repo}, {self.path})"
 
+    @property
+    def storage_repo(self) -> str:
+        """Repository storing the file, the member repository when
+        repo is virtual and the connection has a repository resolver"""
+        resolver = self.connection.repository_resolver
+        if resolver is None:
+            return self.repo
+
+        return resolver.resolve(self.repo, self.path)
+
     def file_statistics(self):
         """Query and cache information about file
         statistics generated by Artifactory using File Statistics
@@ -384,16 +839,17 @@ class File(SimpleNamespace, ParentMixin):
             self.path)
 
         url_parts = [
-            self.connection.base_url, 'api/storage', self.repo]
+            self.connection.base_url, 'api/storage', self.storage_repo]
         if self.path:
             url_parts.append(self.path)
 
         url = '/'.join(url_parts)
 
-        response = self.connection.session.get(
-            url,
-            params='stats',
-            timeout=self.connection.session_timeout)
+        with operation.request():
+            response = self.connection.session.get(
+                url,
+                params='stats',
+                timeout=operation.timeout(self.connection.session_timeout))
         try:
             response.raise_for_status()
         except exceptions.HTTPError as err:
@@ -420,18 +876,31 @@ class File(SimpleNamespace, ParentMixin):
             self.path)
 
         url_parts = [
-            self.connection.base_url, 'api/storage', self.repo]
+            self.connection.base_url, 'api/storage', self.storage_repo]
         if self.path:
             url_parts.append(self.path)
 
         url = '/'.join(url_parts)
 
-        response = self.connection.session.get(url)
-
-        file_info = response.json()
+        file_info = self.connection.get_json(url)
 
         return file_info
 
+    def refresh(self) -> 'File':
+        """Revalidate file info with Artifactory, an unchanged
+        file costs a 304 response instead of the full document
+
+        Returns:
+            File: this file
+        """
+        # repo and path of the answer are the storage repository and a path
+        # with a leading slash, the file keeps the ones it was created with
+        metadata = {
+            key: value for key, value in self.file_info().items() if key not in ('repo', 'path')}
+        vars(self).update(metadata)
+
+        return self
+
     @property
     def date_downloaded(self):
         """Query Artifactory and cache the
@@ -479,7 +948,9 @@ class File(SimpleNamespace, ParentMixin):
 
         url = '/'.join(url_parts)
 
-        response = self.connection.session.delete(url)
+        with operation.request():
+            response = self.connection.session.delete(
+                url, timeout=operation.timeout(self.connection.session_timeout))
 
         if response.ok:
             return True
@@ -0,0 +1,227 @@
+"""Declarative retention policies evaluated over streamed AQL results
+
+A policy is a list of rules for a single repository. Filter rules select the
+files eligible for deletion, keep rules spare the newest versions of every
+package and protect rules exclude files from the policy entirely, ie:
+
+    policy = Policy('npm-local', [
+        KeepLatest(5),
+        NotDownloadedSince(180),
+        Protect('@release', 'true')])
+
+    report = policy.apply(connection, dry_run=True)
+
+Filters are compiled into the AQL query whenever possible. When a KeepLatest
+rule is present versions have to be ranked across every file, old or not, so
+filters are then evaluated client side on the fields included in the query,
+streamed twice: once to rank versions, once to yield the files of old ones.
+"""
+import abc
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from . import aql
+from . import bulk
+from . import tools
+
+if TYPE_CHECKING:
+    from . import resource
+
+
+class Rule(abc.ABC):
+    """Base class of retention rules"""
+    fields: Tuple[str, ...] = ()
+
+    @abc.abstractmethod
+    def criteria(self) -> dict:
+        """AQL criteria matching the files this rule applies to"""
+
+    @abc.abstractmethod
+    def matches(self, file: 'resource.File', now: datetime) -> bool:
+        """Client side equivalent of criteria()"""
+
+
+@dataclass
+class OlderThan(Rule):
+    """Files created more than days ago"""
+    days: int
+    fields = ('created',)
+
+    def criteria(self) -> dict:
+        return {"created": {"$before": f"{self.days}d"}}
+
+    def matches(self, file: 'resource.File', now: datetime) -> bool:
+        return tools.parse_timestamp(file.created) < now - timedelta(days=self.days)
+
+
+@dataclass
+class NotDownloadedSince(Rule):
+    """Files not downloaded in days, files never downloaded count from their creation"""
+    days: int
+    fields = ('created', 'stat.downloaded')
+
+    def criteria(self) -> dict:
+        before = {"$before": f"{self.days}d"}
+
+        return {"$or": [
+            {"stat.downloaded": before},
+            {"$and": [{"stat.downloaded": {"$eq": None}}, {"created": before}]}]}
+
+    def matches(self, file: 'resource.File', now: datetime) -> bool:
+        stats = getattr(file, 'stats', None) or [{}]
+        downloaded = stats[0].get('downloaded') or file.created
+
+        return tools.parse_timestamp(downloaded) < now - timedelta(days=self.days)
+
+
+@dataclass
+class Protect():
+    """Never touch files whose field matches pattern
+
+    field is any AQL item field, or a property prefixed with @, and pattern
+    uses AQL $match wildcards.
+    """
+    field: str
+    pattern: str
+
+    def criteria(self) -> dict:
+        if self.field.startswith('@'):
+            # files without the property at all must stay eligible
+            return {"$or": [
+                {self.field: {"$nmatch": self.pattern}},
+                {self.field: {"$eq": None}}]}
+
+        return {self.field: {"$nmatch": self.pattern}}
+
+
+def version_of(file: 'resource.File') -> Tuple[str, str]:
+    """Default grouping of KeepLatest, files in pkg/1.0/ are version pkg/1.0 of package pkg"""
+    folder = file.path.rsplit('/', 1)[0]
+    package = folder.rsplit('/', 1)[0] if '/' in folder else ''
+
+    return package, folder
+
+
+@dataclass
+class KeepLatest():
+    """Keep the count newest versions of every package
+
+    key maps a file to its (package, version) pair, files of a package do not
+    need to be next to each other in the results.
+    """
+    count: int
+    key: Callable[['resource.File'], Tuple[str, str]] = version_of
+    fields = ('created',)
+
+
+class Policy():
+    """Set of retention rules for one repository"""
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, repo: str, rules: List[object]):
+        self.repo = repo
+        self.filters = [rule for rule in rules if isinstance(rule, Rule)]
+        self.protects = [rule for rule in rules if isinstance(rule, Protect)]
+        self.keeps = [rule for rule in rules if isinstance(rule, KeepLatest)]
+
+        if len(self.keeps) > 1:
+            raise ValueError("A policy supports a single KeepLatest rule")
+
+    def query(self) -> dict:
+        """Narrowest AQL criteria for this policy"""
+        criteria = [{"repo": self.repo}, {"type": "file"}]
+        criteria.extend(protect.criteria() for protect in self.protects)
+
+        if not self.keeps:
+            criteria.extend(rule.criteria() for rule in self.filters)
+
+        return {"$and": criteria}
+
+    def include(self) -> List[str]:
+        """Minimum set of fields required to evaluate the policy and report bytes"""
+        fields = ['repo', 'path', 'name', 'size']
+
+        if self.keeps:
+            for rule in [*self.filters, *self.keeps]:
+                fields.extend(field for field in rule.fields if field not in fields)
+
+        return fields
+
+    def cursor(self, connection: 'tools.Connection') -> aql.FileCursor:
+        """FileCursor running the compiled query"""
+        return aql.FileCursor(connection).find(self.query()).include(self.include())
+
+    def _expired(self, cursor: aql.FileCursor) -> Dict[str, Set[str]]:
+        """First pass: the versions of every package older than the newest ones
+
+        Only the newest created timestamp of each version is held in memory,
+        not the files, so packages do not need to be contiguous in the results.
+        """
+        keep = self.keeps[0]
+        newest: Dict[str, Dict[str, str]] = defaultdict(dict)
+
+        for row in cursor.rows():
+            package, version = keep.key(cursor.to_file(row))
+            versions = newest[package]
+            versions[version] = max(versions.get(version, ''), row.get('created') or '')
+
+        return {
+            package: set(sorted(versions, key=versions.get, reverse=True)[keep.count:])
+            for package, versions in newest.items()}
+
+    def candidates(
+            self, connection: 'tools.Connection',
+            now: Optional[datetime] = None) -> Iterator['resource.File']:
+        """Files the policy would delete, streamed from the query
+
+        With a KeepLatest rule the query is streamed twice: once to rank the
+        versions of every package, once to yield the files of older versions.
+        Versions first seen in the second pass, ie uploaded in between, are kept.
+
+        Args:
+            connection (tools.Connection): connection to Artifactory
+            now (datetime, optional): reference time of age rules. Defaults to now.
+
+        Yields:
+            resource.File: files eligible for deletion
+        """
+        now = now or datetime.now(timezone.utc)
+        cursor = self.cursor(connection)
+
+        if not self.keeps:
+            for row in cursor.rows():
+                yield cursor.to_file(row)
+            return
+
+        keep = self.keeps[0]
+        expired = self._expired(cursor)
+
+        for row in cursor.rows():
+            file = cursor.to_file(row)
+            package, version = keep.key(file)
+            if version not in expired.get(package, ()):
+                continue
+
+            if all(rule.matches(file, now) for rule in self.filters):
+                yield file
+
+    def apply(
+            self, connection: 'tools.Connection', dry_run: bool = True,
+            max_workers: int = 8) -> bulk.Report:
+        """Delete every candidate file
+
+        Args:
+            connection (tools.Connection): connection to Artifactory
+            dry_run (bool, optional): only report what would be deleted. Defaults to True.
+            max_workers (int, optional): number of concurrent deletes. Defaults to 8.
+
+        Returns:
+            bulk.Report: ledger of deleted files
+        """
+        report = bulk.delete(self.candidates(connection), max_workers=max_workers, dry_run=dry_run)
+        self.logger.info("retention policy on %s: %s", self.repo, report)
+
+        return report
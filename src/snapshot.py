@@ -0,0 +1,228 @@
+"""Snapshots of repository contents and streaming diffs between them
+
+A snapshot is a gzip compressed, tab separated file holding the path, sha1,
+size and modification date of every file of a repository, sorted by path.
+Because both sides are sorted, two snapshots are compared with a single
+merge pass holding one entry of each in memory.
+"""
+import csv
+import gzip
+import heapq
+import io
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, NamedTuple, Optional, TYPE_CHECKING
+
+from . import aql
+
+if TYPE_CHECKING:
+    from . import tools
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ['path', 'sha1', 'size', 'modified']
+
+
+class Entry(NamedTuple):
+    """File recorded in a snapshot, path includes the folders but not the repository"""
+    path: str
+    sha1: str
+    size: int
+    modified: str
+
+
+class Difference(NamedTuple):
+    """Change of one path between two snapshots"""
+    kind: str
+    path: str
+    old: Optional[Entry]
+    new: Optional[Entry]
+
+
+@dataclass
+class SnapshotDiff():
+    """Totals of the differences between two snapshots"""
+    added: int = 0
+    removed: int = 0
+    changed: int = 0
+    added_bytes: int = 0
+    removed_bytes: int = 0
+    changed_bytes: int = 0
+
+    @property
+    def net_bytes(self) -> int:
+        """Growth of the repository in bytes, negative when it shrank"""
+        return self.added_bytes - self.removed_bytes + self.changed_bytes
+
+    def __str__(self):
+        return (
+            f"{self.added} added (+{self.added_bytes} bytes), "
+            f"{self.removed} removed (-{self.removed_bytes} bytes), "
+            f"{self.changed} changed ({self.changed_bytes:+} bytes), "
+            f"net {self.net_bytes:+} bytes")
+
+
+def _write_entries(entries: Iterable[Entry], output: io.TextIOBase):
+    writer = csv.writer(output, dialect='excel-tab', lineterminator='\n')
+    writer.writerows(entries)
+
+
+def _read_entries(lines: Iterable[str]) -> Iterator[Entry]:
+    for path, sha1, size, modified in csv.reader(lines, dialect='excel-tab'):
+        yield Entry(path, sha1, int(size), modified)
+
+
+def _sorted(entries: Iterable[Entry], run_size: int) -> Iterator[Entry]:
+    """Sort entries by path holding at most run_size of them in memory
+
+    Sorted runs are spilled to temporary files and merged when the input does
+    not fit in a single run.
+    """
+    runs: List[str] = []
+    run: List[Entry] = []
+
+    def spill():
+        handle, path = tempfile.mkstemp(suffix='.tsv')
+        with open(handle, 'w', encoding='utf-8', newline='') as output:
+            _write_entries(sorted(run), output)
+        runs.append(path)
+        run.clear()
+
+    try:
+        for entry in entries:
+            run.append(entry)
+            if len(run) >= run_size:
+                spill()
+
+        if not runs:
+            yield from sorted(run)
+            return
+
+        if run:
+            spill()
+
+        logger.debug("merging %s sorted runs", len(runs))
+        files = [open(path, encoding='utf-8', newline='') for path in runs]
+        try:
+            yield from heapq.merge(*(_read_entries(file) for file in files))
+        finally:
+            for file in files:
+                file.close()
+    finally:
+        for path in runs:
+            os.remove(path)
+
+
+def write_snapshot(
+        connection: 'tools.Connection', repo: str, destination: str,
+        path: Optional[str] = None, run_size: int = 500000) -> int:
+    """Stream the files of a repository from AQL into a snapshot file
+
+    Rows are sorted locally, rather than by AQL, so the order does not depend
+    on the collation of Artifactory's database.
+
+    Args:
+        connection (tools.Connection): connection to Artifactory
+        repo (str): repository key
+        destination (str): snapshot file, gzip compressed
+        path (str, optional): only record files below this folder. Defaults to the whole repository.
+        run_size (int, optional): entries sorted in memory at a time. Defaults to 500000.
+
+    Returns:
+        int: number of files recorded
+    """
+    query = {"repo": repo, "type": "file"}
+    if path:
+        query["$or"] = [{"path": path}, {"path": {"$match": f"{path}/*"}}]
+
+    cursor = aql.FileCursor(connection).find(query)
+    cursor = cursor.include(['repo', 'path', 'name', 'actual_sha1', 'size', 'modified'])
+
+    entries = (
+        Entry(
+            row['name'] if row['path'] == '.' else f"{row['path']}/{row['name']}",
+            row.get('actual_sha1') or '', row['size'], row['modified'])
+        for row in cursor.rows())
+
+    count = 0
+    with gzip.open(destination, 'wt', encoding='utf-8', newline='', compresslevel=6) as output:
+        writer = csv.writer(output, dialect='excel-tab', lineterminator='\n')
+        writer.writerow(COLUMNS)
+        for entry in _sorted(entries, run_size):
+            writer.writerow(entry)
+            count += 1
+
+    logger.info("snapshot of %s holds %s files", repo, count)
+
+    return count
+
+
+def read_snapshot(source: str) -> Iterator[Entry]:
+    """Entries of a snapshot file in path order"""
+    with gzip.open(source, 'rt', encoding='utf-8', newline='') as lines:
+        header = next(lines, None)
+        if header is not None and header.rstrip('\r\n').split('\t') != COLUMNS:
+            raise ValueError(f"{source} is not a snapshot file")
+
+        yield from _read_entries(lines)
+
+
+def _ordered(entries: Iterable[Entry]) -> Iterator[Entry]:
+    previous = None
+    for entry in entries:
+        if previous is not None and entry.path <= previous:
+            raise ValueError(f"Snapshot is not sorted by path at {entry.path}")
+        previous = entry.path
+        yield entry
+
+
+def diff(old: Iterable[Entry], new: Iterable[Entry]) -> Iterator[Difference]:
+    """Differences between two path sorted sequences of entries, ie read_snapshot()
+
+    A path present on both sides is changed when its sha1 or size differs.
+
+    Yields:
+        Difference: added, removed and changed paths in path order
+    """
+    old, new = _ordered(old), _ordered(new)
+    old_entry, new_entry = next(old, None), next(new, None)
+
+    while old_entry is not None or new_entry is not None:
+        if new_entry is None or (old_entry is not None and old_entry.path < new_entry.path):
+            yield Difference('removed', old_entry.path, old_entry, None)
+            old_entry = next(old, None)
+        elif old_entry is None or new_entry.path < old_entry.path:
+            yield Difference('added', new_entry.path, None, new_entry)
+            new_entry = next(new, None)
+        else:
+            if (old_entry.sha1, old_entry.size) != (new_entry.sha1, new_entry.size):
+                yield Difference('changed', new_entry.path, old_entry, new_entry)
+            old_entry, new_entry = next(old, None), next(new, None)
+
+
+def compare(old: str, new: str) -> SnapshotDiff:
+    """Totals of the differences between two snapshot files, see diff() for the details
+
+    Args:
+        old (str): earlier snapshot file
+        new (str): later snapshot file
+
+    Returns:
+        SnapshotDiff: counts and byte deltas of added, removed and changed files
+    """
+    totals = SnapshotDiff()
+
+    for difference in diff(read_snapshot(old), read_snapshot(new)):
+        if difference.kind == 'added':
+            totals.added += 1
+            totals.added_bytes += difference.new.size
+        elif difference.kind == 'removed':
+            totals.removed += 1
+            totals.removed_bytes += difference.old.size
+        else:
+            totals.changed += 1
+            totals.changed_bytes += difference.new.size - difference.old.size
+
+    return totals
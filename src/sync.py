@@ -0,0 +1,220 @@
+"""Incremental synchronisation of repository contents using AQL watermarks"""
+import json
+import logging
+import os
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from datetime import timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, TYPE_CHECKING
+
+from . import aql
+from . import memory
+from . import operation
+from . import tools
+
+if TYPE_CHECKING:
+    from . import resource
+
+
+@dataclass
+class Watermark():
+    """High-water mark stored for a single repository
+
+    mark is the newest modified/updated timestamp seen by the last sync and
+    seen holds the keys of items inside the overlap window below the mark so
+    they are not reported twice.
+    """
+    mark: Optional[str] = None
+    seen: List[str] = field(default_factory=list)
+
+
+class WatermarkStore():
+    """Persist per repository watermarks in a JSON file
+
+    When path is None watermarks only live as long as the object.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.watermarks: Dict[str, Watermark] = {}
+
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as state_file:
+                for repo, watermark in json.load(state_file).items():
+                    self.watermarks[repo] = Watermark(**watermark)
+
+    def get(self, repo: str) -> Watermark:
+        """Watermark for repo, an empty watermark if the repo was never synced"""
+        return self.watermarks.get(repo, Watermark())
+
+    def set(self, repo: str, watermark: Watermark):
+        """Store the watermark for repo and write it to disk"""
+        self.watermarks[repo] = watermark
+        self.save()
+
+    def save(self):
+        """Atomically write all watermarks to path"""
+        if not self.path:
+            return
+
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as state_file:
+            json.dump(
+                {repo: asdict(watermark) for repo, watermark in self.watermarks.items()},
+                state_file)
+
+        os.replace(temporary_path, self.path)
+        self.logger.debug("saved watermarks to %s", self.path)
+
+
+@dataclass
+class Change():
+    """A file added or updated since the previous sync"""
+    action: str
+    file: 'resource.File'
+
+
+class IncrementalSync():
+    """Stream the files of a repository changed since the previous run
+
+    Each run queries AQL for files whose modified (or updated) field is greater
+    than the stored watermark minus an overlap window. Results are sorted on the
+    watermark field and paged with keyset pagination so pages stay cheap on the
+    server no matter how deep into the changes the sync is. The watermark is
+    only advanced once the stream has been fully consumed.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(
+            self, connection: 'tools.Connection', repo: str, store: WatermarkStore,
+            timestamp_field: str = 'modified', page_size: int = 1000,
+            overlap: timedelta = timedelta(minutes=5)):
+        """Init method
+
+        Args:
+            connection (tools.Connection): connection to Artifactory
+            repo (str): repository key to synchronise
+            store (WatermarkStore): where watermarks are kept between runs
+            timestamp_field (str, optional): AQL timestamp field used as the watermark,
+                modified or updated. Defaults to 'modified'.
+            page_size (int, optional): number of results requested per AQL query.
+                Defaults to 1000.
+            overlap (timedelta, optional): window below the watermark that is
+                queried again to catch late commits. Defaults to 5 minutes.
+        """
+        self.connection = connection
+        self.repo = repo
+        self.store = store
+        self.timestamp_field = timestamp_field
+        self.page_size = page_size
+        self.overlap = overlap
+
+    def _page(self, operator: Optional[str], bound: Optional[str], skip: int) -> List['resource.File']:
+        query = {"repo": self.repo, "type": "file"}
+        if bound:
+            query[self.timestamp_field] = {operator: bound}
+
+        cursor = aql.FileCursor(self.connection).find(query)
+        cursor = cursor.sort({"$asc": [self.timestamp_field, "path", "name"]})
+        if skip:
+            cursor = cursor.offset(skip)
+        cursor = cursor.limit(self.page_size)
+
+        return list(cursor)
+
+    def _pages(self, since: Optional[str]) -> Iterator['resource.File']:
+        operator, bound, skip = '$gt', since, 0
+
+        while True:
+            page = self._page(operator, bound, skip)
+            yield from page
+
+            if len(page) < self.page_size:
+                return
+
+            last_value = getattr(page[-1], self.timestamp_field)
+            trailing = 0
+            for file in reversed(page):
+                if getattr(file, self.timestamp_field) != last_value:
+                    break
+                trailing += 1
+
+            # results sharing the last timestamp are skipped with an offset so a
+            # page entirely made of one timestamp still makes progress
+            if operator == '$gte' and last_value == bound:
+                skip += trailing
+            else:
+                skip = trailing
+
+            operator, bound = '$gte', last_value
+
+    def changes(self) -> Iterator[Change]:
+        """Files added or updated since the previous run
+
+        Yields:
+            Change: action is 'added' for files created after the previous
+                watermark and 'updated' otherwise
+        """
+        watermark = self.store.get(self.repo)
+        previous_mark = tools.parse_timestamp(watermark.mark) if watermark.mark else None
+
+        since = None
+        if previous_mark:
+            since = tools.format_timestamp(previous_mark - self.overlap)
+
+        self.logger.info("syncing repo=%s since=%s", self.repo, since)
+
+        seen = set(watermark.seen)
+        window = deque()
+        mark = previous_mark
+
+        for file in operation.counted(self._pages(since), lambda file: file.__dict__.get('size') or 0):
+            value = tools.parse_timestamp(getattr(file, self.timestamp_field))
+            key = f"{file.path}@{getattr(file, self.timestamp_field)}"
+
+            if mark is None or value > mark:
+                mark = value
+
+            window.append((value, key))
+            while window[0][0] < mark - self.overlap:
+                window.popleft()
+
+            if key in seen:
+                continue
+
+            created = getattr(file, 'created', None)
+            if previous_mark and created and tools.parse_timestamp(created) <= previous_mark:
+                yield Change('updated', file)
+            else:
+                yield Change('added', file)
+
+        if mark is not None:
+            self.store.set(
+                self.repo,
+                Watermark(tools.format_timestamp(mark), [key for _, key in window]))
+
+    def paths(self) -> Iterator[str]:
+        """Cheap listing of every file path in the repository, streamed"""
+        cursor = aql.FileCursor(self.connection).find({"repo": self.repo, "type": "file"})
+        cursor = cursor.include(['path', 'name'])
+
+        for row in cursor.rows():
+            yield '/'.join([row['path'], row['name']])
+
+    def deletions(self, known_paths: Iterable[str]) -> Iterator[str]:
+        """Reconcile deletions, which never show up in changes()
+
+        Args:
+            known_paths (Iterable[str]): paths the caller believes exist
+
+        Yields:
+            str: paths from known_paths no longer present in the repository
+        """
+        current_paths = memory.spillable_set()
+        for path in self.paths():
+            current_paths.add(path)
+
+        for path in known_paths:
+            if path not in current_paths:
+                yield path
@@ -1,9 +1,30 @@
 """Module holding various helper classes"""
-from dataclasses import dataclass
-from typing import TYPE_CHECKING
+import abc
+import codecs
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING, Union
+
+from . import operation
 
 if TYPE_CHECKING:
     import requests
+    from . import resource
+
+@dataclass
+class CachedResponse():
+    """Validators and decoded body of a storage API response"""
+    payload: Any
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
 
 @dataclass
 class Connection():
@@ -11,3 +32,438 @@ class Connection():
     session: 'requests.sessions.Session'
     base_url: str
     session_timeout: int = 15 #TODO Pass this value in to allow user configuration
+    cache_size: int = 1024
+    response_cache: 'OrderedDict[Tuple[str, Any], CachedResponse]' = field(
+        default_factory=OrderedDict, repr=False)
+    repository_resolver: Optional['resource.RepositoryResolver'] = field(
+        default=None, repr=False, compare=False)
+
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+    in_flight: 'Dict[Tuple[str, Any], Future]' = field(
+        default_factory=dict, repr=False, compare=False)
+
+    @staticmethod
+    def _key(url: str, params: Any) -> Tuple[str, Any]:
+        return (url, params if isinstance(params, (str, type(None))) else repr(params))
+
+    def _join(self, key: Tuple[str, Any]) -> Tuple[Future, bool]:
+        """Future of the in flight request for key and whether the caller has to run it"""
+        with self.lock:
+            future = self.in_flight.get(key)
+            if future:
+                return future, False
+
+            future = Future()
+            self.in_flight[key] = future
+
+            return future, True
+
+    def _lead(self, key: Tuple[str, Any], future: Future, url: str, params: Any):
+        try:
+            future.set_result(self._get_json(key, url, params))
+        except BaseException as error: # pylint: disable=broad-except
+            future.set_exception(error)
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def get_json(self, url: str, params: Any = None) -> Any:
+        """GET a JSON document, revalidating any previously seen version
+
+        When an earlier response for the same url and params carried an ETag or
+        Last-Modified header they are sent back as If-None-Match and
+        If-Modified-Since, a 304 answer then reuses the stored payload.
+
+        Concurrent calls for the same url and params share a single request and
+        its decoded result, which callers must treat as read only.
+
+        Args:
+            url (str): absolute url of the resource
+            params (Any, optional): query parameters passed to requests. Defaults to None.
+
+        Returns:
+            Any: decoded JSON body
+        """
+        key = self._key(url, params)
+        future, leader = self._join(key)
+
+        if leader:
+            self._lead(key, future, url, params)
+
+        return future.result()
+
+    async def get_json_async(self, url: str, params: Any = None) -> Any:
+        """asyncio flavour of get_json(), requests run on the loop's default executor
+        and are shared with threaded callers asking for the same document"""
+        import asyncio # pylint: disable=import-outside-toplevel
+
+        key = self._key(url, params)
+        future, leader = self._join(key)
+
+        if leader:
+            # the executor does not copy contextvars, the operation context has to follow
+            asyncio.get_running_loop().run_in_executor(
+                None, contextvars.copy_context().run, self._lead, key, future, url, params)
+
+        return await asyncio.wrap_future(future)
+
+    def _get_json(self, key: Tuple[str, Any], url: str, params: Any) -> Any:
+        with self.lock:
+            cached = self.response_cache.get(key)
+
+        headers = {}
+        if cached and cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached and cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+
+        with operation.request():
+            response = self.session.get(
+                url, params=params, headers=headers,
+                timeout=operation.timeout(self.session_timeout))
+
+        if cached and response.status_code == 304:
+            with self.lock:
+                if key in self.response_cache:
+                    self.response_cache.move_to_end(key)
+            return cached.payload
+
+        payload = response.json()
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if response.ok and (etag or last_modified):
+            with self.lock:
+                self.response_cache[key] = CachedResponse(payload, etag, last_modified)
+                self.response_cache.move_to_end(key)
+                while len(self.response_cache) > self.cache_size:
+                    self.response_cache.popitem(last=False)
+
+        return payload
+
+
+@dataclass
+class Node():
+    """Health and load of one Artifactory node of a cluster"""
+    base_url: str
+    outstanding: int = 0
+    failures: int = 0
+    ejected_until: float = 0.0
+
+
+class SessionWrapper(abc.ABC):
+    """Session like object, get, head, post, put and delete shortcuts over request()
+
+    Wrappers around a requests session, ie MultiNodeSession or
+    transport.RecordingSession, implement request() and can stand in for the
+    session of a Connection.
+    """
+
+    @abc.abstractmethod
+    def request(self, method: str, url: str, **kwargs) -> 'requests.Response':
+        """Send a request, like requests.Session.request()"""
+
+    def get(self, url: str, **kwargs) -> 'requests.Response':
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> 'requests.Response':
+        return self.request('HEAD', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> 'requests.Response':
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> 'requests.Response':
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> 'requests.Response':
+        return self.request('DELETE', url, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release resources held by the session"""
+
+
+class MultiNodeSession(SessionWrapper):
+    """Session like object spreading requests over the nodes of an Artifactory cluster
+
+    Reads, ie GET, HEAD and AQL searches, go to the healthy node with the
+    fewest outstanding requests and move on to another node when a node cannot
+    be reached or answers 502, 503 or 504. A node failing max_failures times in
+    a row is ejected for cooldown seconds. Writes and deletes always go to the
+    primary, the first node, as they are not safe to retry.
+
+    Urls are built against the primary's base url and rewritten for the node
+    serving the request, so a Connection uses it like a requests session.
+
+    Args:
+        session (requests.sessions.Session): session sending the requests
+        node_urls (List[str]): base url of every node, the first one is the primary
+        max_failures (int, optional): consecutive failures ejecting a node. Defaults to 3.
+        cooldown (float, optional): seconds an ejected node receives no reads. Defaults to 30.
+    """
+    logger = logging.getLogger(__name__)
+    retry_status = (502, 503, 504)
+
+    def __init__(
+            self, session: 'requests.sessions.Session', node_urls: List[str],
+            max_failures: int = 3, cooldown: float = 30.0):
+        if not node_urls:
+            raise ValueError("At least one node url is required")
+
+        self.session = session
+        self.nodes = [Node(url.rstrip('/')) for url in node_urls]
+        self.primary = self.nodes[0]
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.turn = 0
+
+    @property
+    def headers(self):
+        """Headers sent with every request"""
+        return self.session.headers
+
+    def close(self):
+        """Close the underlying session"""
+        self.session.close()
+
+    @staticmethod
+    def _is_read(method: str, url: str) -> bool:
+        return method in ('GET', 'HEAD') or (method == 'POST' and url.endswith('/api/search/aql'))
+
+    def _choose(self, tried: List[Node]) -> Optional[Node]:
+        """Least loaded healthy node not tried yet, ejected nodes only when no other is left"""
+        with self.lock:
+            now = time.monotonic()
+            # rotate the starting point so ties are shared out between nodes
+            self.turn = (self.turn + 1) % len(self.nodes)
+            ordered = self.nodes[self.turn:] + self.nodes[:self.turn]
+            candidates = [node for node in ordered if node not in tried]
+            healthy = [node for node in candidates if node.ejected_until <= now]
+
+            if not candidates:
+                return None
+
+            node = min(healthy or candidates, key=lambda node: node.outstanding)
+            node.outstanding += 1
+
+            return node
+
+    def _release(self, node: Node, failed: bool):
+        with self.lock:
+            node.outstanding -= 1
+
+            if not failed:
+                node.failures = 0
+                return
+
+            node.failures += 1
+            if node.failures >= self.max_failures:
+                node.ejected_until = time.monotonic() + self.cooldown
+                self.logger.warning(
+                    "ejecting %s for %s seconds after %s failures",
+                    node.base_url, self.cooldown, node.failures)
+
+    def _rewrite(self, url: str, node: Node) -> str:
+        if node is self.primary or not url.startswith(self.primary.base_url):
+            return url
+
+        return node.base_url + url[len(self.primary.base_url):]
+
+    def request(self, method: str, url: str, **kwargs) -> 'requests.Response':
+        """Send a request to the node chosen for it, see the class documentation"""
+        method = method.upper()
+
+        if not self._is_read(method, url):
+            with self.lock:
+                self.primary.outstanding += 1
+            try:
+                return self.session.request(method, url, **kwargs)
+            finally:
+                with self.lock:
+                    self.primary.outstanding -= 1
+
+        tried: List[Node] = []
+        while True:
+            node = self._choose(tried)
+            tried.append(node)
+            last = len(tried) == len(self.nodes)
+
+            try:
+                response = self.session.request(method, self._rewrite(url, node), **kwargs)
+            # requests' ConnectionError and Timeout derive from OSError
+            except OSError as error:
+                self._release(node, failed=True)
+                if last:
+                    raise
+                self.logger.info("%s %s failed on %s, retrying: %s", method, url, node.base_url, error)
+                continue
+
+            failed = response.status_code in self.retry_status
+            self._release(node, failed)
+
+            if not failed or last:
+                return response
+
+            self.logger.info(
+                "%s %s answered %s on %s, retrying", method, url, response.status_code, node.base_url)
+            # give the connection of the discarded response back to the pool
+            response.close()
+
+
+def parse_timestamp(timestamp: str) -> datetime:
+    """Convert an Artifactory ISO 8601 timestamp ie 2018-07-06T20:57:45.546Z into a datetime"""
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+
+def format_timestamp(timestamp: datetime) -> str:
+    """Convert a datetime into the ISO 8601 format understood by AQL"""
+    timestamp = timestamp.astimezone(timezone.utc)
+
+    return timestamp.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def bounded_map(
+        function: Callable[[Any], Any], items: Iterable[Any],
+        max_workers: int = 8) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+    """Run function over items on a thread pool without materialising items
+
+    At most max_workers * 2 calls are queued at any time so huge generators,
+    ie a FileCursor, are consumed at the pace of the workers. Calls run in a
+    copy of the caller's context so they see its operation.OperationContext,
+    which is checked before each item is submitted.
+
+    Yields:
+        Tuple[Any, Any, Optional[Exception]]: item, result and the exception
+            raised by function (None on success) in completion order
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+
+        def completed(return_when):
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                yield item, None if error else future.result(), error
+
+        for item in items:
+            operation.checkpoint()
+            pending[executor.submit(contextvars.copy_context().run, function, item)] = item
+            if len(pending) >= max_workers * 2:
+                yield from completed(FIRST_COMPLETED)
+
+        while pending:
+            yield from completed(FIRST_COMPLETED)
+
+
+class _JsonReader():
+    """Pull parser over a stream of JSON text chunks"""
+    decoder = json.JSONDecoder()
+
+    def __init__(self, chunks: Iterable[Union[bytes, str]]):
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.position = 0
+
+    def fill(self) -> bool:
+        """Append the next chunk to the buffer, False once the stream is exhausted"""
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+
+        if isinstance(chunk, bytes):
+            chunk = self.text_decoder.decode(chunk)
+
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+
+        return True
+
+    def peek(self) -> str:
+        """Next non whitespace character without consuming it"""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position].isspace():
+                self.position += 1
+
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def expect(self, characters: str) -> str:
+        """Consume the next character which must be one of characters"""
+        character = self.peek()
+        if character not in characters:
+            raise ValueError(f"Expected one of {characters!r} in JSON stream, got {character!r}")
+
+        self.position += 1
+
+        return character
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value"""
+        self.peek()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                pass
+            else:
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer):
+                    self.position = end
+                    return value
+
+            if not self.fill():
+                if self.buffer[self.position:].strip():
+                    value, self.position = self.decoder.raw_decode(self.buffer, self.position)
+                    return value
+                raise ValueError("Unexpected end of JSON stream")
+
+
+def iter_json_array(chunks: Iterable[Union[bytes, str]], key: str) -> Iterator[Any]:
+    """Yield the elements of the array stored under key of a JSON object one by one
+
+    Only a single element is decoded at a time so responses such as AQL results
+    or deep storage listings can be consumed without holding them in memory.
+    Members following the array are never read.
+
+    Args:
+        chunks (Iterable[Union[bytes, str]]): JSON text ie response.iter_content()
+        key (str): top level key holding the array
+
+    Yields:
+        Any: decoded array elements
+    """
+    reader = _JsonReader(chunks)
+    reader.expect('{')
+
+    if reader.peek() == '}':
+        return
+
+    while True:
+        name = reader.value()
+        reader.expect(':')
+
+        if name == key:
+            reader.expect('[')
+            if reader.peek() == ']':
+                return
+
+            while True:
+                yield reader.value()
+                if reader.expect(',]') == ']':
+                    return
+
+        reader.value()
+        if reader.expect(',}') == '}':
+            return
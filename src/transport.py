@@ -0,0 +1,175 @@
+"""Record HTTP traffic to an archive and replay it without a network
+
+A RecordingSession wraps the session of a Connection and appends every
+request, its response and how long it took to a gzip compressed JSON lines
+archive. A ReplaySession answers the same requests from the archive,
+optionally scaling the recorded latency, so concurrency, caching and paging
+settings can be tuned offline against real traffic.
+
+Only response headers are recorded, request headers such as the API key are
+not written to the archive. Conditional and Range request headers are the
+exception: they change the answer so they are part of the identity of a
+request.
+"""
+import base64
+import gzip
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from . import tools
+
+logger = logging.getLogger(__name__)
+
+# request headers changing the answer, lower case
+KEY_HEADERS = ('if-match', 'if-none-match', 'if-modified-since', 'if-unmodified-since', 'range')
+
+
+def _key(method: str, url: str, params: Any, data: Any, headers: Optional[dict] = None) -> str:
+    """Identity of a request, dict params are order independent
+
+    Headers listed in KEY_HEADERS are part of it, a conditional GET is not
+    answered with the response of the unconditional one.
+    """
+    if isinstance(params, dict):
+        params = sorted((str(name), str(value)) for name, value in params.items())
+    if isinstance(data, bytes):
+        data = data.decode('utf-8', errors='replace')
+
+    key = [method.upper(), url, params, data]
+    conditions = sorted(
+        (name.lower(), str(value)) for name, value in (headers or {}).items()
+        if name.lower() in KEY_HEADERS)
+    if conditions:
+        key.append(conditions)
+
+    return json.dumps(key)
+
+
+class RecordingSession(tools.SessionWrapper):
+    """Session like object sending requests through session and recording them to path
+
+    Responses are read in full before being returned, streamed responses
+    included, so the recorded timing covers the whole body.
+
+    Args:
+        session (requests.Session): session sending the requests
+        path (str): archive written, gzip compressed JSON lines
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, session: requests.Session, path: str):
+        self.session = session
+        self.path = path
+        self.archive = gzip.open(path, 'wt', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.records = 0
+
+    @property
+    def headers(self):
+        """Headers sent with every request"""
+        return self.session.headers
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send the request and record it along with its response"""
+        start = time.perf_counter()
+        response = self.session.request(method, url, **kwargs)
+        content = response.content
+        elapsed = time.perf_counter() - start
+
+        record = {
+            'key': _key(
+                method, url, kwargs.get('params'), kwargs.get('data'), kwargs.get('headers')),
+            'status': response.status_code,
+            # the body is stored decoded
+            'headers': {
+                name: value for name, value in response.headers.items()
+                if name.lower() not in ('content-encoding', 'transfer-encoding', 'content-length')},
+            'elapsed': round(elapsed, 6)}
+        try:
+            record['text'] = content.decode('utf-8')
+        except UnicodeDecodeError:
+            record['base64'] = base64.b64encode(content).decode('ascii')
+
+        line = json.dumps(record, separators=(',', ':'))
+        with self.lock:
+            self.archive.write(line)
+            self.archive.write('\n')
+            self.records += 1
+
+        return response
+
+    def close(self):
+        """Finish the archive and close the wrapped session"""
+        with self.lock:
+            self.archive.close()
+        self.session.close()
+        self.logger.info("recorded %s requests to %s", self.records, self.path)
+
+
+class ReplaySession(tools.SessionWrapper):
+    """Session like object answering requests from an archive of a RecordingSession
+
+    Identical requests are answered in the order they were recorded, the
+    last answer being repeated once they run out.
+
+    Args:
+        path (str): archive written by a RecordingSession
+        latency_scale (float, optional): factor applied to the recorded time of
+            each request, 0 answers immediately. Defaults to 1.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, path: str, latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self.headers: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        self.responses: Dict[str, Deque[dict]] = defaultdict(deque)
+
+        with gzip.open(path, 'rt', encoding='utf-8') as archive:
+            for line in archive:
+                record = json.loads(line)
+                self.responses[record['key']].append(record)
+
+        self.logger.info("replaying %s distinct requests from %s", len(self.responses), path)
+
+    def _next(self, key: str) -> Optional[dict]:
+        with self.lock:
+            records = self.responses.get(key)
+            if not records:
+                return None
+
+            return records.popleft() if len(records) > 1 else records[0]
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Recorded response of the request, after its scaled latency
+
+        Raises:
+            LookupError: the request was not recorded
+        """
+        record = self._next(_key(
+            method, url, kwargs.get('params'), kwargs.get('data'), kwargs.get('headers')))
+        if record is None:
+            raise LookupError(f"No recorded response for {method} {url}")
+
+        if self.latency_scale:
+            time.sleep(record['elapsed'] * self.latency_scale)
+
+        response = requests.Response()
+        response.status_code = record['status']
+        response.headers = CaseInsensitiveDict(record['headers'])
+        response.url = url
+        response.encoding = 'utf-8'
+        if 'text' in record:
+            response._content = record['text'].encode('utf-8') # pylint: disable=protected-access
+        else:
+            response._content = base64.b64decode(record['base64']) # pylint: disable=protected-access
+        response._content_consumed = True # pylint: disable=protected-access
+
+        return response
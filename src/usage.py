@@ -0,0 +1,128 @@
+"""Disk usage (du) reports of Artifactory folders built in a single streaming pass"""
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+from hurry.filesize import size as human_size
+
+from . import aql
+
+if TYPE_CHECKING:
+    from . import resource
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Usage():
+    """Aggregate size and file count of a folder and its sub folders"""
+    path: str
+    size: int = 0
+    files: int = 0
+    children: Dict[str, 'Usage'] = field(default_factory=dict)
+
+    def add(self, parts: List[str], size: int, depth: Optional[int] = None):
+        """Count a file of size bytes stored under the folders parts
+
+        Args:
+            parts (List[str]): folder names between this folder and the file
+            size (int): size of the file in bytes
+            depth (int, optional): deepest level of folders kept in the tree,
+                deeper files count toward their ancestor at that level. Defaults to None.
+        """
+        node = self
+        node.size += size
+        node.files += 1
+
+        for part in parts if depth is None else parts[:depth]:
+            child = node.children.get(part)
+            if child is None:
+                child = Usage(f"{node.path}/{part}" if node.path else part)
+                node.children[part] = child
+
+            child.size += size
+            child.files += 1
+            node = child
+
+    def walk(self, depth: Optional[int] = None) -> Iterator[Tuple[int, 'Usage']]:
+        """Depth first iteration over the tree
+
+        Yields:
+            Tuple[int, Usage]: depth relative to this folder and the folder usage
+        """
+        stack = [(0, self)]
+        while stack:
+            level, node = stack.pop()
+            yield level, node
+
+            if depth is None or level < depth:
+                stack.extend(
+                    (level + 1, child) for _, child in sorted(node.children.items(), reverse=True))
+
+    def report(self, depth: Optional[int] = None, human_readable: bool = False) -> str:
+        """du style report, one folder per line"""
+        lines = []
+        for _, node in self.walk(depth):
+            node_size = human_size(node.size) if human_readable else node.size
+            lines.append(f"{node_size}\t{node.files}\t{node.path or '.'}")
+
+        return '\n'.join(lines)
+
+
+def from_file_list(directory: 'resource.Directory', depth: Optional[int] = None) -> Usage:
+    """Build the usage tree of directory from one streamed deep listing
+
+    Args:
+        directory (resource.Directory): root of the report
+        depth (int, optional): deepest level of folders kept in the tree. Defaults to None.
+
+    Returns:
+        Usage: usage of directory, paths are relative to directory
+    """
+    usage = Usage('')
+
+    for entry in directory.iter_file_list():
+        usage.add(entry.uri.strip('/').split('/')[:-1], entry.size, depth)
+
+    return usage
+
+
+def from_aql(
+        directory: 'resource.Directory', depth: Optional[int] = None,
+        page_size: int = 100000) -> Usage:
+    """Build the usage tree of directory from paged AQL queries returning only sizes
+
+    Args:
+        directory (resource.Directory): root of the report
+        depth (int, optional): deepest level of folders kept in the tree. Defaults to None.
+        page_size (int, optional): rows requested per query. Defaults to 100000.
+
+    Returns:
+        Usage: usage of directory, paths are relative to directory
+    """
+    query = {"repo": directory.repo, "type": "file"}
+    if directory.path:
+        query["$or"] = [
+            {"path": directory.path},
+            {"path": {"$match": f"{directory.path}/*"}}]
+
+    prefix = len(directory.path) + 1 if directory.path else 0
+    usage = Usage('')
+    offset = 0
+
+    cursor = aql.FileCursor(directory.connection).find(query).include(['size'])
+    cursor = cursor.sort({"$asc": ["path", "name"]})
+
+    while True:
+        rows = 0
+        for row in cursor.page(offset, page_size).rows():
+            folder = row['path'][prefix:] if row['path'] != '.' else ''
+            usage.add(folder.split('/') if folder else [], row['size'], depth)
+            rows += 1
+
+        logger.debug("du page at offset %s returned %s rows", offset, rows)
+
+        if rows < page_size:
+            return usage
+
+        offset += page_size
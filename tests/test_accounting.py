@@ -0,0 +1,102 @@
+"""Test suites for checksum aware storage accounting"""
+import hashlib
+import json
+import random
+import string
+import unittest
+from unittest.mock import Mock
+
+import src.accounting
+import src.memory
+import src.tools
+
+
+def streamed(rows):
+    response = Mock()
+    response.iter_content.return_value = [json.dumps({'results': rows}).encode()]
+    return response
+
+
+def sha1(value):
+    return hashlib.sha1(str(value).encode()).hexdigest()
+
+
+class Accounting(unittest.TestCase):
+    def test_account(self):
+        """Shared binaries count once per repository and once in the total"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        rows = [
+            {'repo': 'docker', 'path': 'a', 'name': 'layer', 'size': 10, 'actual_sha1': sha1(1)},
+            {'repo': 'docker', 'path': 'b', 'name': 'layer', 'size': 10, 'actual_sha1': sha1(1)},
+            {'repo': 'docker', 'path': 'b', 'name': 'other', 'size': 5, 'actual_sha1': sha1(2)},
+            {'repo': 'docker-prod', 'path': 'a', 'name': 'layer', 'size': 10, 'actual_sha1': sha1(1)}]
+
+        session = Mock()
+        session.post.return_value = streamed(rows)
+        connection = src.tools.Connection(session, base_url)
+
+        ### Act
+        report = src.accounting.account(connection, ['docker', 'docker-prod'])
+
+        ### Assert
+        self.assertEqual(report.repositories['docker'].logical_bytes, 25)
+        self.assertEqual(report.repositories['docker'].physical_bytes, 15)
+        self.assertEqual(report.repositories['docker-prod'].physical_bytes, 10)
+        self.assertEqual((report.total.logical_bytes, report.total.physical_bytes), (35, 15))
+
+    def test_sketch_estimate(self):
+        """The sketch estimates distinct checksums within a few percent"""
+        ### Arrange
+        sketch = src.accounting.ChecksumSketch(1024)
+
+        ### Act
+        for value in range(50000):
+            sketch.add(sha1(value % 20000), 100)
+
+        ### Assert
+        self.assertAlmostEqual(sketch.distinct / 20000, 1, delta=0.1)
+        self.assertAlmostEqual(sketch.bytes / 2000000, 1, delta=0.1)
+        self.assertEqual(len(sketch.sample), 1024)
+
+    def test_freed_bytes(self):
+        """Only binaries whose every reference is deleted free space"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        session = Mock()
+        session.post.return_value = streamed([
+            {'actual_sha1': sha1(1)}, {'actual_sha1': sha1(1)}, {'actual_sha1': sha1(2)}])
+        connection = src.tools.Connection(session, base_url)
+
+        candidates = [
+            {'actual_sha1': sha1(1), 'size': 10},
+            {'actual_sha1': sha1(2), 'size': 5}]
+
+        ### Act
+        freed = src.accounting.freed_bytes(connection, candidates)
+
+        ### Assert
+        self.assertEqual(freed, 5)
+
+    def test_freed_bytes_inside_budget(self):
+        """Candidate counts spill inside a budget and every chunk is looked up"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        session = Mock()
+        session.post.side_effect = lambda *args, **kwargs: streamed(
+            [{'actual_sha1': sha1(value)} for value in range(30)] + [{'actual_sha1': sha1(0)}])
+        connection = src.tools.Connection(session, base_url)
+
+        candidates = [{'actual_sha1': sha1(value), 'size': 10} for value in range(30)]
+
+        ### Act
+        with src.memory.MemoryBudget(1000) as budget:
+            freed = src.accounting.freed_bytes(connection, candidates, chunk_size=4, max_workers=3)
+
+        ### Assert
+        self.assertEqual(freed, 290)
+        self.assertEqual(session.post.call_count, 8)
+        self.assertGreater(budget.spills, 0)
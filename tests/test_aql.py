@@ -1,4 +1,6 @@
 """Test suites for Artifactory module"""
+import datetime
+import json
 import random
 import string
 import unittest
@@ -66,7 +68,8 @@ class Cursor(unittest.TestCase):
         self.assertEqual(len(files), 2)
         session.post.assert_called_once_with(
             f'{base_url}/api/search/aql',
-            data='items.find({"repo": "docker-repository", "name": {"$eq": "manifest.json"}, "stat.downloaded": {"$before": "4y"}})')
+            data='items.find({"repo": "docker-repository", "name": {"$eq": "manifest.json"}, "stat.downloaded": {"$before": "4y"}})',
+            timeout=None)
         session.post.return_value.json.assert_called_once()
         for file in files:
             with self.subTest(file=file):
@@ -128,8 +131,230 @@ class Cursor(unittest.TestCase):
         self.assertEqual(len(files), 2)
         session.post.assert_called_once_with(
             f'{base_url}/api/search/aql',
-            data='items.find({"repo": "docker-dev-local", "name": {"$eq": "manifest.json"}, "stat.downloaded": {"$before": "4y"}}).include("repo", "path", "name")')
+            data='items.find({"repo": "docker-dev-local", "name": {"$eq": "manifest.json"}, "stat.downloaded": {"$before": "4y"}}).include("repo", "path", "name")',
+            timeout=None)
         session.post.return_value.json.assert_called_once()
         for file in files:
             with self.subTest(file=file):
                 self.assertIsInstance(file, src.resource.File)
+
+
+class PartitionedCursor(unittest.TestCase):
+    def test_partitioned_by_path(self):
+        """One query is run per top level folder and the results are merged"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        def post(url, data, stream, **kwargs):
+            response = Mock()
+            if '"path": "."}' in data and '$ne' not in data:
+                name = 'root'
+            elif '$ne' in data:
+                name = 'c*d'
+            else:
+                name = data.split('"$match": "')[1].split('/')[0]
+            response.iter_content.return_value = [json.dumps({'range': {}, 'results': [
+                {'repo': 'docker', 'path': name, 'name': 'manifest.json'}]}).encode()]
+            return response
+
+        session = Mock()
+        session.post.side_effect = post
+        session.get.return_value.json.return_value = {'children': [
+            {'uri': '/alpine', 'folder': True},
+            {'uri': '/busybox', 'folder': True},
+            {'uri': '/c*d', 'folder': True},
+            {'uri': '/README', 'folder': False}]}
+        connection = src.tools.Connection(session, base_url)
+
+        cursor = src.aql.FileCursor(connection).find({"repo": "docker"})
+
+        ### Act
+        partitions = cursor.partitions_by_path()
+        files = list(cursor.partitioned(partitions, max_workers=2, ordered=True))
+
+        ### Assert
+        self.assertEqual(
+            [file.path for file in files],
+            ['root/manifest.json', 'alpine/manifest.json', 'busybox/manifest.json', 'c*d/manifest.json'])
+        self.assertEqual(session.post.call_count, 4)
+        self.assertNotIn('c*d', json.dumps(partitions))
+        self.assertIn({"path": {"$nmatch": "alpine/*"}}, partitions[-1]['$and'])
+
+    def test_partition_retries(self):
+        """A partition query failing with a server error is retried"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        failed = Mock()
+        failed.raise_for_status.side_effect = src.aql.exceptions.HTTPError(
+            '503', response=Mock(status_code=503))
+        succeeded = Mock()
+        succeeded.iter_content.side_effect = lambda chunk_size: [json.dumps({'range': {}, 'results': [
+            {'repo': 'docker', 'path': 'alpine', 'name': 'manifest.json'}]}).encode()]
+
+        session = Mock()
+        session.post.side_effect = [failed, succeeded, succeeded]
+        connection = src.tools.Connection(session, base_url)
+
+        cursor = src.aql.FileCursor(connection).find({"repo": "docker"})
+        partitions = cursor.partitions_by_created(
+            datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc),
+            datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc),
+            2)
+
+        ### Act
+        with patch('src.aql.time.sleep'):
+            files = list(cursor.partitioned(partitions, max_workers=1))
+
+        ### Assert
+        self.assertEqual(len(files), 2)
+        self.assertEqual(session.post.call_count, 3)
+        self.assertIn('"created": {"$lt": "2020-07-02T00:00:00.000Z"}', session.post.call_args_list[0][1]['data'])
+        succeeded.json.assert_not_called()
+
+    def test_partition_client_error_not_retried(self):
+        """A partition query rejected by Artifactory fails at once"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        session = Mock()
+        session.post.return_value.raise_for_status.side_effect = src.aql.exceptions.HTTPError(
+            '400', response=Mock(status_code=400))
+        connection = src.tools.Connection(session, base_url)
+
+        cursor = src.aql.FileCursor(connection).find({"repo": "docker"})
+
+        ### Act / Assert
+        with patch('src.aql.time.sleep') as sleep, self.assertRaises(src.aql.exceptions.HTTPError):
+            list(cursor.partitioned([{"path": "."}], max_workers=1))
+
+        self.assertEqual(session.post.call_count, 1)
+        sleep.assert_not_called()
+
+
+class GetFiles(unittest.TestCase):
+    def test_get_files(self):
+        """Paths are packed into chunked $or queries and missing paths reported"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        def post(url, data, stream, **kwargs):
+            response = Mock()
+            rows = [
+                {'repo': 'docker', 'path': 'alpine/3.16', 'name': 'manifest.json', 'size': 1},
+                {'repo': 'generic', 'path': '.', 'name': 'README', 'size': 2}]
+            response.iter_content.return_value = [
+                json.dumps({'results': [row for row in rows if f'"{row["name"]}"' in data]}).encode()]
+            return response
+
+        session = Mock()
+        session.post.side_effect = post
+        connection = src.tools.Connection(session, base_url)
+
+        paths = [
+            'docker/alpine/3.16/manifest.json',
+            'docker/alpine/3.16/missing.json',
+            'generic/README',
+            'generic/missing']
+
+        ### Act
+        found, missing = src.aql.get_files(connection, paths, max_query_bytes=150)
+
+        ### Assert
+        self.assertEqual(
+            sorted((file.repo, file.path) for file in found),
+            [('docker', 'alpine/3.16/manifest.json'), ('generic', './README')])
+        self.assertEqual(missing, {'docker/alpine/3.16/missing.json', 'generic/missing'})
+        self.assertEqual(session.post.call_count, 2)
+        for call in session.post.call_args_list:
+            with self.subTest(call=call):
+                self.assertLessEqual(len(call[1]['data']), len('items.find()') + 150)
+
+
+class QueryBuilder(unittest.TestCase):
+    def test_builder_compiles_in_aql_order(self):
+        """Builder calls compile into include, sort, offset, limit order without touching the caller's list"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        connection = src.tools.Connection(Mock(), base_url)
+        fields = ['size']
+
+        ### Act
+        cursor = src.aql.FileCursor(connection).find({"repo": "docker"})
+        cursor = cursor.limit(10).offset(20).sort({"$asc": ["name"]}).include(fields)
+
+        ### Assert
+        self.assertEqual(
+            cursor.query,
+            'items.find({"repo": "docker"}).include("size", "repo", "path", "name")'
+            '.sort({"$asc": ["name"]}).offset(20).limit(10)')
+        self.assertEqual(fields, ['size'])
+
+    def test_project_maps_attributes(self):
+        """Attribute names are mapped to the minimal AQL include set"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        connection = src.tools.Connection(Mock(), base_url)
+
+        ### Act
+        cursor = src.aql.FileCursor(connection).find({"repo": "docker"})
+        cursor = cursor.project('sha1', 'downloaded', 'size', 'path')
+
+        ### Assert
+        self.assertEqual(
+            cursor.include_fields,
+            ['actual_sha1', 'stat.downloaded', 'size', 'path', 'repo', 'name'])
+
+    def test_projected_attributes_need_no_request(self):
+        """Files carry the attributes they were projected for"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        session = Mock()
+        session.post.return_value.iter_content.return_value = [json.dumps({'results': [
+            {'repo': 'docker', 'path': 'app', 'name': 'a', 'actual_sha1': 'abc',
+             'modified': '2020-01-02T00:00:00.000Z',
+             'stats': [{'downloaded': '2020-01-03T00:00:00.000Z', 'downloads': 4}]},
+            {'repo': 'docker', 'path': 'app', 'name': 'b', 'actual_sha1': 'def',
+             'modified': '2020-01-02T00:00:00.000Z'}]}).encode()]
+        connection = src.tools.Connection(session, base_url)
+        cursor = src.aql.FileCursor(connection).find({"repo": "docker"})
+        cursor = cursor.project('lastModified', 'lastDownloaded', 'downloadCount', 'sha1')
+
+        ### Act
+        files = [cursor.to_file(row) for row in cursor.rows()]
+        attributes = [
+            (file.sha1, file.lastModified, file.lastDownloaded, file.downloadCount) for file in files]
+
+        ### Assert
+        self.assertEqual(attributes, [
+            ('abc', '2020-01-02T00:00:00.000Z', 1578009600000, 4),
+            ('def', '2020-01-02T00:00:00.000Z', 0, 0)])
+        session.get.assert_not_called()
+
+    def test_page_reuses_template(self):
+        """Pages share the compiled find/include/sort template"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        connection = src.tools.Connection(Mock(), base_url)
+        cursor = src.aql.FileCursor(connection).find({"repo": "docker"}).sort({"$asc": ["name"]})
+
+        ### Act
+        with patch('src.aql.json.dumps', wraps=json.dumps) as dumps:
+            pages = [cursor.page(offset, 100).query for offset in range(0, 1000, 100)]
+
+        ### Assert
+        self.assertEqual(dumps.call_count, 2)
+        self.assertEqual(pages[3], 'items.find({"repo": "docker"}).sort({"$asc": ["name"]}).offset(300).limit(100)')
+
+    def test_domain(self):
+        """Other domains are queried without the required item fields"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        connection = src.tools.Connection(Mock(), base_url)
+
+        ### Act
+        cursor = src.aql.FileCursor(connection).find({"name": "release"}, domain='builds')
+        cursor = cursor.include(['name', 'number'])
+
+        ### Assert
+        self.assertEqual(cursor.query, 'builds.find({"name": "release"}).include("name", "number")')
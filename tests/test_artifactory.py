@@ -93,6 +93,53 @@ class ArtifactsAndStorage(unittest.TestCase):
             with self.subTest(repository=repository):
                 self.assertIsInstance(repository, src.resource.Repository)
 
+    @patch('src.artifactory.requests')
+    def test_get_storage_summary(self, requests):
+        """Repository totals are parsed from the storage summary"""
+
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        api_key = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        response_json = {
+            'repositoriesSummaryList': [
+                {
+                    'repoKey': 'docker',
+                    'repoType': 'LOCAL',
+                    'foldersCount': 2,
+                    'filesCount': 3,
+                    'usedSpace': '1.5 GB',
+                    'itemsCount': 5,
+                    'packageType': 'Docker'},
+                {
+                    'repoKey': 'debian',
+                    'repoType': 'LOCAL',
+                    'foldersCount': 0,
+                    'filesCount': 1,
+                    'usedSpace': '10 bytes',
+                    'usedSpaceInBytes': 10,
+                    'itemsCount': 1,
+                    'packageType': 'Debian'},
+                {
+                    'repoKey': 'TOTAL',
+                    'foldersCount': 2,
+                    'filesCount': 4,
+                    'usedSpace': '1.5 GB',
+                    'itemsCount': 6}]}
+
+        session = requests.Session.return_value
+        session.get.return_value.json.return_value = response_json
+
+        artifactory_api = src.artifactory.ArtifactsAndStorage(base_url, api_key)
+
+        ### Act
+        summaries = artifactory_api.get_storage_summary()
+
+        ### Assert
+        self.assertEqual([summary.key for summary in summaries], ['docker', 'debian'])
+        self.assertEqual(summaries[0].used_space, int(1.5 * 1024 ** 3))
+        self.assertEqual(summaries[1].used_space, 10)
+
     @patch('src.artifactory.requests')
     def test_item(self, requests):
         ### Arrange
@@ -166,7 +213,8 @@ class ArtifactsAndStorage(unittest.TestCase):
         self.assertEqual(len(files), 2)
         session.post.assert_called_once_with(
             f'{base_url}/api/search/aql',
-            data='items.find({"repo": "docker-dev-local", "name": {"$eq": "manifest.json"}, "stat.downloaded": {"$before": "4y"}})')
+            data='items.find({"repo": "docker-dev-local", "name": {"$eq": "manifest.json"}, "stat.downloaded": {"$before": "4y"}})',
+            timeout=None)
         session.post.return_value.json.assert_called_once()
         for file in files:
             with self.subTest(file=file):
@@ -0,0 +1,141 @@
+"""Test suites for bulk operations"""
+import json
+import random
+import string
+import threading
+import unittest
+from unittest.mock import Mock
+
+import src.aql
+import src.bulk
+import src.resource
+import src.tools
+
+
+class Delete(unittest.TestCase):
+    def test_delete(self):
+        """Every file is deleted and failures are recorded in the report"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        session = Mock()
+        session.delete.return_value.ok = True
+        connection = src.tools.Connection(session, base_url)
+
+        files = [
+            src.resource.File(connection, 'generic', f'folder/{index}', size=2)
+            for index in range(20)]
+
+        ### Act
+        report = src.bulk.delete(iter(files), max_workers=4)
+
+        ### Assert
+        self.assertEqual(len(report.succeeded), 20)
+        self.assertEqual(report.failed, [])
+        self.assertEqual(report.bytes, 40)
+        self.assertEqual(session.delete.call_count, 20)
+
+
+class Properties(unittest.TestCase):
+    def test_read_properties_from_aql(self):
+        """Properties come from the AQL rows without a request per file"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        rows = [
+            {'repo': 'generic', 'path': 'a', 'name': 'one', 'properties': [
+                {'key': 'scan', 'value': 'passed'}, {'key': 'tag', 'value': 'x'},
+                {'key': 'tag', 'value': 'y'}]},
+            {'repo': 'generic', 'path': 'a', 'name': 'two'}]
+
+        session = Mock()
+        session.post.return_value.iter_content.return_value = [json.dumps({'results': rows}).encode()]
+        connection = src.tools.Connection(session, base_url)
+
+        cursor = src.aql.FileCursor(connection).find({"repo": "generic"})
+
+        ### Act
+        properties = [(file.path, props) for file, props in src.bulk.read_properties(cursor)]
+
+        ### Assert
+        self.assertEqual(properties, [
+            ('a/one', {'scan': ['passed'], 'tag': ['x', 'y']}),
+            ('a/two', {})])
+        self.assertTrue(session.post.call_args[1]['data'].endswith(
+            '.include("repo", "path", "name", "type", "size", "created", "created_by", '
+            '"modified", "modified_by", "updated", "property.*")'))
+        self.assertIsNone(cursor.include_fields)
+        session.get.assert_not_called()
+
+    def test_set_properties(self):
+        """Directories are tagged recursively and values are escaped"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        session = Mock()
+        session.put.return_value.ok = True
+        connection = src.tools.Connection(session, base_url)
+
+        items = [
+            src.resource.Directory(connection, 'generic', 'release/1.0'),
+            src.resource.File(connection, 'generic', 'loose/file.bin')]
+
+        ### Act
+        report = src.bulk.set_properties(items, {'promotion': 'qa;prod', 'scan': ['a', 'b']}, max_workers=1)
+
+        ### Assert
+        self.assertEqual(sorted(report.succeeded), ['generic/loose/file.bin', 'generic/release/1.0'])
+        params = sorted(
+            (call[1]['params']['properties'], call[1]['params']['recursive'])
+            for call in session.put.call_args_list)
+        self.assertEqual(params, [
+            (r'promotion=qa\;prod;scan=a,b', 0),
+            (r'promotion=qa\;prod;scan=a,b', 1)])
+
+
+class Transfer(unittest.TestCase):
+    def test_copy_collapses_complete_folders(self):
+        """A folder whose every file is copied is copied with one request"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        threads = set()
+
+        def get(url, **kwargs):
+            threads.add(threading.current_thread())
+            response = Mock()
+            children = {
+                f'{base_url}/api/storage/generic/complete': [
+                    {'uri': '/one', 'folder': False}, {'uri': '/two', 'folder': False}],
+                f'{base_url}/api/storage/generic/partial': [
+                    {'uri': '/one', 'folder': False}, {'uri': '/two', 'folder': False},
+                    {'uri': '/three', 'folder': False}]}[url]
+            response.iter_content.return_value = [json.dumps({'children': children}).encode()]
+            return response
+
+        session = Mock()
+        session.get.side_effect = get
+        session.post.return_value.ok = True
+        connection = src.tools.Connection(session, base_url)
+
+        files = [
+            src.resource.File(connection, 'generic', path, size=1)
+            for path in ['complete/one', 'complete/two', 'partial/one', 'partial/two']]
+
+        ### Act
+        report = src.bulk.copy(files, 'release', max_workers=1, dry_run=True)
+
+        ### Assert
+        self.assertEqual(
+            sorted(report.succeeded),
+            ['generic/complete', 'generic/partial/one', 'generic/partial/two'])
+        self.assertEqual(report.bytes, 4)
+        self.assertNotIn(threading.current_thread(), threads)
+        calls = sorted((call[0][0], call[1]['params']['to']) for call in session.post.call_args_list)
+        self.assertEqual(calls, [
+            (f'{base_url}/api/copy/generic/complete', '/release/complete'),
+            (f'{base_url}/api/copy/generic/partial/one', '/release/partial/one'),
+            (f'{base_url}/api/copy/generic/partial/two', '/release/partial/two')])
+        for call in session.post.call_args_list:
+            with self.subTest(call=call):
+                self.assertEqual(call[1]['params']['dry'], 1)
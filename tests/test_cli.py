@@ -0,0 +1,129 @@
+"""Test suites for the command line interface"""
+import contextlib
+import io
+import json
+import random
+import string
+import subprocess
+import sys
+import unittest
+from unittest.mock import Mock, patch
+
+import src.cli
+import src.tools
+
+
+def import_seconds(stderr: str) -> float:
+    """Seconds spent in the top level imports reported by -X importtime after the marker"""
+    lines = stderr.split('--imports--\n', 1)[1].splitlines()
+    total = 0
+    for line in lines:
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name[1:].startswith(' ') and cumulative.strip().isdigit():
+            total += int(cumulative)
+
+    return total / 1e6
+
+
+class Startup(unittest.TestCase):
+    script = (
+        "import json, sys\n"
+        "print('--imports--', file=sys.stderr)\n"
+        "import src.cli\n"
+        "try:\n"
+        "    src.cli.main(['--help'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "heavy = [m for m in ('requests', 'hurry.filesize', 'src.resource') if m in sys.modules]\n"
+        "print('--heavy--' + json.dumps(heavy), file=sys.stderr)\n")
+
+    def run_help(self):
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', self.script],
+            capture_output=True, text=True, check=True)
+        heavy = json.loads(process.stderr.rsplit('--heavy--', 1)[1])
+
+        return import_seconds(process.stderr), heavy
+
+    def test_help_does_not_import_heavy_modules(self):
+        """--help runs without importing requests, hurry.filesize or resource"""
+        ### Act
+        _, heavy = self.run_help()
+
+        ### Assert
+        self.assertEqual(heavy, [])
+
+    def test_help_imports_within_budget(self):
+        """The imports of --help fit in STARTUP_BUDGET, best of three runs"""
+        ### Act
+        seconds = min(self.run_help()[0] for _ in range(3))
+
+        ### Assert
+        self.assertGreater(seconds, 0)
+        self.assertLess(seconds, src.cli.STARTUP_BUDGET)
+
+
+class Commands(unittest.TestCase):
+    def setUp(self):
+        self.base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        self.session = Mock()
+        self.connection = src.tools.Connection(self.session, self.base_url)
+
+    def run_cli(self, *argv):
+        output = io.StringIO()
+        with patch('src.cli._connect', return_value=self.connection), \
+                contextlib.redirect_stdout(output), contextlib.redirect_stderr(io.StringIO()):
+            status = src.cli.main(list(argv))
+
+        return status, output.getvalue()
+
+    def test_find(self):
+        """find prints the location of every matching file"""
+        ### Arrange
+        rows = [{'repo': 'generic', 'path': 'a', 'name': 'one'}, {'repo': 'generic', 'path': 'b', 'name': 'two'}]
+        self.session.post.return_value.iter_content.return_value = [json.dumps({'results': rows}).encode()]
+
+        ### Act
+        status, output = self.run_cli('find', '--repo', 'generic', '--name', '*.jar', '--limit', '5')
+
+        ### Assert
+        self.assertEqual(status, 0)
+        self.assertEqual(output, "generic/a/one\ngeneric/b/two\n")
+        self.assertIn('"name": {"$match": "*.jar"}', self.session.post.call_args[1]['data'])
+        self.assertIn('.limit(5)', self.session.post.call_args[1]['data'])
+
+    def test_repos_with_profile_import(self):
+        """repos prints one line per repository"""
+        ### Arrange
+        self.session.get.return_value = Mock(status_code=200, ok=True, headers={})
+        self.session.get.return_value.json.return_value = [
+            {'key': 'libs', 'type': 'VIRTUAL', 'packageType': 'Maven'}]
+
+        ### Act
+        status, output = self.run_cli('--profile-import', 'repos', '--type', 'virtual')
+
+        ### Assert
+        self.assertEqual(status, 0)
+        self.assertEqual(output, "libs\tVIRTUAL\tMaven\n")
+        self.assertEqual(self.session.get.call_args[1]['params'], {'type': 'virtual'})
+
+    def test_delete_repo_requires_all(self):
+        """delete --repo alone refuses to empty the repository unless --all is given"""
+        ### Arrange
+        rows = [{'repo': 'tmp', 'path': 'a', 'name': 'one', 'size': 1}]
+        self.session.post.return_value.json.return_value = {'range': {}, 'results': rows}
+        self.session.delete.return_value.ok = True
+
+        ### Act
+        with self.assertRaises(SystemExit):
+            self.run_cli('delete', '--repo', 'tmp')
+        refused_deletes = self.session.delete.call_count
+        status, output = self.run_cli('delete', '--repo', 'tmp', '--all')
+
+        ### Assert
+        self.assertEqual(refused_deletes, 0)
+        self.assertEqual(status, 0)
+        self.assertIn('1 items', output)
+        self.session.delete.assert_called_once()
@@ -0,0 +1,116 @@
+"""Test suites for Docker repository analysis"""
+import json
+import random
+import string
+import unittest
+from unittest.mock import Mock
+
+import requests
+
+import src.docker
+import src.tools
+
+
+class Docker(unittest.TestCase):
+    def setUp(self):
+        self.base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        def manifest(*layers):
+            return {
+                'config': {'digest': f'sha256:config-{layers[-1]}', 'size': 1},
+                'layers': [{'digest': f'sha256:{layer}', 'size': 100} for layer in layers]}
+
+        self.manifests = {
+            'app/1.0': manifest('base', 'app1'),
+            'app/latest': manifest('base', 'app1'),
+            'app/2.0': manifest('base', 'app2'),
+            'tool/1.0': manifest('other')}
+        self.sha1 = {'app/1.0': 'a', 'app/latest': 'a', 'app/2.0': 'b', 'tool/1.0': 'c'}
+
+        manifest_rows = [
+            {'repo': 'docker', 'path': path, 'name': 'manifest.json', 'actual_sha1': self.sha1[path]}
+            for path in self.manifests]
+        layer_rows = [
+            {'repo': 'docker', 'path': 'app/2.0', 'name': 'sha256__app2', 'size': 100},
+            {'repo': 'docker', 'path': 'app/2.0', 'name': 'sha256__stale', 'size': 100},
+            {'repo': 'docker', 'path': 'app/broken', 'name': 'sha256__partial', 'size': 100},
+            {'repo': 'docker', 'path': 'app/_uploads', 'name': 'sha256__pushing', 'size': 100}]
+
+        def post(url, data, **kwargs):
+            rows = layer_rows if 'sha256__' in data else manifest_rows
+            response = Mock()
+            response.iter_content.return_value = [json.dumps({'results': rows}).encode()]
+            return response
+
+        def get(url, **kwargs):
+            path = url[len(f'{self.base_url}/docker/'):-len('/manifest.json')]
+            response = Mock()
+            response.json.return_value = self.manifests[path]
+            return response
+
+        self.session = Mock()
+        self.session.post.side_effect = post
+        self.session.get.side_effect = get
+        self.connection = src.tools.Connection(self.session, self.base_url)
+
+    def test_graph_unique_bytes(self):
+        """Shared layers only count for the set of tags referencing all of them"""
+        ### Act
+        graph = src.docker.build_graph(self.connection, ['docker'])
+        tags = {str(tag): tag for tag in graph.tags.values()}
+
+        ### Assert
+        self.assertEqual(self.session.get.call_count, 3)
+        self.assertEqual(graph.unique_bytes(tags['docker/app:2.0']), 101)
+        self.assertEqual(graph.unique_bytes(tags['docker/app:1.0']), 0)
+        self.assertEqual(graph.freed_bytes([tags['docker/app:1.0'], tags['docker/app:latest']]), 101)
+        self.assertEqual(graph.image_unique_bytes('docker', 'app'), 302)
+        self.assertEqual(
+            [(str(tag), size) for tag, size in graph.ranked_tags()][:2],
+            [('docker/app:2.0', 101), ('docker/tool:1.0', 101)])
+
+    def test_cache_skips_known_manifests(self):
+        """A second build with the same cache downloads nothing"""
+        ### Arrange
+        cache = src.docker.ManifestCache(self.connection)
+        src.docker.build_graph(self.connection, ['docker'], cache)
+
+        ### Act
+        graph = src.docker.build_graph(self.connection, ['docker'], cache)
+
+        ### Assert
+        self.assertEqual(len(graph.tags), 4)
+        self.assertEqual(self.session.get.call_count, 3)
+
+    def test_orphaned_layers(self):
+        """Layers unknown to their folder's manifest are orphaned, uploads are not"""
+        ### Arrange
+        graph = src.docker.build_graph(self.connection, ['docker'])
+
+        ### Act
+        orphans = sorted(file.path for file in src.docker.orphaned_layers(self.connection, graph, ['docker']))
+
+        ### Assert
+        self.assertEqual(orphans, ['app/2.0/sha256__stale', 'app/broken/sha256__partial'])
+
+    def test_unreadable_manifest_protects_its_layers(self):
+        """Layers of a tag whose manifest download failed are not orphaned"""
+        ### Arrange
+        get = self.session.get.side_effect
+
+        def failing_get(url, **kwargs):
+            if '/app/2.0/' in url:
+                response = Mock()
+                response.raise_for_status.side_effect = requests.HTTPError('503')
+                return response
+            return get(url, **kwargs)
+
+        self.session.get.side_effect = failing_get
+        graph = src.docker.build_graph(self.connection, ['docker'])
+
+        ### Act
+        orphans = sorted(file.path for file in src.docker.orphaned_layers(self.connection, graph, ['docker']))
+
+        ### Assert
+        self.assertEqual(graph.unreadable, {('docker', 'app', '2.0')})
+        self.assertEqual(orphans, ['app/broken/sha256__partial'])
@@ -0,0 +1,45 @@
+"""Test suites for the duplicate finder"""
+import hashlib
+import json
+import os
+import random
+import string
+import unittest
+from unittest.mock import Mock
+
+import src.duplicates
+import src.tools
+
+
+def sha1(value):
+    return hashlib.sha1(str(value).encode()).hexdigest()
+
+
+class Duplicates(unittest.TestCase):
+    def test_groups_ranked_by_wasted_bytes(self):
+        """Groups with the most wasted bytes come first and singletons are skipped"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        rows = [
+            {'repo': 'generic', 'path': 'a', 'name': 'small', 'size': 10, 'actual_sha1': sha1(1)},
+            {'repo': 'generic', 'path': 'b', 'name': 'small', 'size': 10, 'actual_sha1': sha1(1)},
+            {'repo': 'generic', 'path': 'c', 'name': 'small', 'size': 10, 'actual_sha1': sha1(1)},
+            {'repo': 'generic', 'path': 'a', 'name': 'large', 'size': 100, 'actual_sha1': sha1(2)},
+            {'repo': 'release', 'path': 'a', 'name': 'large', 'size': 100, 'actual_sha1': sha1(2)},
+            {'repo': 'generic', 'path': 'a', 'name': 'unique', 'size': 1000, 'actual_sha1': sha1(3)}]
+
+        session = Mock()
+        session.post.return_value.iter_content.return_value = [json.dumps({'results': rows}).encode()]
+        connection = src.tools.Connection(session, base_url)
+
+        ### Act
+        with src.duplicates.find_duplicates(connection, ['generic', 'release']) as index:
+            groups = list(index.groups())
+            path = index.path
+
+        ### Assert
+        self.assertEqual([group.wasted_bytes for group in groups], [100, 20])
+        self.assertEqual(groups[0].sha1, sha1(2))
+        self.assertEqual(groups[0].locations, [('generic', 'a/large'), ('release', 'a/large')])
+        self.assertFalse(os.path.exists(path))
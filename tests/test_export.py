@@ -0,0 +1,75 @@
+"""Test suites for exporting AQL results"""
+import csv
+import gzip
+import json
+import os
+import random
+import string
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+import src.aql
+import src.export
+import src.tools
+
+
+def streamed_response(results):
+    body = json.dumps({'results': results, 'range': {'total': len(results)}}).encode()
+
+    response = Mock()
+    response.iter_content.return_value = [body[index:index + 7] for index in range(0, len(body), 7)]
+
+    return response
+
+
+class Export(unittest.TestCase):
+    def setUp(self):
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        self.results = [
+            {'repo': 'docker', 'path': f'image/{index}', 'name': 'manifest.json', 'size': index,
+             'stats': [{'downloads': index}]}
+            for index in range(25)]
+
+        self.session = Mock()
+        self.session.post.return_value = streamed_response(self.results)
+        self.connection = src.tools.Connection(self.session, base_url)
+
+    def test_to_ndjson_gzip(self):
+        """Rows are streamed from the cursor into a compressed file"""
+        ### Arrange
+        cursor = src.aql.FileCursor(self.connection).find({"repo": "docker"})
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.ndjson.gz')
+
+            ### Act
+            count = src.export.to_ndjson(cursor, path, fields=['path', 'size'])
+
+            ### Assert
+            with gzip.open(path, 'rt', encoding='utf-8') as export:
+                rows = [json.loads(line) for line in export]
+
+        self.assertEqual(count, 25)
+        self.assertEqual(rows[3], {'path': 'image/3', 'size': 3})
+        self.assertTrue(self.session.post.call_args[1]['stream'])
+
+    def test_to_csv(self):
+        """Nested values are written as JSON and the header comes from the first row"""
+        ### Arrange
+        cursor = src.aql.FileCursor(self.connection).find({"repo": "docker"})
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.csv')
+
+            ### Act
+            count = src.export.to_csv(cursor, path)
+
+            ### Assert
+            with open(path, encoding='utf-8', newline='') as export:
+                rows = list(csv.DictReader(export))
+
+        self.assertEqual(count, 25)
+        self.assertEqual(list(rows[0]), ['repo', 'path', 'name', 'size', 'stats'])
+        self.assertEqual(json.loads(rows[2]['stats']), [{'downloads': 2}])
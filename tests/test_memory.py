@@ -0,0 +1,109 @@
+"""Test suites for memory budgets spilling to disk"""
+import json
+import random
+import string
+import unittest
+from unittest.mock import Mock
+
+import src.aql
+import src.bulk
+import src.memory
+import src.resource
+import src.tools
+
+
+class MemoryBudget(unittest.TestCase):
+    def test_spill_list_keeps_order(self):
+        """Items spilled to disk are read back before the ones in memory"""
+        ### Arrange
+        budget = src.memory.MemoryBudget(2000)
+        items = src.memory.SpillList(budget, load=str.upper)
+
+        ### Act
+        items.extend(f'item-{index:04}' for index in range(100))
+
+        ### Assert
+        self.assertEqual(list(items), [f'ITEM-{index:04}' for index in range(100)])
+        self.assertEqual(len(items), 100)
+        self.assertGreater(budget.spills, 0)
+        self.assertLessEqual(budget.used, 2000)
+
+    def test_spill_set_deduplicates_across_disk(self):
+        """Values already spilled are still found and not added twice"""
+        ### Arrange
+        budget = src.memory.MemoryBudget(1000)
+        values = src.memory.SpillSet(budget)
+
+        ### Act
+        for index in list(range(200)) + list(range(100)):
+            values.add(f'path/{index}')
+
+        ### Assert
+        self.assertEqual(len(values), 200)
+        self.assertIn('path/3', values)
+        self.assertNotIn('path/300', values)
+        self.assertEqual(sorted(values), sorted(f'path/{index}' for index in range(200)))
+        values.close()
+
+    def test_spill_dict_updates_across_disk(self):
+        """Entries spilled to disk are read back and updated without duplicates"""
+        ### Arrange
+        budget = src.memory.MemoryBudget(1000)
+        counts = src.memory.SpillDict(budget)
+
+        ### Act
+        for index in list(range(200)) + list(range(100)):
+            counts[f'path/{index}'] = counts.get(f'path/{index}', 0) + 1
+
+        ### Assert
+        self.assertEqual(len(counts), 200)
+        self.assertGreater(budget.spills, 0)
+        self.assertEqual(counts.get('path/3'), 2)
+        self.assertIsNone(counts.get('path/300'))
+        self.assertEqual(
+            sorted(counts.items()),
+            sorted((f'path/{index}', 2 if index < 100 else 1) for index in range(200)))
+        counts.close()
+
+    def test_budget_spills_largest_structure(self):
+        """A small structure pushing the budget over spills the largest one"""
+        ### Arrange
+        budget = src.memory.MemoryBudget(5000)
+        large = src.memory.SpillList(budget)
+        small = src.memory.SpillList(budget)
+        large.extend('x' * 100 for _ in range(30))
+
+        ### Act
+        small.extend('y' * 100 for _ in range(30))
+
+        ### Assert
+        self.assertGreater(large.spilled, 0)
+        self.assertEqual(len(large) + len(small), 60)
+
+    def test_structures_inside_budget(self):
+        """Collected cursors and bulk ledgers spill inside a budget, stay plain outside"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        rows = [{'repo': 'generic', 'path': 'folder', 'name': str(index), 'size': 1} for index in range(50)]
+
+        session = Mock()
+        session.post.return_value.iter_content.return_value = [json.dumps({'results': rows}).encode()]
+        session.delete.return_value.ok = True
+        connection = src.tools.Connection(session, base_url)
+        cursor = src.aql.FileCursor(connection).find({"repo": "generic"})
+
+        ### Act
+        with src.memory.MemoryBudget(4000) as budget:
+            files = cursor.collect()
+            report = src.bulk.delete(files, max_workers=2)
+        plain = cursor.collect()
+
+        ### Assert
+        self.assertIsInstance(files, src.memory.SpillList)
+        self.assertIsInstance(report.succeeded, src.memory.SpillList)
+        self.assertIsInstance(plain, list)
+        self.assertEqual([file.path for file in files], [file.path for file in plain])
+        self.assertIsInstance(files.load(rows[0]), src.resource.File)
+        self.assertEqual(len(report.succeeded), 50)
+        self.assertGreater(budget.spills, 0)
+        self.assertIn('peak RSS', str(budget))
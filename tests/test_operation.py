@@ -0,0 +1,121 @@
+"""Test suites for operation deadlines, cancellation and progress"""
+import json
+import random
+import string
+import unittest
+from itertools import islice
+from unittest.mock import Mock
+
+import src.aql
+import src.bulk
+import src.operation
+import src.resource
+import src.tools
+
+
+class OperationContext(unittest.TestCase):
+    def setUp(self):
+        self.base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        rows = [{'repo': 'generic', 'path': 'folder', 'name': str(index), 'size': 3} for index in range(20)]
+
+        self.session = Mock()
+        self.session.post.return_value.iter_content.return_value = [json.dumps({'results': rows}).encode()]
+        self.session.post.return_value.json.return_value = {'results': rows, 'range': {'total': 20}}
+        self.session.delete.return_value.ok = True
+        self.connection = src.tools.Connection(self.session, self.base_url)
+
+    def cursor(self):
+        return src.aql.FileCursor(self.connection).find({"repo": "generic"})
+
+    def test_progress_counts_outermost_operation(self):
+        """Files of a cursor consumed by a bulk delete are counted once"""
+        ### Arrange
+        reports = []
+
+        ### Act
+        with src.operation.OperationContext(total=20, on_progress=reports.append, interval=0):
+            src.bulk.delete(self.cursor(), max_workers=2)
+
+        ### Assert
+        self.assertEqual((reports[-1].items, reports[-1].bytes), (20, 60))
+        self.assertEqual(len(reports), 21)
+        self.assertEqual(reports[-1].eta, 0)
+        self.assertIn('20/20 items', str(reports[-1]))
+
+    def test_partly_consumed_cursor_does_not_count(self):
+        """A cursor left half read does not keep the progress of later operations"""
+        ### Arrange
+        reports = []
+
+        ### Act
+        with src.operation.OperationContext(on_progress=reports.append, interval=0):
+            list(islice(self.cursor(), 3))
+            src.bulk.delete(self.cursor(), max_workers=2)
+
+        ### Assert
+        self.assertEqual(reports[-1].items, 20)
+
+    def test_cancel_stops_bulk_delete(self):
+        """Cancelling from a callback stops submitting deletes"""
+        ### Arrange
+        def on_progress(progress):
+            if progress.items >= 5:
+                context.cancel()
+
+        context = src.operation.OperationContext(on_progress=on_progress, interval=0)
+
+        ### Act / Assert
+        with context, self.assertRaises(src.operation.Cancelled):
+            src.bulk.delete(self.cursor(), max_workers=1)
+
+        self.assertLess(self.session.delete.call_count, 20)
+
+    def test_deadline_stops_requests(self):
+        """No request is sent once the deadline passed"""
+        ### Act / Assert
+        with src.operation.OperationContext(timeout=0), self.assertRaises(src.operation.DeadlineExceeded):
+            list(self.cursor().rows())
+
+        self.session.post.assert_not_called()
+
+    def test_in_flight_and_timeout(self):
+        """Requests are counted while in flight and their timeout is capped by the deadline"""
+        ### Arrange
+        in_flight = []
+
+        def get(url, **kwargs):
+            in_flight.append(src.operation.current().progress().in_flight)
+            return Mock(status_code=200, ok=True, headers={}, json=Mock(return_value={}))
+
+        self.session.get.side_effect = get
+
+        ### Act
+        with src.operation.OperationContext(timeout=5):
+            self.connection.get_json(f'{self.base_url}/api/storage/generic')
+
+        ### Assert
+        self.assertEqual(in_flight, [1])
+        self.assertLessEqual(self.session.get.call_args[1]['timeout'], 5)
+
+    def test_session_calls_are_tracked(self):
+        """Deletes and property updates count as in flight with a capped timeout"""
+        ### Arrange
+        in_flight = []
+
+        def request(url, **kwargs):
+            in_flight.append(src.operation.current().progress().in_flight)
+            return Mock(ok=True)
+
+        self.session.delete.side_effect = request
+        self.session.put.side_effect = request
+        file = src.resource.File(self.connection, 'generic', 'folder/file')
+
+        ### Act
+        with src.operation.OperationContext(timeout=5):
+            file.delete()
+            file.set_properties({'scan': 'ok'})
+
+        ### Assert
+        self.assertEqual(in_flight, [1, 1])
+        self.assertLessEqual(self.session.delete.call_args[1]['timeout'], 5)
+        self.assertLessEqual(self.session.put.call_args[1]['timeout'], 5)
@@ -0,0 +1,84 @@
+"""Test suites for process pool pipelines"""
+import json
+import os
+import random
+import string
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+import requests
+
+import src.aql
+import src.pipeline
+import src.tools
+import src.transport
+
+
+def large(file, connection):
+    return file.size >= 50
+
+
+def summary(file, connection):
+    return (file.path, file.size, connection.base_url, os.getpid())
+
+
+def worker_session():
+    session = requests.Session()
+    session.headers['X-Worker'] = 'factory'
+    return session
+
+
+def worker_header(row, connection):
+    return connection.session.headers.get('X-Worker')
+
+
+class Pipeline(unittest.TestCase):
+    def test_stages_run_in_worker_processes(self):
+        """Rows are filtered and mapped by workers owning their own connection"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        rows = [
+            {'repo': 'generic', 'path': 'folder', 'name': str(index), 'size': index}
+            for index in range(100)]
+
+        session = Mock(spec=requests.Session)
+        session.headers = {'X-JFrog-Art-Api': 'key'}
+        session.post.return_value.iter_content.return_value = [json.dumps({'results': rows}).encode()]
+        connection = src.tools.Connection(session, base_url)
+
+        cursor = src.aql.FileCursor(connection).find({"repo": "generic"})
+        pipeline = src.pipeline.Pipeline(cursor, processes=2, batch_size=7, ordered=True)
+
+        ### Act
+        results = list(pipeline.map(src.pipeline.to_file).filter(large).map(summary))
+
+        ### Assert
+        self.assertEqual(
+            [(path, size) for path, size, _, _ in results],
+            [(f'folder/{index}', index) for index in range(50, 100)])
+        self.assertEqual({url for _, _, url, _ in results}, {base_url})
+        self.assertNotIn(os.getpid(), {pid for _, _, _, pid in results})
+        session.get.assert_not_called()
+
+    def test_session_factory(self):
+        """Sessions the workers cannot rebuild need a factory"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        rows = [{'repo': 'generic', 'path': 'folder', 'name': 'file', 'size': 1}]
+
+        session = Mock()
+        session.post.return_value.iter_content.return_value = [json.dumps({'results': rows}).encode()]
+        cursor = src.aql.FileCursor(src.tools.Connection(session, base_url)).find({"repo": "generic"})
+
+        ### Act
+        results = list(src.pipeline.Pipeline(
+            cursor, processes=1, session_factory=worker_session).map(worker_header))
+
+        ### Assert
+        self.assertEqual(results, ['factory'])
+        with tempfile.TemporaryDirectory() as directory:
+            recording = src.transport.RecordingSession(Mock(), os.path.join(directory, 'traffic.jsonl.gz'))
+            recorded = src.aql.FileCursor(src.tools.Connection(recording, base_url)).find({"repo": "generic"})
+            with recording, self.assertRaises(TypeError):
+                list(src.pipeline.Pipeline(recorded, processes=1).map(worker_header))
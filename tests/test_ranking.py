@@ -0,0 +1,81 @@
+"""Test suites for top-K rankings"""
+import json
+import random
+import string
+import unittest
+from unittest.mock import Mock
+
+import src.aql
+import src.ranking
+import src.tools
+
+
+class Ranking(unittest.TestCase):
+    def setUp(self):
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        self.rows = [
+            {'repo': 'generic', 'path': 'a', 'name': str(index), 'size': size,
+             'stats': [{'downloaded': downloaded}] if downloaded else []}
+            for index, (size, downloaded) in enumerate([
+                (5, '2020-01-01T00:00:00.000Z'),
+                (50, None),
+                (20, '2019-01-01T00:00:00.000Z'),
+                (1, '2021-01-01T00:00:00.000Z')])]
+
+        self.session = Mock()
+        self.session.post.return_value.iter_content.return_value = [
+            json.dumps({'results': self.rows}).encode()]
+        self.connection = src.tools.Connection(self.session, base_url)
+
+    def test_top_k_pushes_down_item_fields(self):
+        """Ranking on item fields is sorted and limited by Artifactory"""
+        ### Arrange
+        cursor = src.aql.FileCursor(self.connection).find({"repo": "generic"})
+
+        ### Act
+        src.ranking.top_k(cursor, 2, 'size')
+
+        ### Assert
+        self.assertTrue(
+            self.session.post.call_args[1]['data'].endswith('.sort({"$desc": ["size"]}).limit(2)'))
+
+    def test_bottom_k_on_stats_uses_heap(self):
+        """Ranking on stat fields streams every row and keeps the k oldest"""
+        ### Arrange
+        cursor = src.aql.FileCursor(self.connection).find({"repo": "generic"})
+        cursor = cursor.include(['repo', 'path', 'name', 'size', 'stat.downloaded'])
+
+        ### Act
+        files = src.ranking.bottom_k(cursor, 2, 'stat.downloaded')
+
+        ### Assert
+        self.assertEqual([file.size for file in files], [50, 20])
+        self.assertNotIn('.sort(', self.session.post.call_args[1]['data'])
+
+    def test_top_k_multiple_keys(self):
+        """Keys are compared in order"""
+        ### Arrange
+        cursor = src.aql.FileCursor(self.connection).find({"repo": "generic"})
+
+        ### Act
+        files = src.ranking.top_k(cursor, 3, ['stat.downloaded', 'size'])
+
+        ### Assert
+        self.assertEqual([file.size for file in files], [1, 5, 20])
+
+    def test_rankings_leave_cursor_untouched(self):
+        """top_k then bottom_k on one cursor both push down their own sort"""
+        ### Arrange
+        cursor = src.aql.FileCursor(self.connection).find({"repo": "generic"})
+
+        ### Act
+        src.ranking.top_k(cursor, 2, 'size')
+        src.ranking.bottom_k(cursor, 3, 'size')
+
+        ### Assert
+        self.assertIsNone(cursor.sort_order)
+        self.assertIsNone(cursor.row_limit)
+        queries = [call[1]['data'] for call in self.session.post.call_args_list]
+        self.assertTrue(queries[0].endswith('.sort({"$desc": ["size"]}).limit(2)'))
+        self.assertTrue(queries[1].endswith('.sort({"$asc": ["size"]}).limit(3)'))
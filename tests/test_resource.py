@@ -3,6 +3,9 @@ import random
 import string
 import unittest
 from unittest.mock import Mock
+from urllib.parse import parse_qs, urlsplit
+
+import requests
 
 import src.resource
 import src.tools
@@ -66,6 +69,75 @@ class Directory(unittest.TestCase):
         self.assertEqual(len(children), 2)
         session.get.return_value.json.assert_called_once()
 
+    def test_refresh_revalidates_context(self):
+        """refresh sends the stored ETag back and reuses the context on a 304"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        repo_key = "".join(random.choices(string.ascii_lowercase + string.digits, k=3))
+        path = "".join(random.choices(string.ascii_lowercase + string.digits, k=3))
+
+        response_json = {
+            'repo': repo_key,
+            'path': path,
+            'children': [{'uri': f'/{path}/Child.Folder', 'folder': True}],
+            'uri': f'https://{base_url}/artifactory/api/storage/{repo_key}/{path}'}
+
+        modified = Mock(status_code=200, ok=True, headers={'ETag': '"abc"'})
+        modified.json.return_value = response_json
+        not_modified = Mock(status_code=304, ok=False, headers={'ETag': '"abc"'})
+
+        session = Mock()
+        session.get.side_effect = [modified, not_modified]
+        connection = src.tools.Connection(session, base_url)
+
+        directory = src.resource.Directory(connection, repo_key, path)
+        directory.children()
+
+        ### Act
+        directory.refresh()
+
+        ### Assert
+        self.assertEqual(directory.context, response_json)
+        self.assertEqual(session.get.call_args[1]['headers'], {'If-None-Match': '"abc"'})
+        not_modified.json.assert_not_called()
+
+
+    def test_iter_file_list_streams_entries(self):
+        """deep listing entries are yielded as the files array is parsed"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        repo_key = "".join(random.choices(string.ascii_lowercase + string.digits, k=3))
+        path = "".join(random.choices(string.ascii_lowercase + string.digits, k=3))
+
+        body = (
+            '{"uri": "https://artifactory/api/storage/repo/path", "created": "2017-07-17T18:03:29.959Z", '
+            '"files": [{"uri": "/doc.txt", "size": 253207, "lastModified": "2017-07-17T18:03:29.959Z", '
+            '"folder": false, "sha1": "962c287c760e03b03c17eb920f5358d05f44dd3b"}, '
+            '{"uri": "/sub", "lastModified": "2017-07-17T18:03:29.959Z", "folder": true}]}').encode()
+
+        session = Mock()
+        session.get.return_value.iter_content.return_value = [body[:50], body[50:120], body[120:]]
+        connection = src.tools.Connection(session, base_url)
+
+        directory = src.resource.Directory(connection, repo_key, path)
+
+        ### Act
+        entries = list(directory.iter_file_list(depth=2, list_folders=True))
+
+        ### Assert
+        self.assertEqual(
+            entries,
+            [
+                src.resource.ListEntry(
+                    '/doc.txt', 253207, '2017-07-17T18:03:29.959Z', False,
+                    '962c287c760e03b03c17eb920f5358d05f44dd3b'),
+                src.resource.ListEntry('/sub', 0, '2017-07-17T18:03:29.959Z', True)])
+        self.assertEqual(
+            session.get.call_args[1]['params'],
+            'list&deep=1&depth=2&listFolders=1&mdTimestamps=0')
+        session.get.return_value.json.assert_not_called()
+
+
 class File(unittest.TestCase):
     """Test cases for the File class"""
     def test_init(self):
@@ -285,3 +357,112 @@ class File(unittest.TestCase):
         self.assertEqual(file.size, file_info_json['size'])
         self.assertEqual(file.downloadCount, file_statistics_json['downloadCount'])
         self.assertEqual(session.get.return_value.json.call_count, 2)
+
+
+    def test_refresh_keeps_repo_and_path(self):
+        """refresh updates the metadata but not the repo and path of the file"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        session = Mock()
+        session.get.return_value = Mock(status_code=200, ok=True, headers={})
+        session.get.return_value.json.return_value = {
+            'repo': 'libs-local', 'path': '/org/lib.jar', 'size': '20'}
+        connection = src.tools.Connection(session, base_url)
+
+        file = src.resource.File(connection, 'libs', 'org/lib.jar', size='10')
+
+        ### Act
+        file.refresh()
+
+        ### Assert
+        self.assertEqual((file.repo, file.path, file.size), ('libs', 'org/lib.jar', '20'))
+
+
+class RepositoryResolver(unittest.TestCase):
+    def test_virtual_file_statistics_use_member_repository(self):
+        """statistics of a file requested through a virtual repository are read
+        from the member holding it and the lookup is cached
+        """
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        configuration = {
+            f'{base_url}/api/repositories': [
+                {'key': 'libs', 'type': 'VIRTUAL'},
+                {'key': 'inner', 'type': 'VIRTUAL'},
+                {'key': 'libs-local', 'type': 'LOCAL'},
+                {'key': 'central', 'type': 'REMOTE'}],
+            f'{base_url}/api/repositories/libs': {'repositories': ['libs-local', 'inner']},
+            f'{base_url}/api/repositories/inner': {'repositories': ['central']}}
+
+        def get(url, **kwargs):
+            response = Mock()
+            response.status_code = 200
+            response.json.return_value = configuration.get(url, {'downloadCount': 3})
+            return response
+
+        session = Mock()
+        session.get.side_effect = get
+        session.head.side_effect = lambda url, **kwargs: Mock(ok='central-cache' in url)
+        connection = src.tools.Connection(session, base_url)
+        connection.repository_resolver = src.resource.RepositoryResolver(connection)
+
+        file = src.resource.File(connection, 'libs', 'org/lib.jar')
+
+        ### Act
+        download_count = file.downloadCount
+        storage_repo = file.storage_repo
+
+        ### Assert
+        self.assertEqual(download_count, 3)
+        self.assertEqual(storage_repo, 'central-cache')
+        self.assertEqual(
+            [call[0][0] for call in session.head.call_args_list],
+            [f'{base_url}/api/storage/libs-local/org/lib.jar',
+             f'{base_url}/api/storage/central-cache/org/lib.jar'])
+        self.assertEqual(
+            session.get.call_args_list[-1][0][0],
+            f'{base_url}/api/storage/central-cache/org/lib.jar')
+
+    def test_missing_files_are_not_cached(self):
+        """a path no member holds is looked up again, found paths are not"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        session = Mock()
+        session.get.return_value.json.side_effect = [
+            [{'key': 'libs', 'type': 'VIRTUAL'}, {'key': 'libs-local', 'type': 'LOCAL'}],
+            {'repositories': ['libs-local']}]
+        session.head.side_effect = [Mock(ok=False), Mock(ok=True)]
+        connection = src.tools.Connection(session, base_url)
+        resolver = src.resource.RepositoryResolver(connection)
+
+        ### Act
+        locations = [resolver.resolve('libs', 'org/lib.jar') for _ in range(3)]
+
+        ### Assert
+        self.assertEqual(locations, ['libs', 'libs-local', 'libs-local'])
+        self.assertEqual(session.head.call_count, 2)
+
+
+class Properties(unittest.TestCase):
+    def test_set_properties_encodes_query_string(self):
+        """values holding URL special characters reach Artifactory unchanged"""
+        ### Arrange
+        base_url = "http://" + "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        session = Mock()
+        session.put.return_value.ok = True
+        connection = src.tools.Connection(session, base_url)
+
+        file = src.resource.File(connection, 'generic', 'folder/file.bin')
+
+        ### Act
+        file.set_properties({'note': 'a&b c+d#e%f'}, recursive=False)
+
+        ### Assert
+        url, kwargs = session.put.call_args[0][0], session.put.call_args[1]
+        prepared = requests.Request('PUT', url, params=kwargs['params']).prepare()
+        query = parse_qs(urlsplit(prepared.url).query)
+        self.assertEqual(query, {'properties': ['note=a&b c+d#e%f'], 'recursive': ['0']})
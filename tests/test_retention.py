@@ -0,0 +1,137 @@
+"""Test suites for retention policies"""
+import json
+import random
+import string
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import Mock
+
+import src.retention
+import src.tools
+
+
+class Policy(unittest.TestCase):
+    def test_filters_compile_to_aql(self):
+        """Without keep rules every filter is evaluated by Artifactory"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        session = Mock()
+        session.post.return_value.iter_content.return_value = [json.dumps({'range': {}, 'results': [
+            {'repo': 'npm', 'path': 'pkg/1.0', 'name': 'pkg-1.0.tgz', 'size': 10}]}).encode()]
+        connection = src.tools.Connection(session, base_url)
+
+        policy = src.retention.Policy('npm', [
+            src.retention.NotDownloadedSince(180),
+            src.retention.Protect('name', '*release*')])
+
+        ### Act
+        report = policy.apply(connection, dry_run=True)
+
+        ### Assert
+        query = session.post.call_args[1]['data']
+        self.assertIn('"stat.downloaded": {"$before": "180d"}', query)
+        self.assertIn('{"name": {"$nmatch": "*release*"}}', query)
+        self.assertTrue(query.endswith('.include("repo", "path", "name", "size")'))
+        self.assertEqual(report.succeeded, ['npm/pkg/1.0/pkg-1.0.tgz'])
+        self.assertEqual(report.bytes, 10)
+        session.delete.assert_not_called()
+
+    def test_keep_latest_versions(self):
+        """The newest versions of a package are kept and filters run client side"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        def row(path, created):
+            return {
+                'repo': 'npm', 'path': path, 'name': 'file.tgz', 'size': 1,
+                'created': created, 'stats': [{'downloaded': created}]}
+
+        session = Mock()
+        session.post.return_value.iter_content.return_value = [json.dumps({'range': {}, 'results': [
+            row('pkg/3.0', '2020-03-01T00:00:00.000Z'),
+            row('pkg/2.0', '2020-02-01T00:00:00.000Z'),
+            row('pkg/1.0', '2020-01-01T00:00:00.000Z'),
+            row('other/1.0', '2020-01-01T00:00:00.000Z')]}).encode()]
+        connection = src.tools.Connection(session, base_url)
+
+        policy = src.retention.Policy('npm', [
+            src.retention.KeepLatest(1),
+            src.retention.NotDownloadedSince(30)])
+
+        ### Act
+        candidates = list(policy.candidates(connection, now=datetime(2020, 3, 15, tzinfo=timezone.utc)))
+
+        ### Assert
+        self.assertEqual([file.path for file in candidates], ['pkg/2.0/file.tgz', 'pkg/1.0/file.tgz'])
+        query = session.post.call_args[1]['data']
+        self.assertNotIn('$before', query)
+        self.assertIn('"stat.downloaded"', query)
+        self.assertNotIn('.sort(', query)
+        self.assertEqual(session.post.call_count, 2)
+        self.assertEqual(
+            json.loads(query[len('items.find('):query.index(').include')]),
+            {"$and": [{"repo": "npm"}, {"type": "file"}]})
+
+    def test_keep_latest_groups_whole_package(self):
+        """Versions of a package spread over the results are ranked together"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        def row(path, created):
+            return {'repo': 'generic', 'path': path, 'name': 'file', 'size': 1, 'created': created}
+
+        def key(file):
+            package, version = file.path.split('/')[:2]
+            return package, version
+
+        session = Mock()
+        session.post.return_value.iter_content.return_value = [json.dumps({'range': {}, 'results': [
+            row('pkg/1.1', '2020-02-01T00:00:00.000Z'),
+            row('other/1.0', '2020-01-01T00:00:00.000Z'),
+            row('pkg/1.0/sub', '2020-01-01T00:00:00.000Z'),
+            row('pkg/1.0', '2020-01-01T00:00:00.000Z')]}).encode()]
+        connection = src.tools.Connection(session, base_url)
+
+        policy = src.retention.Policy('generic', [src.retention.KeepLatest(1, key=key)])
+
+        ### Act
+        candidates = list(policy.candidates(connection))
+
+        ### Assert
+        self.assertEqual([file.path for file in candidates], ['pkg/1.0/sub/file', 'pkg/1.0/file'])
+
+    def test_keep_latest_spares_versions_uploaded_between_passes(self):
+        """A version missing from the ranking pass is never deleted"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        def row(path, created):
+            return {'repo': 'npm', 'path': path, 'name': 'file.tgz', 'size': 1, 'created': created}
+
+        ranked = [row('pkg/2.0', '2020-02-01T00:00:00.000Z'), row('pkg/1.0', '2020-01-01T00:00:00.000Z')]
+        session = Mock()
+        session.post.side_effect = [
+            Mock(iter_content=Mock(return_value=[json.dumps({'results': rows}).encode()]))
+            for rows in [ranked, [row('pkg/3.0', '2020-03-01T00:00:00.000Z'), *ranked]]]
+        connection = src.tools.Connection(session, base_url)
+
+        policy = src.retention.Policy('npm', [src.retention.KeepLatest(1)])
+
+        ### Act
+        candidates = list(policy.candidates(connection))
+
+        ### Assert
+        self.assertEqual([file.path for file in candidates], ['pkg/1.0/file.tgz'])
+        self.assertTrue(all(call[1]['stream'] for call in session.post.call_args_list))
+
+    def test_rule_is_abstract(self):
+        """Rules have to implement criteria and matches"""
+        ### Arrange
+        class Incomplete(src.retention.Rule):
+            def criteria(self) -> dict:
+                return {}
+
+        ### Act / Assert
+        with self.assertRaises(TypeError):
+            Incomplete()
@@ -0,0 +1,82 @@
+"""Test suites for repository snapshots"""
+import json
+import os
+import random
+import string
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+import src.snapshot
+import src.tools
+
+
+class Snapshot(unittest.TestCase):
+    def setUp(self):
+        self.base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, rows, run_size=2):
+        session = Mock()
+        session.post.return_value.iter_content.return_value = [json.dumps({'results': rows}).encode()]
+        connection = src.tools.Connection(session, self.base_url)
+        path = os.path.join(self.directory.name, name)
+
+        count = src.snapshot.write_snapshot(connection, 'generic', path, run_size=run_size)
+
+        return path, count
+
+    def test_write_snapshot_sorts_by_path(self):
+        """Rows are written sorted by path through spilled runs"""
+        ### Arrange
+        rows = [
+            {'repo': 'generic', 'path': 'b', 'name': 'x', 'actual_sha1': '2', 'size': 2, 'modified': 'm'},
+            {'repo': 'generic', 'path': 'a', 'name': 'tab\there', 'actual_sha1': '1', 'size': 1, 'modified': 'm'},
+            {'repo': 'generic', 'path': '.', 'name': 'root', 'actual_sha1': '3', 'size': 3, 'modified': 'm'},
+            {'repo': 'generic', 'path': 'a-b', 'name': 'y', 'actual_sha1': '4', 'size': 4, 'modified': 'm'},
+            {'repo': 'generic', 'path': 'a', 'name': 'c', 'actual_sha1': '5', 'size': 5, 'modified': 'm'}]
+
+        ### Act
+        path, count = self.write('snapshot.tsv.gz', rows)
+
+        ### Assert
+        self.assertEqual(count, 5)
+        self.assertEqual(
+            [entry.path for entry in src.snapshot.read_snapshot(path)],
+            ['a-b/y', 'a/c', 'a/tab\there', 'b/x', 'root'])
+
+    def test_compare(self):
+        """Added, removed and changed files are counted with their byte deltas"""
+        ### Arrange
+        def row(name, sha1, size):
+            return {'repo': 'generic', 'path': 'f', 'name': name, 'actual_sha1': sha1, 'size': size, 'modified': 'm'}
+
+        old, _ = self.write('old.tsv.gz', [row('kept', 'a', 1), row('gone', 'b', 10), row('grown', 'c', 5)])
+        new, _ = self.write('new.tsv.gz', [row('kept', 'a', 1), row('grown', 'd', 8), row('fresh', 'e', 7)])
+
+        ### Act
+        totals = src.snapshot.compare(old, new)
+        differences = list(src.snapshot.diff(
+            src.snapshot.read_snapshot(old), src.snapshot.read_snapshot(new)))
+
+        ### Assert
+        self.assertEqual(
+            [(difference.kind, difference.path) for difference in differences],
+            [('added', 'f/fresh'), ('removed', 'f/gone'), ('changed', 'f/grown')])
+        self.assertEqual(
+            (totals.added, totals.removed, totals.changed), (1, 1, 1))
+        self.assertEqual(
+            (totals.added_bytes, totals.removed_bytes, totals.changed_bytes, totals.net_bytes),
+            (7, 10, 3, 0))
+
+    def test_unsorted_input_is_rejected(self):
+        """diff refuses entries out of path order"""
+        ### Arrange
+        entries = [src.snapshot.Entry('b', '', 0, ''), src.snapshot.Entry('a', '', 0, '')]
+
+        ### Act / Assert
+        with self.assertRaises(ValueError):
+            list(src.snapshot.diff(entries, []))
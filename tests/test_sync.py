@@ -0,0 +1,114 @@
+"""Test suites for incremental sync"""
+import json
+import os
+import random
+import string
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+import src.sync
+import src.tools
+
+
+def aql_result(*files):
+    results = [
+        {
+            'repo': 'docker',
+            'path': 'product_name',
+            'name': name,
+            'type': 'file',
+            'size': 1576,
+            'created': created,
+            'modified': modified}
+        for name, created, modified in files]
+
+    return {
+        'range': {'start_pos': 0, 'end_pos': len(results), 'total': len(results)},
+        'results': results}
+
+
+class IncrementalSync(unittest.TestCase):
+    def test_first_run_pages_and_stores_watermark(self):
+        """All files are reported as added and the newest modified date is stored"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        session = Mock()
+        session.post.return_value.json.side_effect = [
+            aql_result(
+                ('a', '2018-07-06T20:57:45.000Z', '2018-07-06T20:57:45.000Z'),
+                ('b', '2018-07-06T20:57:46.000Z', '2018-07-06T20:57:46.000Z')),
+            aql_result(
+                ('c', '2018-07-06T20:57:47.000Z', '2018-07-06T20:57:47.000Z'))]
+        connection = src.tools.Connection(session, base_url)
+
+        store = src.sync.WatermarkStore()
+        sync = src.sync.IncrementalSync(connection, 'docker', store, timestamp_field='modified', page_size=2)
+
+        ### Act
+        changes = list(sync.changes())
+
+        ### Assert
+        self.assertEqual([change.action for change in changes], ['added'] * 3)
+        self.assertEqual(store.get('docker').mark, '2018-07-06T20:57:47.000Z')
+        second_query = session.post.call_args_list[1][1]['data']
+        self.assertIn('"modified": {"$gte": "2018-07-06T20:57:46.000Z"}', second_query)
+        self.assertIn('.offset(1).limit(2)', second_query)
+
+    def test_second_run_uses_overlap_and_skips_seen(self):
+        """Files inside the overlap window that were already reported are skipped"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'watermarks.json')
+            with open(path, 'w', encoding='utf-8') as state_file:
+                json.dump({'docker': {
+                    'mark': '2018-07-06T21:00:00.000Z',
+                    'seen': ['product_name/a@2018-07-06T21:00:00.000Z']}}, state_file)
+
+            session = Mock()
+            session.post.return_value.json.return_value = aql_result(
+                ('a', '2018-07-06T20:00:00.000Z', '2018-07-06T21:00:00.000Z'),
+                ('b', '2018-07-06T20:00:00.000Z', '2018-07-06T21:01:00.000Z'),
+                ('c', '2018-07-06T21:02:00.000Z', '2018-07-06T21:02:00.000Z'))
+            connection = src.tools.Connection(session, base_url)
+
+            store = src.sync.WatermarkStore(path)
+            sync = src.sync.IncrementalSync(connection, 'docker', store)
+
+            ### Act
+            changes = list(sync.changes())
+
+            ### Assert
+            self.assertEqual(
+                [(change.action, change.file.path) for change in changes],
+                [('updated', 'product_name/b'), ('added', 'product_name/c')])
+            self.assertIn(
+                '"modified": {"$gt": "2018-07-06T20:55:00.000Z"}',
+                session.post.call_args[1]['data'])
+            self.assertEqual(
+                src.sync.WatermarkStore(path).get('docker').mark,
+                '2018-07-06T21:02:00.000Z')
+
+    def test_deletions(self):
+        """Known paths missing from the listing are reported as deleted"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        session = Mock()
+        session.post.return_value.iter_content.return_value = [json.dumps(aql_result(
+            ('a', '2018-07-06T20:00:00.000Z', '2018-07-06T21:00:00.000Z'))).encode()]
+        connection = src.tools.Connection(session, base_url)
+
+        sync = src.sync.IncrementalSync(connection, 'docker', src.sync.WatermarkStore())
+
+        ### Act
+        deleted = list(sync.deletions(['product_name/a', 'product_name/b']))
+
+        ### Assert
+        self.assertEqual(deleted, ['product_name/b'])
+        self.assertTrue(session.post.call_args[1]['stream'])
+        self.assertTrue(session.post.call_args[1]['data'].endswith('.include("path", "name", "repo")'))
+        session.post.return_value.json.assert_not_called()
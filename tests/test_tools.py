@@ -0,0 +1,185 @@
+"""Test suites for helper classes"""
+import asyncio
+import random
+import string
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+import src.operation
+import src.tools
+
+
+class Connection(unittest.TestCase):
+    def setUp(self):
+        self.base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        self.release = threading.Event()
+
+        def get(url, **kwargs):
+            self.release.wait(timeout=5)
+            response = Mock(status_code=200, ok=True, headers={})
+            response.json.return_value = {'uri': url}
+            return response
+
+        self.session = Mock()
+        self.session.get.side_effect = get
+        self.connection = src.tools.Connection(self.session, self.base_url)
+
+    def test_get_json_single_flight_threads(self):
+        """Concurrent identical requests from threads share one GET"""
+        ### Arrange
+        url = f'{self.base_url}/api/repositories'
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.connection.get_json(url)))
+            for _ in range(10)]
+
+        ### Act
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+        ### Assert
+        self.assertEqual(self.session.get.call_count, 1)
+        self.assertEqual(results, [{'uri': url}] * 10)
+        self.assertEqual(self.connection.in_flight, {})
+
+    def test_get_json_single_flight_asyncio(self):
+        """Concurrent identical requests from coroutines share one GET"""
+        ### Arrange
+        url = f'{self.base_url}/api/storage/docker'
+
+        async def gather():
+            tasks = [self.connection.get_json_async(url) for _ in range(10)]
+            asyncio.get_running_loop().call_later(0.1, self.release.set)
+            return await asyncio.gather(*tasks)
+
+        ### Act
+        results = asyncio.run(gather())
+
+        ### Assert
+        self.assertEqual(self.session.get.call_count, 1)
+        self.assertEqual(results, [{'uri': url}] * 10)
+
+
+    def test_get_json_async_keeps_operation_context(self):
+        """The request of a coroutine runs in the caller's operation context"""
+        ### Arrange
+        url = f'{self.base_url}/api/storage/docker'
+        self.release.set()
+        contexts = []
+        get = self.session.get.side_effect
+
+        def tracked(*args, **kwargs):
+            contexts.append(src.operation.current())
+            return get(*args, **kwargs)
+
+        self.session.get.side_effect = tracked
+
+        async def fetch():
+            with src.operation.OperationContext(timeout=30) as context:
+                await self.connection.get_json_async(url)
+            return context
+
+        ### Act
+        context = asyncio.run(fetch())
+
+        ### Assert
+        self.assertEqual(contexts, [context])
+        self.assertLessEqual(self.session.get.call_args[1]['timeout'], 30)
+
+
+class MultiNodeSession(unittest.TestCase):
+    def setUp(self):
+        self.nodes = [
+            "".join(random.choices(string.ascii_lowercase + string.digits, k=10)) for _ in range(2)]
+        self.down = set()
+
+        def request(method, url, **kwargs):
+            if any(url.startswith(node) for node in self.down):
+                raise ConnectionError(url)
+            return Mock(status_code=200, url=url)
+
+        self.session = Mock()
+        self.session.request.side_effect = request
+        self.multi_node = src.tools.MultiNodeSession(self.session, self.nodes, max_failures=1)
+
+    def test_reads_are_balanced(self):
+        """Sequential reads are shared out between nodes and urls are rewritten"""
+        ### Act
+        urls = [self.multi_node.get(f'{self.nodes[0]}/api/storage/repo').url for _ in range(4)]
+        self.multi_node.post(f'{self.nodes[0]}/api/search/aql', data='items.find()')
+
+        ### Assert
+        self.assertEqual(
+            sorted(urls), sorted(f'{node}/api/storage/repo' for node in self.nodes * 2))
+        self.assertEqual(self.session.request.call_count, 5)
+
+    def test_writes_are_pinned_to_primary(self):
+        """Puts, deletes and copies always go to the primary node"""
+        ### Act
+        for _ in range(3):
+            self.multi_node.put(f'{self.nodes[0]}/api/storage/repo/file')
+            self.multi_node.delete(f'{self.nodes[0]}/repo/file')
+            self.multi_node.post(f'{self.nodes[0]}/api/copy/repo/file', params={'to': '/other'})
+
+        ### Assert
+        for call in self.session.request.call_args_list:
+            with self.subTest(call=call):
+                self.assertTrue(call[0][1].startswith(self.nodes[0]))
+
+    def test_failover_ejects_node(self):
+        """A read failing on a node is retried on another one which then serves alone"""
+        ### Arrange
+        self.down.add(self.nodes[1])
+
+        ### Act
+        urls = [self.multi_node.get(f'{self.nodes[0]}/api/storage/repo').url for _ in range(4)]
+
+        ### Assert
+        self.assertEqual(urls, [f'{self.nodes[0]}/api/storage/repo'] * 4)
+        self.assertEqual(self.session.request.call_count, 5)
+        self.assertGreater(self.multi_node.nodes[1].ejected_until, time.monotonic())
+
+    def test_failover_exhausted_raises(self):
+        """When every node fails the last error is raised"""
+        ### Arrange
+        self.down.update(self.nodes)
+
+        ### Act / Assert
+        with self.assertRaises(ConnectionError):
+            self.multi_node.get(f'{self.nodes[0]}/api/storage/repo')
+
+    def test_failover_closes_discarded_response(self):
+        """A response answering 503 is closed before the read moves to another node"""
+        ### Arrange
+        unavailable = Mock(status_code=503)
+
+        def request(method, url, **kwargs):
+            if url.startswith(self.nodes[1]):
+                return unavailable
+            return Mock(status_code=200, url=url)
+
+        self.session.request.side_effect = request
+
+        ### Act
+        urls = [self.multi_node.get(f'{self.nodes[0]}/api/storage/repo').url for _ in range(2)]
+
+        ### Assert
+        self.assertEqual(urls, [f'{self.nodes[0]}/api/storage/repo'] * 2)
+        unavailable.close.assert_called_once()
+
+    def test_context_manager_closes_session(self):
+        """MultiNodeSession shares the SessionWrapper shortcuts and closes the session on exit"""
+        ### Act
+        with self.multi_node as session:
+            session.head(f'{self.nodes[0]}/api/storage/repo')
+
+        ### Assert
+        self.assertIsInstance(self.multi_node, src.tools.SessionWrapper)
+        self.assertEqual(self.session.request.call_args[0][0], 'HEAD')
+        self.session.close.assert_called_once()
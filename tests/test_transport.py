@@ -0,0 +1,120 @@
+"""Test suites for the record and replay transport"""
+import json
+import os
+import random
+import string
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock
+
+import requests
+
+import src.aql
+import src.tools
+import src.transport
+
+
+def response(status_code, payload, headers=None):
+    answer = requests.Response()
+    answer.status_code = status_code
+    answer._content = json.dumps(payload).encode()
+    answer.headers.update(headers or {})
+    return answer
+
+
+class Transport(unittest.TestCase):
+    def setUp(self):
+        self.base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'traffic.jsonl.gz')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_record_then_replay(self):
+        """Replayed traffic returns the recorded answers without the wrapped session"""
+        ### Arrange
+        rows = [{'repo': 'generic', 'path': 'a', 'name': f'{index}'} for index in range(3)]
+        session = Mock()
+        session.request.side_effect = [
+            response(200, {'results': rows, 'range': {'total': 3}}),
+            response(200, {'downloadCount': 1}, {'ETag': 'v1'}),
+            response(200, {'downloadCount': 2}, {'ETag': 'v2'})]
+
+        with src.transport.RecordingSession(session, self.path) as recording:
+            connection = src.tools.Connection(recording, self.base_url)
+            recorded = [file.path for file in src.aql.FileCursor(connection).find({"repo": "generic"})]
+            stats = [
+                connection.get_json(f'{self.base_url}/api/storage/generic/a/0', params='stats')
+                for _ in range(2)]
+
+        ### Act
+        replay = src.transport.ReplaySession(self.path, latency_scale=0)
+        connection = src.tools.Connection(replay, self.base_url)
+        replayed = [file.path for file in src.aql.FileCursor(connection).find({"repo": "generic"})]
+        replayed_stats = [
+            connection.get_json(f'{self.base_url}/api/storage/generic/a/0', params='stats')
+            for _ in range(2)]
+
+        ### Assert
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(stats, [{'downloadCount': 1}, {'downloadCount': 2}])
+        self.assertEqual(replayed_stats, stats)
+        self.assertEqual(session.request.call_args[1]['headers'], {'If-None-Match': 'v1'})
+        session.close.assert_called_once()
+
+    def test_unknown_request_and_latency(self):
+        """Unrecorded requests fail and recorded latency is scaled"""
+        ### Arrange
+        def slow(method, url, **kwargs):
+            time.sleep(0.05)
+            return response(200, {})
+
+        session = Mock()
+        session.request.side_effect = slow
+        with src.transport.RecordingSession(session, self.path) as recording:
+            recording.get(f'{self.base_url}/api/repositories')
+
+        replay = src.transport.ReplaySession(self.path, latency_scale=2)
+
+        ### Act
+        start = time.perf_counter()
+        replay.get(f'{self.base_url}/api/repositories')
+        elapsed = time.perf_counter() - start
+
+        ### Assert
+        self.assertGreaterEqual(elapsed, 0.1)
+        with self.assertRaises(LookupError):
+            replay.get(f'{self.base_url}/api/storage')
+
+    def test_conditional_requests_are_told_apart(self):
+        """A conditional GET replays its own answer, not the one of the plain GET"""
+        ### Arrange
+        url = f'{self.base_url}/api/storage/generic/a'
+        session = Mock()
+        session.request.side_effect = [response(200, {'size': 1}, {'ETag': 'v1'}), response(304, {})]
+
+        with src.transport.RecordingSession(session, self.path) as recording:
+            recording.get(url)
+            recording.get(url, headers={'If-None-Match': 'v1'})
+
+        replay = src.transport.ReplaySession(self.path, latency_scale=0)
+
+        ### Act
+        conditional = replay.get(url, headers={'if-none-match': 'v1'})
+        plain = [replay.get(url).status_code for _ in range(2)]
+
+        ### Assert
+        self.assertEqual(conditional.status_code, 304)
+        self.assertEqual(plain, [200, 200])
+
+    def test_session_requires_request(self):
+        """Session like classes have to implement request()"""
+        ### Arrange
+        class Incomplete(src.tools.SessionWrapper):
+            pass
+
+        ### Act / Assert
+        with self.assertRaises(TypeError):
+            Incomplete()
@@ -0,0 +1,70 @@
+"""Test suites for disk usage reports"""
+import json
+import random
+import string
+import unittest
+from unittest.mock import Mock
+
+import src.resource
+import src.usage
+import src.tools
+
+
+class Usage(unittest.TestCase):
+    def test_du_from_file_list(self):
+        """Sizes are aggregated at every depth from a single deep listing"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        body = json.dumps({'uri': 'x', 'files': [
+            {'uri': '/a/b/one.bin', 'size': 1, 'folder': False},
+            {'uri': '/a/two.bin', 'size': 2, 'folder': False},
+            {'uri': '/c/d/e/three.bin', 'size': 4, 'folder': False},
+            {'uri': '/root.bin', 'size': 8, 'folder': False}]}).encode()
+
+        session = Mock()
+        session.get.return_value.iter_content.return_value = [body]
+        connection = src.tools.Connection(session, base_url)
+
+        directory = src.resource.Directory(connection, 'generic', 'base')
+
+        ### Act
+        usage = directory.du(depth=2)
+
+        ### Assert
+        self.assertEqual((usage.size, usage.files), (15, 4))
+        self.assertEqual(
+            [(node.path, node.size, node.files) for _, node in usage.walk()],
+            [('', 15, 4), ('a', 3, 2), ('a/b', 1, 1), ('c', 4, 1), ('c/d', 4, 1)])
+        session.get.assert_called_once()
+
+    def test_du_from_aql(self):
+        """AQL rows are paged and folders are made relative to the directory"""
+        ### Arrange
+        base_url = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+
+        def page(*rows):
+            response = Mock()
+            response.iter_content.return_value = [json.dumps({'results': [
+                {'repo': 'generic', 'path': path, 'name': 'file', 'size': size}
+                for path, size in rows]}).encode()]
+            return response
+
+        session = Mock()
+        session.post.side_effect = [
+            page(('base', 1), ('base/a', 2)),
+            page(('base/a/b', 4))]
+        connection = src.tools.Connection(session, base_url)
+
+        directory = src.resource.Directory(connection, 'generic', 'base')
+
+        ### Act
+        usage = src.usage.from_aql(directory, page_size=2)
+
+        ### Assert
+        self.assertEqual(usage.size, 7)
+        self.assertEqual(usage.children['a'].size, 6)
+        self.assertEqual(usage.children['a'].children['b'].files, 1)
+        self.assertEqual(session.post.call_count, 2)
+        self.assertIn('.include("size", "repo", "path", "name")', session.post.call_args[1]['data'])
+        self.assertTrue(session.post.call_args[1]['data'].endswith('.offset(2).limit(2)'))